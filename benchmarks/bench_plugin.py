@@ -0,0 +1,299 @@
+"""
+Benchmarks of the overhead that nvcc4jupyter adds on top of the CUDA toolchain.
+
+The CUDA compiler and profilers are replaced by the stub executables in the
+"stubs" directory, whose latency is configurable, so the benchmarks run on
+machines without a GPU or CUDA toolkit and measure only the plugin itself.
+
+Run the benchmarks and compare them against the stored baseline with:
+
+    python -m benchmarks.bench_plugin
+
+and store new baseline results (e.g. after an intended change) with:
+
+    python -m benchmarks.bench_plugin --save-baseline
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List
+
+from IPython.core.interactiveshell import InteractiveShell
+
+from nvcc4jupyter.plugin import NVCCPlugin
+
+BENCHMARKS_DIRPATH = os.path.dirname(os.path.abspath(__file__))
+STUBS_DIRPATH = os.path.join(BENCHMARKS_DIRPATH, "stubs")
+BASELINE_FPATH = os.path.join(BENCHMARKS_DIRPATH, "baseline.json")
+
+SAMPLE_CODE = '#include <cstdio>\nint main() { printf("Hello World!\\n"); }\n'
+
+LOAD_SCRIPT = """
+import time
+from IPython.core.interactiveshell import InteractiveShell
+shell = InteractiveShell.instance()
+start = time.perf_counter()
+import nvcc4jupyter
+nvcc4jupyter.load_ipython_extension(shell)
+print(time.perf_counter() - start)
+"""
+
+
+@dataclass
+class Benchmark:
+    """A benchmark and how to interpret its result."""
+
+    name: str
+    unit: str
+    higher_is_better: bool
+    func: Callable[[NVCCPlugin, int], float]
+
+
+@contextlib.contextmanager
+def stub_environment(
+    nvcc_latency: float = 0.0, profiler_latency: float = 0.0
+) -> Iterator[None]:
+    """
+    Put the stub toolchain first on PATH and configure its latency. Also
+    disables the platform setup and uses a temporary cache directory.
+
+    Args:
+        nvcc_latency: Seconds the stub compiler waits before compiling.
+        profiler_latency: Seconds the stub profilers wait before running.
+    """
+    old_environ = dict(os.environ)
+    cache_dirpath = tempfile.mkdtemp()
+    os.environ.update({
+        "PATH": STUBS_DIRPATH + os.pathsep + os.environ["PATH"],
+        "NVCC4JUPYTER_STUB_NVCC_LATENCY": str(nvcc_latency),
+        "NVCC4JUPYTER_STUB_PROFILER_LATENCY": str(profiler_latency),
+        "NVCC4JUPYTER_NO_SETUP": "1",
+        "NVCC4JUPYTER_CACHE_DIR": cache_dirpath,
+    })
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(old_environ)
+        shutil.rmtree(cache_dirpath, ignore_errors=True)
+
+
+def median_time(func: Callable[[], object], repeats: int) -> float:
+    """Median wall time of a function over a number of calls."""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def bench_extension_load(_: NVCCPlugin, repeats: int) -> float:
+    """Seconds to import nvcc4jupyter and load it into a fresh shell."""
+    durations = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, "-c", LOAD_SCRIPT])
+        durations.append(
+            float(output.decode().strip().rsplit("\n", maxsplit=1)[-1])
+        )
+    return statistics.median(durations)
+
+
+def bench_cell_overhead(plugin: NVCCPlugin, repeats: int) -> float:
+    """Seconds to run a "%%cuda" cell with an instant compiler."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return median_time(lambda: plugin.cuda("", SAMPLE_CODE), repeats)
+
+
+def bench_memo_hit(plugin: NVCCPlugin, repeats: int) -> float:
+    """Seconds to run a group whose result is replayed by --memoize."""
+    plugin.cuda_group_save("-g bench_memo -n main.cu", SAMPLE_CODE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        plugin.cuda_group_run("-g bench_memo --memoize")
+        return median_time(
+            lambda: plugin.cuda_group_run("-g bench_memo --memoize"), repeats
+        )
+
+
+def bench_parallel_build_scaling(plugin: NVCCPlugin, repeats: int) -> float:
+    """
+    Speedup of compiling 8 groups with 4 threads over compiling them one by
+    one, with a compiler that takes 0.1 seconds.
+    """
+    group_names = [f"bench_parallel_{index}" for index in range(8)]
+    for group_name in group_names:
+        plugin._save_source(  # pylint: disable=protected-access
+            "main.cu", SAMPLE_CODE, group_name
+        )
+
+    # the groups are identical, so the compile cache must be bypassed
+    compile_group = functools.partial(
+        plugin._compile, use_cache=False  # pylint: disable=protected-access
+    )
+
+    def build(workers: int) -> None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(compile_group, group_names))
+
+    os.environ["NVCC4JUPYTER_STUB_NVCC_LATENCY"] = "0.1"
+    try:
+        serial = median_time(lambda: build(1), max(1, repeats // 2))
+        parallel = median_time(lambda: build(4), max(1, repeats // 2))
+    finally:
+        os.environ["NVCC4JUPYTER_STUB_NVCC_LATENCY"] = "0"
+    return serial / parallel
+
+
+def bench_output_throughput(plugin: NVCCPlugin, repeats: int) -> float:
+    """Megabytes per second of program output shown by a "%%cuda" cell."""
+    lines = 500_000
+    nbytes = lines * len("Hello World!\n")
+    os.environ["NVCC4JUPYTER_STUB_OUTPUT_LINES"] = str(lines)
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                duration = median_time(
+                    lambda: plugin.cuda("", SAMPLE_CODE), repeats
+                )
+    finally:
+        del os.environ["NVCC4JUPYTER_STUB_OUTPUT_LINES"]
+    return nbytes / duration / 1e6
+
+
+def bench_profile_overhead(plugin: NVCCPlugin, repeats: int) -> float:
+    """
+    Seconds to run a "%%cuda --profile" cell with instant profilers, taking
+    the mean of Nsight Compute and Nsight Systems.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return statistics.mean(
+            median_time(
+                functools.partial(
+                    plugin.cuda,
+                    f"--profile --profiler {profiler}",
+                    SAMPLE_CODE,
+                ),
+                repeats,
+            )
+            for profiler in ("ncu", "nsys")
+        )
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark("extension_load", "s", False, bench_extension_load),
+    Benchmark("cell_overhead", "s", False, bench_cell_overhead),
+    Benchmark("memo_hit", "s", False, bench_memo_hit),
+    Benchmark(
+        "parallel_build_scaling", "x", True, bench_parallel_build_scaling
+    ),
+    Benchmark("output_throughput", "MB/s", True, bench_output_throughput),
+    Benchmark("profile_overhead", "s", False, bench_profile_overhead),
+]
+
+
+def run_benchmarks(repeats: int = 5) -> Dict[str, float]:
+    """
+    Run all benchmarks against the stub toolchain.
+
+    Args:
+        repeats: How many times each measurement is repeated.
+
+    Returns:
+        A dictionary from benchmark names to results.
+    """
+    results: Dict[str, float] = {}
+    with stub_environment():
+        with contextlib.redirect_stdout(io.StringIO()):
+            plugin = NVCCPlugin(InteractiveShell.instance())
+            # an untimed cell, so that the first measurement does not pay
+            # for lazy imports and the creation of the cache directories
+            plugin.cuda("", SAMPLE_CODE)
+        try:
+            for benchmark in BENCHMARKS:
+                results[benchmark.name] = benchmark.func(plugin, repeats)
+        finally:
+            shutil.rmtree(plugin.workdir, ignore_errors=True)
+    return results
+
+
+def find_regressions(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    tolerance: float = 2.0,
+) -> List[str]:
+    """
+    Compare results against a baseline.
+
+    Args:
+        results: The results of run_benchmarks().
+        baseline: Earlier results to compare against.
+        tolerance: How many times worse than the baseline a result may be
+            before it counts as a regression. Defaults to 2.0.
+
+    Returns:
+        A description of every regression.
+    """
+    regressions = []
+    for benchmark in BENCHMARKS:
+        if benchmark.name not in baseline or benchmark.name not in results:
+            continue
+        result = results[benchmark.name]
+        expected = baseline[benchmark.name]
+        if benchmark.higher_is_better:
+            regressed = result * tolerance < expected
+        else:
+            regressed = result > expected * tolerance
+        if regressed:
+            regressions.append(
+                f"{benchmark.name}: {result:.4g}{benchmark.unit} vs baseline"
+                f" {expected:.4g}{benchmark.unit}"
+            )
+    return regressions
+
+
+def main() -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0]
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats)
+    for benchmark in BENCHMARKS:
+        print(
+            f"{benchmark.name:<25}"
+            f" {results[benchmark.name]:>10.4g} {benchmark.unit}"
+        )
+
+    if args.save_baseline:
+        with open(BASELINE_FPATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+        print(f'Saved the baseline to "{BASELINE_FPATH}".')
+        return 0
+
+    with open(BASELINE_FPATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@
 nvcc4jupyter: CUDA C++ plugin for Jupyter Notebook
 """
 
+from .backends import Backend  # noqa: F401
+from .devices import DevicePolicy  # noqa: F401
 from .parsers import Profiler, set_defaults  # noqa: F401
 from .plugin import NVCCPlugin, load_ipython_extension  # noqa: F401
 
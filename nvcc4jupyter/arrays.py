@@ -0,0 +1,435 @@
+"""
+Pass NumPy arrays between the notebook and compiled CUDA programs through
+memory mapped files in shared memory (/dev/shm), avoiding any serialization.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+ARRAYS_HEADER_FNAME = "nvcc4jupyter_arrays.h"
+ARRAY_ENV_PREFIX = "NVCC4JUPYTER_ARRAY_"
+SHM_DIRPATH = "/dev/shm"
+
+# maps numpy dtype names to the C/C++ types used in the generated header
+DTYPE_TO_CTYPE: Dict[str, str] = {
+    "bool": "bool",
+    "int8": "int8_t",
+    "int16": "int16_t",
+    "int32": "int32_t",
+    "int64": "int64_t",
+    "uint8": "uint8_t",
+    "uint16": "uint16_t",
+    "uint32": "uint32_t",
+    "uint64": "uint64_t",
+    "float16": "__half",
+    "float32": "float",
+    "float64": "double",
+}
+
+_IDENTIFIER_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OUTPUT_SPEC_REGEX = re.compile(r"^(\w+)\[([0-9,\s]*)\]$")
+
+_HEADER_PRELUDE = """\
+// Generated by nvcc4jupyter, do not edit.
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <unistd.h>
+{extra_includes}
+static inline void *nvcc4jupyter_map_array(
+    const char *env_name, size_t nbytes, bool writable)
+{{
+    const char *path = getenv(env_name);
+    if (path == NULL) {{
+        fprintf(stderr, "nvcc4jupyter: %s is not set\\n", env_name);
+        exit(1);
+    }}
+    if (nbytes == 0) {{
+        return NULL;
+    }}
+    int fd = open(path, writable ? O_RDWR : O_RDONLY);
+    if (fd < 0) {{
+        perror(path);
+        exit(1);
+    }}
+    int prot = writable ? PROT_READ | PROT_WRITE : PROT_READ;
+    void *ptr = mmap(NULL, nbytes, prot, MAP_SHARED, fd, 0);
+    close(fd);
+    if (ptr == MAP_FAILED) {{
+        perror(path);
+        exit(1);
+    }}
+    return ptr;
+}}
+"""
+
+_HEADER_ARRAY = """
+// {dtype} array "{name}" of shape {shape}
+namespace arrays {{
+namespace {name} {{
+typedef {ctype} value_type;
+const size_t ndim = {ndim};
+const size_t shape[] = {{{shape_items}}};
+const size_t size = {size};
+inline {const}value_type *data()
+{{
+    static {const}value_type *ptr = static_cast<{const}value_type *>(
+        nvcc4jupyter_map_array(
+            "{env_name}", size * sizeof(value_type), {writable}));
+    return ptr;
+}}
+}}  // namespace {name}
+}}  // namespace arrays
+"""
+
+
+def _import_numpy() -> Any:
+    """Import numpy, which is only needed when arrays are bound to a cell."""
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError(
+            'The "numpy" package is required to pass arrays with the --in and'
+            ' --out options. Install it with "pip install numpy".'
+        ) from e
+    return numpy
+
+
+def _check_identifier(name: str) -> None:
+    if _IDENTIFIER_REGEX.match(name) is None:
+        raise ValueError(
+            f'Array name "{name}" must be a valid C++ identifier.'
+        )
+
+
+def parse_input_binding(binding: str) -> Tuple[str, str]:
+    """
+    Parse an input binding of the form "NAME=VARIABLE" or "NAME".
+
+    Args:
+        binding: The value given to the --in option.
+
+    Raises:
+        ValueError: If the array name is not a valid C++ identifier.
+
+    Returns:
+        The array name used in the CUDA program and the name of the notebook
+        variable that holds the array. If the binding has no "=" sign, both
+        names are the same.
+    """
+    name, _, variable = binding.partition("=")
+    name, variable = name.strip(), variable.strip()
+    _check_identifier(name)
+    return name, variable or name
+
+
+def parse_output_binding(
+    binding: str,
+) -> Tuple[str, Optional[str], Optional[Tuple[int, ...]]]:
+    """
+    Parse an output binding of the form "NAME" or "NAME=DTYPE[SHAPE]", for
+    example "y=float32[1024,3]". An output without a type and shape must
+    name an input array whose contents are read back after the run.
+
+    Args:
+        binding: The value given to the --out option.
+
+    Raises:
+        ValueError: If the binding is malformed or the data type is not
+            supported.
+
+    Returns:
+        The array name and, if given, its data type and shape.
+    """
+    name, sep, spec = binding.partition("=")
+    name, spec = name.strip(), spec.strip()
+    _check_identifier(name)
+    if not sep:
+        return name, None, None
+
+    match = _OUTPUT_SPEC_REGEX.match(spec)
+    if match is None:
+        raise ValueError(
+            f'Output "{binding}" must have the form "NAME=DTYPE[SHAPE]", for'
+            ' example "y=float32[1024,3]".'
+        )
+    dtype, shape_str = match.groups()
+    if dtype not in DTYPE_TO_CTYPE:
+        raise ValueError(
+            f'Unsupported data type "{dtype}" for output "{name}". Choose one'
+            f' of: {", ".join(DTYPE_TO_CTYPE)}.'
+        )
+    shape = tuple(int(dim) for dim in shape_str.split(",") if dim.strip())
+    return name, dtype, shape
+
+
+def shm_dirpath() -> str:
+    """
+    Directory where array files are created. Uses /dev/shm when available so
+    the files live in memory, and the system temporary directory otherwise.
+    """
+    if os.path.isdir(SHM_DIRPATH) and os.access(SHM_DIRPATH, os.W_OK):
+        return SHM_DIRPATH
+    return tempfile.gettempdir()
+
+
+@dataclass
+class ArraySpec:
+    """Description of an array shared with the CUDA program."""
+
+    name: str
+    dtype: str
+    shape: Tuple[int, ...]
+    fpath: str
+
+    @property
+    def size(self) -> int:
+        """Number of elements in the array."""
+        size = 1
+        for dim in self.shape:
+            size *= dim
+        return size
+
+    @property
+    def env_name(self) -> str:
+        """Environment variable through which the program finds the file."""
+        return ARRAY_ENV_PREFIX + self.name
+
+
+class SharedArrays:
+    """
+    A set of arrays that are made available to a single run of a CUDA
+    program. Every array is backed by a file in shared memory that both the
+    notebook and the program map into their address spaces.
+    """
+
+    def __init__(self) -> None:
+        self.dirpath = tempfile.mkdtemp(
+            prefix="nvcc4jupyter-", dir=shm_dirpath()
+        )
+        self.specs: Dict[str, ArraySpec] = {}
+        self.outputs: Dict[str, str] = {}
+        self.header_fpath: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def add_input(self, name: str, array: Any) -> None:
+        """
+        Make an array available to the program. Arrays that already are
+        contiguous memory maps of a whole file are shared without copying,
+        anything else is copied once into shared memory.
+
+        Args:
+            name: The name under which the program accesses the array.
+            array: The array (or anything convertible to a NumPy array).
+
+        Raises:
+            ValueError: If the name is taken or the data type is not
+                supported.
+        """
+        np = _import_numpy()
+        _check_identifier(name)
+        if name in self.specs:
+            raise ValueError(f'Array "{name}" is bound more than once.')
+
+        if (
+            isinstance(array, np.memmap)
+            and array.filename is not None
+            and array.offset == 0
+            and array.flags["C_CONTIGUOUS"]
+            and os.path.getsize(array.filename) == array.nbytes
+        ):
+            array.flush()
+            self._add_spec(name, array.dtype.name, array.shape, array.filename)
+            return
+
+        array = np.ascontiguousarray(array)
+        spec = self._add_spec(
+            name,
+            array.dtype.name,
+            array.shape,
+            os.path.join(self.dirpath, f"{name}.bin"),
+        )
+        with open(spec.fpath, "wb") as f:
+            array.tofile(f)
+
+    def add_output(
+        self,
+        name: str,
+        dtype: Optional[str] = None,
+        shape: Optional[Tuple[int, ...]] = None,
+        variable: Optional[str] = None,
+    ) -> None:
+        """
+        Register an array that is read back into the notebook after the run.
+
+        Args:
+            name: The name under which the program accesses the array.
+            dtype: The data type of a new zero initialized array. If None, the
+                name must refer to an input array. Defaults to None.
+            shape: The shape of the new array. Defaults to None.
+            variable: The notebook variable the array is assigned to. Defaults
+                to the array name.
+
+        Raises:
+            ValueError: If the output does not refer to an input and has no
+                data type and shape.
+        """
+        _check_identifier(name)
+        if dtype is None or shape is None:
+            if name not in self.specs:
+                raise ValueError(
+                    f'Output "{name}" is not an input array, so its data type'
+                    ' and shape must be given as "NAME=DTYPE[SHAPE]".'
+                )
+        else:
+            if name in self.specs:
+                raise ValueError(f'Array "{name}" is bound more than once.')
+            spec = self._add_spec(
+                name, dtype, shape, os.path.join(self.dirpath, f"{name}.bin")
+            )
+            self._allocate(spec)
+        self.outputs[name] = variable or name
+
+    def _add_spec(
+        self, name: str, dtype: str, shape: Tuple[int, ...], fpath: str
+    ) -> ArraySpec:
+        if dtype not in DTYPE_TO_CTYPE:
+            raise ValueError(
+                f'Unsupported data type "{dtype}" for array "{name}".'
+            )
+        spec = ArraySpec(name, dtype, tuple(shape), fpath)
+        self.specs[name] = spec
+        return spec
+
+    def _allocate(self, spec: ArraySpec) -> None:
+        itemsize = _import_numpy().dtype(spec.dtype).itemsize
+        with open(spec.fpath, "wb") as f:
+            f.truncate(spec.size * itemsize)
+
+    def header(self) -> str:
+        """
+        Generate the C++ header that maps the arrays into the program. Array
+        "x" is accessed through "arrays::x::data()", its element count through
+        "arrays::x::size" and its dimensions through "arrays::x::shape".
+        Only outputs are mapped writable, the data of other inputs is const,
+        so that the program cannot change arrays shared without copying.
+        """
+        extra_includes = ""
+        if any(spec.dtype == "float16" for spec in self.specs.values()):
+            extra_includes = "#include <cuda_fp16.h>\n"
+        parts = [_HEADER_PRELUDE.format(extra_includes=extra_includes)]
+        for spec in self.specs.values():
+            writable = spec.name in self.outputs
+            parts.append(
+                _HEADER_ARRAY.format(
+                    name=spec.name,
+                    dtype=spec.dtype,
+                    ctype=DTYPE_TO_CTYPE[spec.dtype],
+                    shape=spec.shape,
+                    ndim=len(spec.shape),
+                    shape_items=", ".join(str(d) for d in spec.shape) or "1",
+                    size=spec.size,
+                    env_name=spec.env_name,
+                    const="" if writable else "const ",
+                    writable="true" if writable else "false",
+                )
+            )
+        return "".join(parts)
+
+    def write_header(self, dirpath: str) -> str:
+        """
+        Write the generated header to a directory.
+
+        Args:
+            dirpath: The directory, usually that of the compiled group.
+
+        Returns:
+            The file path of the header.
+        """
+        header_fpath = os.path.join(dirpath, ARRAYS_HEADER_FNAME)
+        with open(header_fpath, "w", encoding="utf-8") as f:
+            f.write(self.header())
+        self.header_fpath = header_fpath
+        return header_fpath
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables that point the program to the array files."""
+        return {spec.env_name: spec.fpath for spec in self.specs.values()}
+
+    def collect(self) -> Dict[str, Any]:
+        """
+        Map the output arrays into the notebook. The returned arrays share
+        memory with the files written by the program, so no data is copied.
+
+        Returns:
+            A dictionary from notebook variable names to arrays.
+        """
+        np = _import_numpy()
+        results: Dict[str, Any] = {}
+        for name, variable in self.outputs.items():
+            spec = self.specs[name]
+            if spec.size == 0:
+                results[variable] = np.zeros(spec.shape, dtype=spec.dtype)
+            else:
+                results[variable] = np.memmap(
+                    spec.fpath, dtype=spec.dtype, mode="r+", shape=spec.shape
+                )
+        return results
+
+    def cleanup(self) -> None:
+        """
+        Remove the array files and the header created for this run. Arrays
+        returned by collect() stay valid because their memory maps outlive
+        the files.
+        """
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+        if self.header_fpath is not None and os.path.exists(self.header_fpath):
+            os.remove(self.header_fpath)
+        self.header_fpath = None
+
+
+def bind_arrays(
+    user_ns: Dict[str, Any], inputs: List[str], outputs: List[str]
+) -> SharedArrays:
+    """
+    Create the shared arrays described by the --in and --out options.
+
+    Args:
+        user_ns: The notebook namespace where input variables are looked up.
+        inputs: Input bindings of the form "NAME=VARIABLE".
+        outputs: Output bindings of the form "NAME" or "NAME=DTYPE[SHAPE]".
+
+    Raises:
+        ValueError: If a binding is malformed or an input variable is not
+            defined.
+
+    Returns:
+        The shared arrays, ready to be passed to the program.
+    """
+    arrays = SharedArrays()
+    try:
+        for binding in inputs:
+            name, variable = parse_input_binding(binding)
+            if variable not in user_ns:
+                raise ValueError(
+                    f'Variable "{variable}" is not defined in the notebook.'
+                )
+            arrays.add_input(name, user_ns[variable])
+        for binding in outputs:
+            name, dtype, shape = parse_output_binding(binding)
+            arrays.add_output(name, dtype, shape)
+    except Exception:
+        arrays.cleanup()
+        raise
+    return arrays
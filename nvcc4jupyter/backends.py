@@ -0,0 +1,457 @@
+"""
+Compiler backends that turn the source files of a group into an artifact,
+and a per-backend cache of those artifacts.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from .build import hash_headers
+from .path_utils import evict_least_recently_used, which
+from .toolkits import Toolkit, nvcc_command
+
+DEFAULT_COMPILE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+NVRTC_SEARCH_PATTERNS: List[str] = [
+    "/usr/local/cuda*/lib64/libnvrtc.so*",
+    "/usr/local/cuda*/targets/*/lib/libnvrtc.so*",
+    "/usr/lib/x86_64-linux-gnu/libnvrtc.so*",
+]
+
+
+class Backend(Enum):
+    """Choice between the compilers that can build CUDA C++ code."""
+
+    NVCC = "nvcc"
+    NVRTC = "nvrtc"
+    CLANG = "clang"
+
+
+@dataclass
+class CompileArtifact:
+    """The outcome of a successful compilation."""
+
+    path: str
+    backend: Backend
+    diagnostics: str = ""
+    cached: bool = False
+    runnable: bool = True
+    # the version of the CUDA toolkit the artifact was compiled with
+    toolkit: Optional[str] = None
+
+
+class CompilerBackend:
+    """
+    Base class of the compiler backends. A backend compiles source files to
+    a single artifact and reports compiler errors by raising
+    subprocess.CalledProcessError with the diagnostics as output, so all
+    backends fail the same way as the "nvcc" command line.
+    """
+
+    backend: Backend
+    # whether the artifact is an executable that can be run
+    runnable: bool = True
+    # the extension of the artifact file, replacing that of the executable
+    artifact_ext: Optional[str] = None
+
+    def __init__(self, toolkit: Optional[Toolkit] = None) -> None:
+        """
+        Args:
+            toolkit: The CUDA toolkit to compile with, or None to use the one
+                found through the PATH environment variable. Defaults to None.
+        """
+        self.toolkit = toolkit
+
+    def executable(self) -> Optional[str]:
+        """The file path of the compiler, or None if it is not installed."""
+        raise NotImplementedError
+
+    def fingerprint(self) -> str:
+        """
+        Identify the installed compiler, so that cached artifacts are not
+        reused after the compiler changed.
+        """
+        fpath = self.executable()
+        if fpath is None:
+            return ""
+        stat = os.stat(fpath)
+        fingerprint = f"{fpath}:{stat.st_size}:{stat.st_mtime_ns}"
+        if self.toolkit is not None:
+            fingerprint += ";" + self.toolkit.fingerprint()
+        return fingerprint
+
+    def compile(  # pylint: disable=too-many-arguments
+        self,
+        source_fpaths: List[str],
+        include_dirpaths: List[str],
+        output_fpath: str,
+        compiler_args: str = "",
+        link_args: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Compile source files to an artifact.
+
+        Args:
+            source_fpaths: The .cu files to compile.
+            include_dirpaths: The directories whose headers can be included.
+            output_fpath: The file path of the artifact.
+            compiler_args: The optional compiler arguments. Defaults to an
+                empty string.
+            link_args: Extra arguments of the link step, such as libraries.
+                Defaults to None.
+
+        Raises:
+            subprocess.CalledProcessError: If the compilation failed.
+
+        Returns:
+            The diagnostics (e.g. warnings) printed by the compiler.
+        """
+        raise NotImplementedError
+
+
+class NvccBackend(CompilerBackend):
+    """Compiles with the "nvcc" command line, the default."""
+
+    backend = Backend.NVCC
+
+    def executable(self) -> Optional[str]:
+        if self.toolkit is not None:
+            return self.toolkit.nvcc
+        return which("nvcc")
+
+    def compile(  # pylint: disable=too-many-arguments
+        self,
+        source_fpaths: List[str],
+        include_dirpaths: List[str],
+        output_fpath: str,
+        compiler_args: str = "",
+        link_args: Optional[List[str]] = None,
+    ) -> str:
+        args = [nvcc_command(self.toolkit)]
+        args.extend(compiler_args.split())
+        args.append("-I" + ",".join(include_dirpaths))
+        args.extend(source_fpaths)
+        args.extend(link_args or [])
+        args.extend(["-o", output_fpath, "-Wno-deprecated-gpu-targets"])
+        return subprocess.check_output(args, stderr=subprocess.STDOUT).decode(
+            "utf8"
+        )
+
+
+class ClangBackend(CompilerBackend):
+    """
+    Compiles with clang's CUDA support. The CUDA installation of the selected
+    toolkit or of "nvcc" is used if it can be found, otherwise "--cuda-path"
+    can be given as a compiler argument.
+    """
+
+    backend = Backend.CLANG
+
+    def executable(self) -> Optional[str]:
+        return which("clang++")
+
+    def compile(  # pylint: disable=too-many-arguments
+        self,
+        source_fpaths: List[str],
+        include_dirpaths: List[str],
+        output_fpath: str,
+        compiler_args: str = "",
+        link_args: Optional[List[str]] = None,
+    ) -> str:
+        args = ["clang++", "-x", "cuda"]
+        nvcc_fpath = NvccBackend(self.toolkit).executable()
+        if nvcc_fpath is not None:
+            cuda_dirpath = os.path.dirname(os.path.dirname(nvcc_fpath))
+            args.append(f"--cuda-path={cuda_dirpath}")
+            args.append("-L" + os.path.join(cuda_dirpath, "lib64"))
+        args.extend(compiler_args.split())
+        args.extend("-I" + dirpath for dirpath in include_dirpaths)
+        args.extend(source_fpaths)
+        args.extend(["-x", "none"])
+        args.extend(link_args or [])
+        args.extend(["-o", output_fpath, "-lcudart", "-ldl", "-lrt"])
+        args.append("-pthread")
+        return subprocess.check_output(args, stderr=subprocess.STDOUT).decode(
+            "utf8"
+        )
+
+
+class NvrtcBackend(CompilerBackend):
+    """
+    Compiles the device code of a single source file to PTX with the NVRTC
+    runtime compilation library, which is much faster than "nvcc" but cannot
+    compile host code, so the artifact can not be run.
+    """
+
+    backend = Backend.NVRTC
+    runnable = False
+    artifact_ext = ".ptx"
+
+    def __init__(self, toolkit: Optional[Toolkit] = None) -> None:
+        super().__init__(toolkit)
+        self._library: Any = None
+        self._library_fpath: Optional[str] = None
+
+    def executable(self) -> Optional[str]:
+        # ctypes is slow to import and only needed by this backend
+        import ctypes.util  # pylint: disable=import-outside-toplevel
+
+        if self._library_fpath is None:
+            fpaths = []
+            patterns = NVRTC_SEARCH_PATTERNS
+            if self.toolkit is not None:
+                patterns = [
+                    os.path.join(self.toolkit.root, "lib64", "libnvrtc.so*"),
+                    os.path.join(
+                        self.toolkit.root,
+                        "targets",
+                        "*",
+                        "lib",
+                        "libnvrtc.so*",
+                    ),
+                ]
+            else:
+                name = ctypes.util.find_library("nvrtc")
+                if name is not None:
+                    fpaths.append(name)
+            for pattern in patterns:
+                fpaths.extend(sorted(glob.glob(pattern)))
+            for fpath in fpaths:
+                try:
+                    self._library = ctypes.CDLL(fpath)
+                except OSError:
+                    continue
+                self._library_fpath = fpath
+                break
+        return self._library_fpath
+
+    def fingerprint(self) -> str:
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        if self.executable() is None:
+            return ""
+        major, minor = ctypes.c_int(), ctypes.c_int()
+        self._call("nvrtcVersion", ctypes.byref(major), ctypes.byref(minor))
+        return f"nvrtc:{major.value}.{minor.value}"
+
+    def _call(self, function: str, *args) -> int:
+        if self.executable() is None:
+            raise RuntimeError(
+                "Could not find the NVRTC library. Consider adding the lib64"
+                " directory of the CUDA toolkit to the LD_LIBRARY_PATH"
+                " environment variable."
+            )
+        return getattr(self._library, function)(*args)
+
+    def _error(self, result: int) -> str:
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        assert self._library is not None
+        self._library.nvrtcGetErrorString.restype = ctypes.c_char_p
+        return self._library.nvrtcGetErrorString(result).decode()
+
+    def compile(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        source_fpaths: List[str],
+        include_dirpaths: List[str],
+        output_fpath: str,
+        compiler_args: str = "",
+        link_args: Optional[List[str]] = None,
+    ) -> str:
+        import ctypes  # pylint: disable=import-outside-toplevel
+
+        if len(source_fpaths) != 1 or link_args:
+            raise RuntimeError(
+                "The nvrtc backend compiles exactly one source file and can"
+                " not link libraries."
+            )
+        with open(source_fpaths[0], "rb") as f:
+            source = f.read()
+
+        program = ctypes.c_void_p()
+        result = self._call(
+            "nvrtcCreateProgram",
+            ctypes.byref(program),
+            source,
+            os.path.basename(source_fpaths[0]).encode(),
+            0,
+            None,
+            None,
+        )
+        if result != 0:
+            raise RuntimeError(
+                f"Could not create the NVRTC program: {self._error(result)}"
+            )
+        try:
+            options = compiler_args.split()
+            options.extend("-I" + dirpath for dirpath in include_dirpaths)
+            c_options = (ctypes.c_char_p * len(options))(
+                *[option.encode() for option in options]
+            )
+            result = self._call(
+                "nvrtcCompileProgram", program, len(options), c_options
+            )
+
+            size = ctypes.c_size_t()
+            self._call("nvrtcGetProgramLogSize", program, ctypes.byref(size))
+            log = ctypes.create_string_buffer(size.value)
+            self._call("nvrtcGetProgramLog", program, log)
+            diagnostics = log.value.decode("utf8")
+            if result != 0:
+                raise subprocess.CalledProcessError(
+                    result,
+                    ["nvrtc"] + options + source_fpaths,
+                    output=diagnostics.encode(),
+                )
+
+            self._call("nvrtcGetPTXSize", program, ctypes.byref(size))
+            ptx = ctypes.create_string_buffer(size.value)
+            self._call("nvrtcGetPTX", program, ptx)
+        finally:
+            self._call("nvrtcDestroyProgram", ctypes.byref(program))
+
+        with open(output_fpath, "wb") as f:
+            f.write(ptx.value)
+        return diagnostics
+
+
+BACKENDS: Dict[Backend, CompilerBackend] = {
+    Backend.NVCC: NvccBackend(),
+    Backend.NVRTC: NvrtcBackend(),
+    Backend.CLANG: ClangBackend(),
+}
+
+
+_toolkit_backends: Dict[Tuple[Backend, Toolkit], CompilerBackend] = {}
+
+
+def get_backend(
+    backend: Backend, toolkit: Optional[Toolkit] = None
+) -> CompilerBackend:
+    """
+    Get the compiler backend that implements a backend choice.
+
+    Args:
+        backend: The backend choice.
+        toolkit: The CUDA toolkit to compile with, or None to use the one
+            found through the PATH environment variable. Defaults to None.
+    """
+    if toolkit is None:
+        return BACKENDS[backend]
+    # backends are reused because NVRTC loads its library only once
+    key = (backend, toolkit)
+    if key not in _toolkit_backends:
+        _toolkit_backends[key] = type(BACKENDS[backend])(toolkit)
+    return _toolkit_backends[key]
+
+
+def compile_key(  # pylint: disable=too-many-arguments
+    backend: CompilerBackend,
+    source_fpaths: List[str],
+    include_dirpaths: List[str],
+    compiler_args: str = "",
+    link_args: Optional[List[str]] = None,
+) -> str:
+    """
+    Compute the cache key of a compilation. The key depends on the contents
+    of the files but not on their directories, so identical code compiled
+    from different group directories shares the cached artifact.
+
+    Args:
+        backend: The compiler backend.
+        source_fpaths: The .cu files to compile.
+        include_dirpaths: The directories whose headers can be included.
+        compiler_args: The optional compiler arguments. Defaults to an empty
+            string.
+        link_args: Extra arguments of the link step. Libraries contribute
+            their contents, other arguments are used as they are. Defaults to
+            None.
+
+    Returns:
+        A hexadecimal digest that identifies the artifact.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(
+        json.dumps(
+            [backend.backend.value, backend.fingerprint(), compiler_args]
+        ).encode()
+    )
+    for fpath in source_fpaths:
+        hasher.update(os.path.basename(fpath).encode() + b"\0")
+        with open(fpath, "rb") as f:
+            hasher.update(f.read())
+    hasher.update(hash_headers(include_dirpaths).encode())
+    for arg in link_args or []:
+        if arg.startswith("-I"):
+            # the headers are already part of the key
+            continue
+        if os.path.isfile(arg) and not arg.endswith(".so"):
+            with open(arg, "rb") as f:
+                hasher.update(f.read())
+        else:
+            # shared libraries are found at run time by their path
+            hasher.update(arg.encode() + b"\0")
+    return hasher.hexdigest()
+
+
+class CompileCache:
+    """
+    A bounded cache of compiled artifacts keyed by compile_key(). When the
+    total size of the artifacts exceeds the limit, the least recently used
+    ones are evicted.
+    """
+
+    def __init__(
+        self, dirpath: str, max_bytes: int = DEFAULT_COMPILE_CACHE_MAX_BYTES
+    ) -> None:
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+
+    def _entry_fpath(self, key: str) -> str:
+        return os.path.join(self.dirpath, f"{key}.bin")
+
+    def get(self, key: str, output_fpath: str) -> bool:
+        """
+        Copy a cached artifact to a file path.
+
+        Args:
+            key: The cache key.
+            output_fpath: Where the artifact is copied to.
+
+        Returns:
+            True if the artifact was cached, False otherwise.
+        """
+        fpath = self._entry_fpath(key)
+        try:
+            shutil.copyfile(fpath, output_fpath)
+            shutil.copymode(fpath, output_fpath)
+        except OSError:
+            return False
+        # mark the entry as recently used
+        os.utime(fpath)
+        return True
+
+    def put(self, key: str, output_fpath: str) -> None:
+        """
+        Cache an artifact and evict old ones if the cache is over its limit.
+
+        Args:
+            key: The cache key.
+            output_fpath: The file path of the artifact.
+        """
+        os.makedirs(self.dirpath, exist_ok=True)
+        fd, tmp_fpath = tempfile.mkstemp(dir=self.dirpath, suffix=".tmp")
+        os.close(fd)
+        # the modification time of an entry tracks when it was last used
+        shutil.copyfile(output_fpath, tmp_fpath)
+        shutil.copymode(output_fpath, tmp_fpath)
+        os.replace(tmp_fpath, self._entry_fpath(key))
+        evict_least_recently_used(self.dirpath, self.max_bytes, ".bin")
@@ -0,0 +1,469 @@
+"""
+Dependencies between source file groups. A group can depend on other groups,
+which are then built once into libraries and linked into its executable.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Any, Dict, List, Optional, Set
+
+from .path_utils import evict_least_recently_used
+from .toolkits import Toolkit, nvcc_command, toolkit_fingerprint
+
+GROUP_METADATA_FNAME = "group.json"
+BUILD_DIRNAME = ".build"
+LIBRARY_TYPES = ("static", "shared")
+
+# libraries linked into a program built with device link-time optimization
+# hold relocatable device code in the LTO intermediate representation
+LTO_COMPILER_ARGS = "-rdc=true -dlto"
+# the total size of the cached LTO objects, beyond which the least recently
+# used ones are evicted
+DEFAULT_LTO_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def read_group_metadata(group_dirpath: str) -> Dict[str, Any]:
+    """
+    Read the metadata of a group.
+
+    Args:
+        group_dirpath: The directory of the group.
+
+    Returns:
+        A dictionary with the "depends" list of group names and the "library"
+        type the group is built as when other groups depend on it.
+    """
+    metadata: Dict[str, Any] = {"depends": [], "library": "static"}
+    fpath = os.path.join(group_dirpath, GROUP_METADATA_FNAME)
+    if os.path.exists(fpath):
+        with open(fpath, "r", encoding="utf-8") as f:
+            metadata.update(json.load(f))
+    return metadata
+
+
+def write_group_metadata(group_dirpath: str, metadata: Dict[str, Any]) -> None:
+    """
+    Write the metadata of a group, see "read_group_metadata".
+
+    Args:
+        group_dirpath: The directory of the group.
+        metadata: The metadata to write.
+    """
+    os.makedirs(group_dirpath, exist_ok=True)
+    fpath = os.path.join(group_dirpath, GROUP_METADATA_FNAME)
+    # replace the file instead of writing to it, since it may be a hard link
+    # to a snapshot blob
+    fd, tmp_fpath = tempfile.mkstemp(dir=group_dirpath, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+    os.chmod(tmp_fpath, 0o644)
+    os.replace(tmp_fpath, fpath)
+
+
+def dependency_graph(workdir: str, group_name: str) -> Dict[str, List[str]]:
+    """
+    Collect all groups a group depends on, directly or indirectly.
+
+    Args:
+        workdir: The directory that holds the group directories.
+        group_name: The name of the group.
+
+    Raises:
+        RuntimeError: If a dependency does not exist or if the dependencies
+            form a cycle.
+
+    Returns:
+        A dictionary from the name of every group in the graph (including the
+        given one) to the names of the groups it directly depends on.
+    """
+    graph: Dict[str, List[str]] = {}
+    visiting: List[str] = []
+
+    def visit(name: str) -> None:
+        if name in visiting:
+            cycle = visiting[visiting.index(name) :] + [name]
+            raise RuntimeError(
+                f'Groups form a dependency cycle: {" -> ".join(cycle)}.'
+            )
+        if name in graph:
+            return
+        visiting.append(name)
+        metadata = read_group_metadata(os.path.join(workdir, name))
+        for dependency in metadata["depends"]:
+            if not os.path.exists(os.path.join(workdir, dependency)):
+                raise RuntimeError(
+                    f'Group "{name}" depends on group "{dependency}" which'
+                    " does not exist."
+                )
+            visit(dependency)
+        visiting.pop()
+        graph[name] = list(metadata["depends"])
+
+    visit(group_name)
+    return graph
+
+
+def topological_order(
+    graph: Dict[str, List[str]], root: Optional[str] = None
+) -> List[str]:
+    """
+    Order the groups of a graph so that every group comes after the groups it
+    depends on.
+
+    Args:
+        graph: A graph returned by "dependency_graph".
+        root: If not None, only this group and the groups it depends on are
+            ordered. Defaults to None.
+
+    Returns:
+        The group names in dependency order.
+    """
+    order: List[str] = []
+    done: Set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in done:
+            return
+        done.add(name)
+        for dependency in graph[name]:
+            visit(dependency)
+        order.append(name)
+
+    for name in graph if root is None else [root]:
+        visit(name)
+    return order
+
+
+def hash_headers(include_dirpaths: List[str]) -> str:
+    """
+    Hash the names and contents of the headers in some directories.
+
+    Args:
+        include_dirpaths: The directories whose headers can be included.
+
+    Returns:
+        A hexadecimal digest that does not depend on the directory paths.
+    """
+    hasher = hashlib.sha256()
+    for dirpath in include_dirpaths:
+        for fpath in sorted(glob.glob(os.path.join(dirpath, "*.h"))):
+            hasher.update(os.path.basename(fpath).encode() + b"\0")
+            with open(fpath, "rb") as f:
+                hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def _compile_lto_object(  # pylint: disable=too-many-arguments
+    source_fpath: str,
+    include_dirpaths: List[str],
+    cache_dirpath: str,
+    compiler_args: str,
+    headers_digest: str,
+    toolkit: Optional[Toolkit],
+) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(toolkit_fingerprint(toolkit).encode() + b"\0")
+    hasher.update(compiler_args.encode() + b"\0")
+    hasher.update(headers_digest.encode() + b"\0")
+    hasher.update(os.path.basename(source_fpath).encode() + b"\0")
+    with open(source_fpath, "rb") as f:
+        hasher.update(f.read())
+    object_fpath = os.path.join(cache_dirpath, hasher.hexdigest() + ".o")
+    try:
+        # mark the object as recently used
+        os.utime(object_fpath)
+        return object_fpath
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(cache_dirpath, exist_ok=True)
+    fd, tmp_fpath = tempfile.mkstemp(dir=cache_dirpath, suffix=".o.tmp")
+    os.close(fd)
+    args = [nvcc_command(toolkit)]
+    args.extend(compiler_args.split())
+    args.append("-I" + ",".join(include_dirpaths))
+    args.extend(["-dc", "-dlto", source_fpath])
+    args.extend(["-o", tmp_fpath, "-Wno-deprecated-gpu-targets"])
+    try:
+        subprocess.check_output(args, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        os.remove(tmp_fpath)
+        raise
+    # other kernels may compile the same object concurrently
+    os.replace(tmp_fpath, object_fpath)
+    return object_fpath
+
+
+def compile_lto_objects(  # pylint: disable=too-many-arguments
+    source_fpaths: List[str],
+    include_dirpaths: List[str],
+    cache_dirpath: str,
+    compiler_args: str = "",
+    max_workers: Optional[int] = None,
+    toolkit: Optional[Toolkit] = None,
+    max_cache_bytes: int = DEFAULT_LTO_CACHE_MAX_BYTES,
+) -> List[str]:
+    """
+    Compile source files to relocatable objects holding the LTO intermediate
+    representation of their device code, to be optimized together when
+    linking with "nvcc -dlto". Objects are cached by the contents of the
+    source file, of the headers it can include, by the compiler arguments
+    and by the toolkit, so only changed files are compiled again. When the
+    cached objects exceed their limit, the least recently used ones that
+    are not part of this compilation are evicted.
+
+    Args:
+        source_fpaths: The .cu files to compile.
+        include_dirpaths: The directories whose headers can be included.
+        cache_dirpath: The directory where the objects are cached.
+        compiler_args: The optional "nvcc" compiler arguments. Defaults to an
+            empty string.
+        max_workers: How many files are compiled in parallel at most.
+            Defaults to None, which lets the thread pool decide.
+        toolkit: The CUDA toolkit to compile with, or None to use the "nvcc"
+            found through the PATH environment variable. Defaults to None.
+        max_cache_bytes: The total size of the cached objects. Defaults to
+            DEFAULT_LTO_CACHE_MAX_BYTES.
+
+    Raises:
+        subprocess.CalledProcessError: If a file failed to compile.
+
+    Returns:
+        The file paths of the objects, in the order of the source files.
+    """
+    headers_digest = hash_headers(include_dirpaths)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        object_fpaths = list(
+            executor.map(
+                lambda fpath: _compile_lto_object(
+                    fpath,
+                    include_dirpaths,
+                    cache_dirpath,
+                    compiler_args,
+                    headers_digest,
+                    toolkit,
+                ),
+                source_fpaths,
+            )
+        )
+    evict_least_recently_used(
+        cache_dirpath, max_cache_bytes, ".o", keep=set(object_fpaths)
+    )
+    return object_fpaths
+
+
+class LibraryBuilder:
+    """
+    Builds the groups a group depends on into static or shared libraries.
+    Groups are built in dependency order, independent groups in parallel, and
+    a library is only rebuilt when its sources, the headers of its
+    dependencies, the compiler arguments or the toolkit changed since the
+    last build.
+    """
+
+    def __init__(self, workdir: str, max_workers: Optional[int] = None):
+        self.workdir = workdir
+        self.max_workers = max_workers
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _group_dirpath(self, group_name: str) -> str:
+        return os.path.join(self.workdir, group_name)
+
+    def library_fpath(self, group_name: str) -> str:
+        """
+        Get the file path of the library built from a group.
+
+        Args:
+            group_name: The name of the group.
+        """
+        library = read_group_metadata(self._group_dirpath(group_name))
+        ext = ".so" if library["library"] == "shared" else ".a"
+        return os.path.join(
+            self._group_dirpath(group_name),
+            BUILD_DIRNAME,
+            f"lib{group_name}{ext}",
+        )
+
+    def dependency_dirpaths(self, group_name: str) -> List[str]:
+        """
+        Get the directories of all groups a group depends on.
+
+        Args:
+            group_name: The name of the group.
+
+        Raises:
+            RuntimeError: If the dependencies are invalid, see
+                "dependency_graph".
+        """
+        graph = dependency_graph(self.workdir, group_name)
+        return [
+            self._group_dirpath(name)
+            for name in topological_order(graph)
+            if name != group_name
+        ]
+
+    def _lock(self, group_name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(group_name, threading.Lock())
+
+    def _stamp(
+        self,
+        group_name: str,
+        include_dirpaths: List[str],
+        compiler_args: str,
+        toolkit: Optional[Toolkit],
+    ) -> str:
+        hasher = hashlib.sha256()
+        hasher.update(toolkit_fingerprint(toolkit).encode() + b"\0")
+        hasher.update(compiler_args.encode() + b"\0")
+        hasher.update(
+            json.dumps(
+                read_group_metadata(self._group_dirpath(group_name))
+            ).encode()
+        )
+        fpaths = glob.glob(
+            os.path.join(self._group_dirpath(group_name), "*.cu")
+        )
+        # headers of the group itself and of everything it can include
+        for dirpath in [self._group_dirpath(group_name)] + include_dirpaths:
+            fpaths.extend(glob.glob(os.path.join(dirpath, "*.h")))
+        for fpath in sorted(fpaths):
+            hasher.update(fpath.encode() + b"\0")
+            with open(fpath, "rb") as f:
+                hasher.update(f.read())
+        return hasher.hexdigest()
+
+    def _build_library(  # pylint: disable=too-many-arguments
+        self,
+        group_name: str,
+        graph: Dict[str, List[str]],
+        shared_dirpath: str,
+        compiler_args: str,
+        toolkit: Optional[Toolkit],
+    ) -> None:
+        include_dirpaths = [
+            self._group_dirpath(name)
+            for name in topological_order(graph, group_name)
+            if name != group_name
+        ]
+        include_dirpaths.append(shared_dirpath)
+        source_files = sorted(
+            glob.glob(os.path.join(self._group_dirpath(group_name), "*.cu"))
+        )
+        if not source_files:
+            # a group with only headers needs no library
+            return
+
+        library_fpath = self.library_fpath(group_name)
+        stamp_fpath = library_fpath + ".stamp"
+        with self._lock(group_name):
+            stamp = self._stamp(
+                group_name, include_dirpaths, compiler_args, toolkit
+            )
+            if os.path.exists(library_fpath) and os.path.exists(stamp_fpath):
+                with open(stamp_fpath, "r", encoding="utf-8") as f:
+                    if f.read() == stamp:
+                        return
+
+            os.makedirs(os.path.dirname(library_fpath), exist_ok=True)
+            args = [nvcc_command(toolkit)]
+            args.extend(compiler_args.split())
+            args.append(
+                "-I"
+                + ",".join(
+                    [self._group_dirpath(group_name)] + include_dirpaths
+                )
+            )
+            if library_fpath.endswith(".so"):
+                args.extend(["-shared", "-Xcompiler", "-fPIC"])
+            else:
+                args.append("-lib")
+            args.extend(source_files)
+            args.extend(["-o", library_fpath, "-Wno-deprecated-gpu-targets"])
+            subprocess.check_output(args, stderr=subprocess.STDOUT)
+
+            with open(stamp_fpath, "w", encoding="utf-8") as f:
+                f.write(stamp)
+
+    def build(
+        self,
+        group_name: str,
+        shared_dirpath: str,
+        compiler_args: str = "",
+        toolkit: Optional[Toolkit] = None,
+    ) -> List[str]:
+        """
+        Build the libraries of all groups a group depends on.
+
+        Args:
+            group_name: The name of the group whose dependencies are built.
+            shared_dirpath: The directory of the "shared" group, whose headers
+                are available to every group.
+            compiler_args: The optional "nvcc" compiler arguments. Defaults to
+                an empty string.
+            toolkit: The CUDA toolkit to compile with, or None to use the
+                "nvcc" found through the PATH environment variable. Defaults
+                to None.
+
+        Raises:
+            RuntimeError: If the dependencies are invalid, see
+                "dependency_graph".
+            subprocess.CalledProcessError: If a library failed to compile.
+
+        Returns:
+            The "nvcc" arguments that link the libraries. See
+            "dependency_dirpaths" for the directories of their headers.
+        """
+        graph = dependency_graph(self.workdir, group_name)
+        dependencies = [
+            name for name in topological_order(graph) if name != group_name
+        ]
+        if not dependencies:
+            return []
+
+        futures: Dict[str, Future] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(futures) < len(dependencies):
+                for name in dependencies:
+                    ready = all(
+                        d in futures and futures[d].done() for d in graph[name]
+                    )
+                    if name not in futures and ready:
+                        futures[name] = executor.submit(
+                            self._build_library,
+                            name,
+                            graph,
+                            shared_dirpath,
+                            compiler_args,
+                            toolkit,
+                        )
+                running = [f for f in futures.values() if not f.done()]
+                if running:
+                    wait_futures(running, return_when=FIRST_COMPLETED)
+                # stop scheduling as soon as a library failed to build
+                for future in futures.values():
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()  # type: ignore
+        for future in futures.values():
+            future.result()
+
+        args = []
+        # dependents come before their dependencies when linking
+        for name in reversed(dependencies):
+            library_fpath = self.library_fpath(name)
+            if not os.path.exists(library_fpath):
+                continue
+            args.append(library_fpath)
+            if library_fpath.endswith(".so"):
+                args.extend(
+                    ["-Xlinker", "-rpath=" + os.path.dirname(library_fpath)]
+                )
+        return args
@@ -0,0 +1,255 @@
+"""
+Assignment of GPUs to CUDA program runs, coordinated between all notebook
+kernels on the same host.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+DEVICES_ENV = "NVCC4JUPYTER_DEVICES"
+# the kernels of all users on the host share a state file, so that the GPUs
+# are coordinated between them
+DEFAULT_STATE_FPATH = os.path.join(
+    tempfile.gettempdir(), "nvcc4jupyter-devices.json"
+)
+# the state file and its lock can be opened by every user
+SHARED_FILE_MODE = 0o666
+
+
+class DevicePolicy(Enum):
+    """How a GPU is chosen for a run."""
+
+    NONE = "none"
+    LEAST_LOADED = "least-loaded"
+    ROUND_ROBIN = "round-robin"
+
+
+def list_devices() -> List[str]:
+    """
+    List the GPUs of this host. The NVCC4JUPYTER_DEVICES environment variable
+    can hold a comma separated list of device indices to use instead, which
+    restricts the scheduler to some GPUs or mocks them on a GPU-less machine.
+
+    Returns:
+        The device indices, or an empty list if no GPU could be found.
+    """
+    if DEVICES_ENV in os.environ:
+        return [d.strip() for d in os.environ[DEVICES_ENV].split(",") if d]
+    try:
+        output = subprocess.check_output(
+            ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [line.strip() for line in output.decode().splitlines() if line]
+
+
+def _open_shared(fpath: str, flags: int) -> int:
+    # a file of another user in a sticky directory such as /tmp cannot be
+    # opened with O_CREAT, so the file is only created if it is missing
+    while True:
+        try:
+            return os.open(fpath, flags)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(
+                fpath, flags | os.O_CREAT | os.O_EXCL, SHARED_FILE_MODE
+            )
+        except FileExistsError:
+            continue
+        # the umask must not keep the other users out
+        os.fchmod(fd, SHARED_FILE_MODE)
+        return fd
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DeviceScheduler:
+    """
+    Assigns GPUs to runs. The leases of all kernels on the host, of every
+    user, are kept in a JSON state file guarded by a file lock, so concurrent
+    runs from different notebooks spread over the GPUs instead of piling onto
+    the first one. When every GPU runs its maximum number of jobs, new runs
+    wait for a free one. A run can also hold a GPU exclusively, e.g. to
+    profile it.
+    """
+
+    def __init__(
+        self,
+        state_fpath: str = DEFAULT_STATE_FPATH,
+        enumerate_devices: Callable[[], List[str]] = list_devices,
+        max_jobs_per_device: int = 1,
+        poll_interval: float = 0.1,
+    ) -> None:
+        self.state_fpath = state_fpath
+        self.enumerate_devices = enumerate_devices
+        self.max_jobs_per_device = max_jobs_per_device
+        self.poll_interval = poll_interval
+        self._devices: Optional[List[str]] = None
+
+    @property
+    def devices(self) -> List[str]:
+        """The GPUs to schedule runs on, enumerated once."""
+        if self._devices is None:
+            self._devices = self.enumerate_devices()
+        return self._devices
+
+    @contextlib.contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Any]]:
+        lock_fpath = self.state_fpath + ".lock"
+        fd = _open_shared(lock_fpath, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                with open(self.state_fpath, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+            state.setdefault("leases", {})
+            state.setdefault("next", 0)
+            # forget leases of kernels that exited without releasing them
+            for device, leases in state["leases"].items():
+                state["leases"][device] = [
+                    lease for lease in leases if _pid_alive(lease["pid"])
+                ]
+            yield state
+            state_fd = _open_shared(self.state_fpath, os.O_WRONLY | os.O_TRUNC)
+            with os.fdopen(state_fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _share(self, exclusive: bool) -> float:
+        # the part of a GPU a run holds, so that schedulers with different
+        # numbers of jobs per GPU can share a state file
+        return 1.0 if exclusive else 1.0 / self.max_jobs_per_device
+
+    def loads(self) -> Dict[str, int]:
+        """Number of runs currently holding each GPU."""
+        with self._locked_state() as state:
+            return {
+                device: len(state["leases"].get(device, []))
+                for device in self.devices
+            }
+
+    def _try_acquire(
+        self, policy: DevicePolicy, share: float
+    ) -> Optional[Dict[str, Any]]:
+        with self._locked_state() as state:
+            loads = {
+                device: sum(
+                    lease.get("share", 1.0)
+                    for lease in state["leases"].get(device, [])
+                )
+                for device in self.devices
+            }
+            free = [
+                index
+                for index, device in enumerate(self.devices)
+                if loads[device] + share <= 1.0 + 1e-9
+            ]
+            if not free:
+                return None
+            if policy == DevicePolicy.ROUND_ROBIN:
+                start = state["next"] % len(self.devices)
+                index = min(
+                    free, key=lambda i: (i - start) % len(self.devices)
+                )
+            else:
+                index = min(free, key=lambda i: loads[self.devices[i]])
+            state["next"] = index + 1
+            lease = {
+                "device": self.devices[index],
+                "pid": os.getpid(),
+                "token": uuid.uuid4().hex,
+                "share": share,
+            }
+            state["leases"].setdefault(lease["device"], []).append(lease)
+            return lease
+
+    def _release(self, lease: Dict[str, Any]) -> None:
+        with self._locked_state() as state:
+            leases = state["leases"].get(lease["device"], [])
+            state["leases"][lease["device"]] = [
+                other for other in leases if other["token"] != lease["token"]
+            ]
+
+    @contextlib.contextmanager
+    def assign(self, policy: DevicePolicy) -> Iterator[Optional[str]]:
+        """
+        Hold a GPU for the duration of a run, waiting if all are busy.
+
+        Args:
+            policy: How to choose the GPU. With DevicePolicy.NONE, or if the
+                host has fewer than two GPUs, no GPU is assigned.
+
+        Yields:
+            The index of the assigned GPU to be used as CUDA_VISIBLE_DEVICES,
+            or None if no GPU was assigned.
+        """
+        if policy == DevicePolicy.NONE or len(self.devices) < 2:
+            yield None
+            return
+
+        with self.lease(policy, announce_wait=True) as device:
+            yield device
+
+    @contextlib.contextmanager
+    def lease(
+        self,
+        policy: DevicePolicy,
+        exclusive: bool = False,
+        announce_wait: bool = False,
+    ) -> Iterator[str]:
+        """
+        Hold one of the "max_jobs_per_device" slots of a GPU, waiting until
+        one is free. Unlike "assign", a GPU is also held on hosts with a
+        single GPU.
+
+        Args:
+            policy: How to choose the GPU, either DevicePolicy.LEAST_LOADED
+                or DevicePolicy.ROUND_ROBIN.
+            exclusive: If True, wait until a GPU runs nothing else and hold
+                all of its slots. Defaults to False.
+            announce_wait: If True, print a message when all GPUs are busy.
+                Defaults to False.
+
+        Raises:
+            RuntimeError: If the host has no GPUs to schedule.
+
+        Yields:
+            The index of the held GPU.
+        """
+        if not self.devices:
+            raise RuntimeError("There are no GPUs to schedule runs on.")
+        share = self._share(exclusive)
+        lease = self._try_acquire(policy, share)
+        if lease is None:
+            if announce_wait:
+                print("All GPUs are busy, waiting for one to become free...")
+            while lease is None:
+                time.sleep(self.poll_interval)
+                lease = self._try_acquire(policy, share)
+        try:
+            yield lease["device"]
+        finally:
+            self._release(lease)
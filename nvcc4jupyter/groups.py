@@ -0,0 +1,201 @@
+"""
+Source file groups in a working directory, and their compilation into
+programs. Every plugin has a working directory of its own, and notebooks are
+precompiled in temporary ones.
+"""
+
+import contextlib
+import glob
+import os
+import tempfile
+from typing import Optional
+
+from .backends import (
+    Backend,
+    CompileArtifact,
+    CompileCache,
+    compile_key,
+    get_backend,
+)
+from .build import LTO_COMPILER_ARGS, LibraryBuilder, compile_lto_objects
+from .path_utils import get_cache_dir
+from .setup_env import wait_for_setup
+from .stats import PhaseStats
+from .toolkits import Toolkit
+
+DEFAULT_EXEC_FNAME = "cuda_exec.out"
+SHARED_GROUP_NAME = "shared"
+
+
+def save_source(
+    workdir: str, group_name: str, source_name: str, source_code: str
+) -> None:
+    """
+    Save source code as a .cu or .h file in the directory of a group. See
+    "NVCCPlugin._save_source".
+
+    Args:
+        workdir: The directory that holds the group directories.
+        group_name: The name of the group.
+        source_name: The name of the source file. Must end in ".cu" or ".h".
+        source_code: The source code to be written to the source file.
+
+    Raises:
+        ValueError: If the source name does not have a proper extension.
+    """
+    _, ext = os.path.splitext(source_name)
+    if ext not in (".cu", ".h"):
+        raise ValueError(
+            f'Given source name "{source_name}" must end in ".h" or ".cu".'
+        )
+    group_dirpath = os.path.join(workdir, group_name)
+    os.makedirs(group_dirpath, exist_ok=True)
+    source_fpath = os.path.join(group_dirpath, source_name)
+    # replace the file instead of writing to it, since it may be a hard link
+    # to a snapshot blob
+    fd, tmp_fpath = tempfile.mkstemp(dir=group_dirpath, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(source_code)
+    os.chmod(tmp_fpath, 0o644)
+    os.replace(tmp_fpath, source_fpath)
+
+
+def compile_group(  # pylint: disable=too-many-arguments,too-many-locals
+    workdir: str,
+    group_name: str,
+    executable_fname: str = DEFAULT_EXEC_FNAME,
+    compiler_args: str = "",
+    dlto: bool = False,
+    backend: Backend = Backend.NVCC,
+    use_cache: bool = True,
+    toolkit: Optional[Toolkit] = None,
+    library_builder: Optional[LibraryBuilder] = None,
+    stats: Optional[PhaseStats] = None,
+) -> CompileArtifact:
+    """
+    Compile all source files of a group together with all source files of
+    the group named "shared". The groups it depends on are first built into
+    libraries which are linked into the executable.
+
+    Args:
+        workdir: The directory that holds the group directories.
+        group_name: The name of the source file group to be compiled.
+        executable_fname: The output executable file name. Defaults to
+            DEFAULT_EXEC_FNAME.
+        compiler_args: The optional compiler arguments.
+        dlto: If True, every source file is compiled separately to a cached
+            object and the device code of all of them is optimized together
+            when linking. Defaults to False.
+        backend: The compiler backend. Defaults to Backend.NVCC.
+        use_cache: If True, an artifact compiled earlier by the same backend
+            and toolkit from identical files and arguments is reused.
+            Defaults to True.
+        toolkit: The CUDA toolkit to compile with, or None to use the "nvcc"
+            found through the PATH environment variable. Defaults to None.
+        library_builder: The builder of the libraries of the working
+            directory, which keeps them between compilations. Defaults to
+            None, which uses a new one.
+        stats: Where the compile time of the backend is recorded. Defaults to
+            None.
+
+    Raises:
+        RuntimeError: If the group does not exist, if it does not have any
+            source files associated with it, if its dependencies are missing
+            or form a cycle or if the backend does not support the requested
+            build.
+        subprocess.CalledProcessError: If the compilation failed.
+
+    Returns:
+        The compiled artifact.
+    """
+    shared_dirpath = os.path.join(workdir, SHARED_GROUP_NAME)
+    group_dirpath = os.path.join(workdir, group_name)
+    if not os.path.exists(group_dirpath):
+        raise RuntimeError(f'Group "{group_name}" does not exist.')
+
+    wait_for_setup()
+
+    source_files = sorted(glob.glob(os.path.join(group_dirpath, "*.cu")))
+    if len(source_files) == 0:
+        raise RuntimeError(
+            f'Group "{group_name}" does not have any source files.'
+        )
+    source_files.extend(
+        sorted(glob.glob(os.path.join(shared_dirpath, "*.cu")))
+    )
+
+    if library_builder is None:
+        library_builder = LibraryBuilder(workdir)
+    compiler = get_backend(backend, toolkit)
+    dependency_dirpaths = library_builder.dependency_dirpaths(group_name)
+    if backend != Backend.NVCC and (dlto or dependency_dirpaths):
+        raise RuntimeError(
+            "Device link-time optimization and groups with dependencies"
+            f' are not supported by the "{backend.value}" backend.'
+        )
+    include_dirpaths = [shared_dirpath, group_dirpath]
+    include_dirpaths.extend(dependency_dirpaths)
+
+    if dlto:
+        library_args = library_builder.build(
+            group_name,
+            shared_dirpath,
+            f"{compiler_args} {LTO_COMPILER_ARGS}".strip(),
+            toolkit,
+        )
+        source_files = compile_lto_objects(
+            source_files,
+            include_dirpaths,
+            get_cache_dir("lto"),
+            compiler_args,
+            toolkit=toolkit,
+        )
+        compiler_args = f"{compiler_args} -dlto".strip()
+    else:
+        library_args = library_builder.build(
+            group_name, shared_dirpath, compiler_args, toolkit
+        )
+
+    output_fpath = os.path.join(group_dirpath, executable_fname)
+    if compiler.artifact_ext is not None:
+        output_fpath = (
+            os.path.splitext(output_fpath)[0] + compiler.artifact_ext
+        )
+    artifact = CompileArtifact(
+        path=output_fpath,
+        backend=backend,
+        runnable=compiler.runnable,
+        toolkit=toolkit.version if toolkit else None,
+    )
+
+    key = None
+    cache = CompileCache(get_cache_dir("compile", backend.value))
+    if use_cache:
+        key = compile_key(
+            compiler,
+            source_files,
+            include_dirpaths,
+            compiler_args,
+            library_args,
+        )
+        if cache.get(key, output_fpath):
+            artifact.cached = True
+            return artifact
+
+    # compile times of every backend, to compare them with "%cuda_stats"
+    span = (
+        stats.span(f"compile_{backend.value}")
+        if stats is not None
+        else contextlib.nullcontext()
+    )
+    with span:
+        artifact.diagnostics = compiler.compile(
+            source_files,
+            include_dirpaths,
+            output_fpath,
+            compiler_args,
+            library_args,
+        )
+    if key is not None:
+        cache.put(key, output_fpath)
+    return artifact
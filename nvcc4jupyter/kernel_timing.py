@@ -0,0 +1,311 @@
+"""
+Lightweight timing of kernel launches. A small library preloaded into the
+program intercepts every kernel launch, records CUDA events around it and
+writes the launch count and GPU times of every kernel to a file when the
+program exits.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from typing import Any, Dict, List
+
+# the file the preloaded library writes the timings to
+KERNEL_TIMING_FILE_ENV = "NVCC4JUPYTER_KERNEL_TIMING_FILE"
+
+# kernel launches can only be intercepted in the shared CUDA runtime, and
+# kernel names are looked up in the dynamic symbol table of the program
+KERNEL_TIMING_COMPILER_ARGS = "-cudart shared -Xlinker --export-dynamic"
+
+SHIM_SOURCE = r"""
+// Generated by nvcc4jupyter: times every kernel launch with CUDA events.
+// The CUDA runtime is looked up at run time, so no CUDA headers are needed.
+#include <cxxabi.h>
+#include <dlfcn.h>
+
+#include <cstdio>
+#include <cstdlib>
+#include <map>
+#include <mutex>
+#include <string>
+#include <vector>
+
+typedef int cudaError_t;
+typedef void *cudaEvent_t;
+typedef void *cudaStream_t;
+struct dim3 {
+    unsigned int x, y, z;
+};
+
+typedef cudaError_t (*launch_t)(
+    const void *, dim3, dim3, void **, size_t, cudaStream_t);
+typedef cudaError_t (*event_create_t)(cudaEvent_t *);
+typedef cudaError_t (*event_record_t)(cudaEvent_t, cudaStream_t);
+typedef cudaError_t (*event_synchronize_t)(cudaEvent_t);
+typedef cudaError_t (*event_elapsed_time_t)(
+    float *, cudaEvent_t, cudaEvent_t);
+typedef cudaError_t (*event_destroy_t)(cudaEvent_t);
+
+namespace {
+
+struct Launch {
+    const void *func;
+    cudaEvent_t start;
+    cudaEvent_t stop;
+};
+
+struct Stats {
+    long long launches = 0;
+    long long timed = 0;
+    double total_ms = 0;
+    double max_ms = 0;
+};
+
+// the events of pending launches are read once there are this many, which
+// bounds the memory used by programs that launch many kernels
+const size_t kMaxPending = 4096;
+
+std::mutex mutex;
+std::vector<Launch> pending;
+std::map<const void *, Stats> stats;
+bool registered = false;
+
+template <typename F> F lookup(const char *name) {
+    return reinterpret_cast<F>(dlsym(RTLD_NEXT, name));
+}
+
+void destroy_events(const Launch &launch) {
+    static event_destroy_t destroy =
+        lookup<event_destroy_t>("cudaEventDestroy");
+    if (launch.start) destroy(launch.start);
+    if (launch.stop) destroy(launch.stop);
+}
+
+void collect_locked() {
+    static event_synchronize_t synchronize =
+        lookup<event_synchronize_t>("cudaEventSynchronize");
+    static event_elapsed_time_t elapsed_time =
+        lookup<event_elapsed_time_t>("cudaEventElapsedTime");
+    for (const Launch &launch : pending) {
+        Stats &s = stats[launch.func];
+        s.launches += 1;
+        float ms = 0;
+        if (launch.start && launch.stop && synchronize(launch.stop) == 0 &&
+            elapsed_time(&ms, launch.start, launch.stop) == 0) {
+            s.timed += 1;
+            s.total_ms += ms;
+            if (ms > s.max_ms) s.max_ms = ms;
+        }
+        destroy_events(launch);
+    }
+    pending.clear();
+}
+
+std::string kernel_name(const void *func) {
+    Dl_info info;
+    if (dladdr(func, &info) && info.dli_sname) {
+        int status = 0;
+        char *demangled =
+            abi::__cxa_demangle(info.dli_sname, nullptr, nullptr, &status);
+        std::string name = status == 0 ? demangled : info.dli_sname;
+        free(demangled);
+        return name;
+    }
+    char address[32];
+    snprintf(address, sizeof(address), "%p", func);
+    return address;
+}
+
+void write_json_string(FILE *f, const std::string &s) {
+    fputc('"', f);
+    for (char c : s) {
+        if (c == '"' || c == '\\') {
+            fputc('\\', f);
+        } else if (static_cast<unsigned char>(c) < 0x20) {
+            fprintf(f, "\\u%04x", c);
+            continue;
+        }
+        fputc(c, f);
+    }
+    fputc('"', f);
+}
+
+void report() {
+    std::lock_guard<std::mutex> lock(mutex);
+    collect_locked();
+    const char *fpath = getenv("NVCC4JUPYTER_KERNEL_TIMING_FILE");
+    FILE *f = fpath ? fopen(fpath, "w") : nullptr;
+    if (!f) return;
+    for (const auto &entry : stats) {
+        fputs("{\"kernel\": ", f);
+        write_json_string(f, kernel_name(entry.first));
+        fprintf(f,
+                ", \"launches\": %lld, \"timed\": %lld, \"total_ms\": %.6f,"
+                " \"max_ms\": %.6f}\n",
+                entry.second.launches, entry.second.timed,
+                entry.second.total_ms, entry.second.max_ms);
+    }
+    fclose(f);
+}
+
+cudaError_t timed_launch(launch_t launch, const void *func, dim3 grid,
+                         dim3 block, void **args, size_t shared,
+                         cudaStream_t stream) {
+    static event_create_t create = lookup<event_create_t>("cudaEventCreate");
+    static event_record_t record = lookup<event_record_t>("cudaEventRecord");
+    Launch entry = {func, nullptr, nullptr};
+    if (create(&entry.start) != 0 || create(&entry.stop) != 0) {
+        destroy_events(entry);
+        entry.start = entry.stop = nullptr;
+    }
+    if (entry.start) record(entry.start, stream);
+    cudaError_t result = launch(func, grid, block, args, shared, stream);
+    if (entry.stop) record(entry.stop, stream);
+
+    std::lock_guard<std::mutex> lock(mutex);
+    if (!registered) {
+        // registered after the CUDA runtime initialized, so the report is
+        // written before the runtime is torn down
+        registered = true;
+        atexit(report);
+    }
+    if (result != 0) {
+        destroy_events(entry);
+        return result;
+    }
+    pending.push_back(entry);
+    if (pending.size() >= kMaxPending) collect_locked();
+    return result;
+}
+
+}  // namespace
+
+extern "C" cudaError_t cudaLaunchKernel(const void *func, dim3 grid,
+                                        dim3 block, void **args,
+                                        size_t shared, cudaStream_t stream) {
+    static launch_t launch = lookup<launch_t>("cudaLaunchKernel");
+    return timed_launch(launch, func, grid, block, args, shared, stream);
+}
+
+extern "C" cudaError_t cudaLaunchKernel_ptsz(const void *func, dim3 grid,
+                                             dim3 block, void **args,
+                                             size_t shared,
+                                             cudaStream_t stream) {
+    static launch_t launch = lookup<launch_t>("cudaLaunchKernel_ptsz");
+    return timed_launch(launch, func, grid, block, args, shared, stream);
+}
+"""
+
+
+def kernel_timing_fpath(exec_fpath: str) -> str:
+    """Get the file the kernel timings of an executable are written to."""
+    return exec_fpath + ".timing.jsonl"
+
+
+def build_timing_shim(cache_dirpath: str, compile_command: List[str]) -> str:
+    """
+    Build the library that times kernel launches, unless it is cached.
+
+    Args:
+        cache_dirpath: The directory where the library is cached.
+        compile_command: The command that compiles a C++ file into a shared
+            library, without the file names, e.g. ["nvcc", "-shared",
+            "-Xcompiler", "-fPIC"].
+
+    Raises:
+        subprocess.CalledProcessError: If the library failed to compile.
+
+    Returns:
+        The file path of the library.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([SHIM_SOURCE, compile_command]).encode())
+    shim_fpath = os.path.join(
+        cache_dirpath, f"kernel_timing-{hasher.hexdigest()[:16]}.so"
+    )
+    if os.path.exists(shim_fpath):
+        return shim_fpath
+
+    os.makedirs(cache_dirpath, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dirpath) as tmp_dirpath:
+        source_fpath = os.path.join(tmp_dirpath, "kernel_timing.cpp")
+        with open(source_fpath, "w", encoding="utf-8") as f:
+            f.write(SHIM_SOURCE)
+        tmp_fpath = os.path.join(tmp_dirpath, "kernel_timing.so")
+        subprocess.check_output(
+            compile_command + [source_fpath, "-o", tmp_fpath, "-ldl"],
+            stderr=subprocess.STDOUT,
+        )
+        os.replace(tmp_fpath, shim_fpath)
+    return shim_fpath
+
+
+def kernel_timing_env(shim_fpath: str, timing_fpath: str) -> Dict[str, str]:
+    """
+    Get the environment variables that time the kernel launches of a
+    program.
+
+    Args:
+        shim_fpath: The library built by "build_timing_shim".
+        timing_fpath: The file the timings are written to.
+    """
+    preload = os.environ.get("LD_PRELOAD")
+    return {
+        "LD_PRELOAD": f"{shim_fpath} {preload}" if preload else shim_fpath,
+        KERNEL_TIMING_FILE_ENV: timing_fpath,
+    }
+
+
+def read_kernel_timings(timing_fpath: str) -> List[Dict[str, Any]]:
+    """
+    Read the kernel timings written by a program.
+
+    Args:
+        timing_fpath: The file the timings were written to.
+
+    Returns:
+        One record per kernel with its "kernel" name, number of "launches"
+        and the "total_ms", "mean_ms" and "max_ms" GPU times, most expensive
+        kernel first. Empty if the program launched no kernel or did not
+        exit normally.
+    """
+    timings = []
+    try:
+        with open(timing_fpath, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    for line in lines:
+        record = json.loads(line)
+        timed = record.pop("timed")
+        record["mean_ms"] = record["total_ms"] / timed if timed else None
+        if not timed:
+            # the launches ran, but their events could not be read
+            record["total_ms"] = record["max_ms"] = None
+        timings.append(record)
+    timings.sort(key=lambda t: t["total_ms"] or 0, reverse=True)
+    return timings
+
+
+def format_kernel_timings(timings: List[Dict[str, Any]]) -> str:
+    """Format kernel timings as a human readable table."""
+    if not timings:
+        return "No kernel launches were recorded."
+
+    def ms(value: Any) -> str:
+        return "-" if value is None else f"{value:.3f}ms"
+
+    width = max(len("kernel"), *(len(t["kernel"]) for t in timings))
+    lines = [
+        f"{'kernel':<{width}} {'launches':>9} {'total':>12} {'mean':>12}"
+        f" {'max':>12}"
+    ]
+    for t in timings:
+        lines.append(
+            f"{t['kernel']:<{width}} {t['launches']:>9}"
+            f" {ms(t['total_ms']):>12} {ms(t['mean_ms']):>12}"
+            f" {ms(t['max_ms']):>12}"
+        )
+    return "\n".join(lines)
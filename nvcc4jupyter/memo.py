@@ -0,0 +1,153 @@
+"""
+On-disk memoization of the results of deterministic CUDA programs.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from .path_utils import evict_least_recently_used
+from .results import RunResult
+
+DEFAULT_MEMO_MAX_BYTES = 256 * 1024 * 1024
+
+# environment variables that may change the behaviour of a CUDA program and
+# are therefore part of the memoization key
+MEMO_ENV_PREFIXES = ("CUDA_", "NVIDIA_", "NVCC4JUPYTER_")
+
+
+def _hash_file(fpath: str, hasher: Any) -> None:
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+
+def memo_key(
+    exec_fpath: str,
+    argv: List[str],
+    env: Optional[Dict[str, str]] = None,
+    input_fpaths: Iterable[str] = (),
+    fingerprint: str = "",
+) -> str:
+    """
+    Compute the memoization key of a program run.
+
+    Args:
+        exec_fpath: The file path of the executable, whose contents (not path)
+            are part of the key.
+        argv: The full command line used to run the executable. Occurrences
+            of the executable path are ignored.
+        env: Extra environment variables of the run. Values that are paths
+            of existing files contribute their contents instead of the path,
+            so temporary input files with identical contents match. Defaults
+            to None.
+        input_fpaths: Additional files read by the program. Defaults to an
+            empty tuple.
+        fingerprint: Identifies the CUDA toolkit (and profiler) of the run.
+            Defaults to an empty string.
+
+    Returns:
+        A hexadecimal digest that identifies the run.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(fingerprint.encode() + b"\0")
+    _hash_file(exec_fpath, hasher)
+    hasher.update(
+        json.dumps(["<exec>" if a == exec_fpath else a for a in argv]).encode()
+    )
+
+    run_env = {
+        name: value
+        for name, value in os.environ.items()
+        if name.startswith(MEMO_ENV_PREFIXES)
+    }
+    run_env.update(env or {})
+    for name in sorted(run_env):
+        value = run_env[name]
+        hasher.update(name.encode() + b"\0")
+        if os.path.isfile(value):
+            _hash_file(value, hasher)
+        else:
+            hasher.update(value.encode())
+        hasher.update(b"\0")
+
+    for fpath in input_fpaths:
+        hasher.update(os.path.abspath(fpath).encode() + b"\0")
+        _hash_file(fpath, hasher)
+    return hasher.hexdigest()
+
+
+class MemoStore:
+    """
+    A bounded store of run results keyed by memo_key(). When the total size
+    of the stored results exceeds the limit, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(
+        self, dirpath: str, max_bytes: int = DEFAULT_MEMO_MAX_BYTES
+    ) -> None:
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+
+    def _entry_fpath(self, key: str) -> str:
+        return os.path.join(self.dirpath, f"{key}.json")
+
+    def get(self, key: str) -> Optional[RunResult]:
+        """
+        Get a stored result.
+
+        Args:
+            key: The memoization key.
+
+        Returns:
+            The stored result, or None if there is no entry for the key.
+        """
+        fpath = self._entry_fpath(key)
+        try:
+            with open(fpath, "r", encoding="utf-8") as f:
+                result = RunResult(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        # mark the entry as recently used
+        os.utime(fpath)
+        return result
+
+    def put(self, key: str, result: RunResult) -> None:
+        """
+        Store a result and evict old entries if the store is over its limit.
+
+        Args:
+            key: The memoization key.
+            result: The result of the run.
+        """
+        os.makedirs(self.dirpath, exist_ok=True)
+        fd, tmp_fpath = tempfile.mkstemp(dir=self.dirpath, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(result), f)
+        os.replace(tmp_fpath, self._entry_fpath(key))
+        self._evict()
+
+    def _entries(self) -> List[os.DirEntry]:
+        if not os.path.isdir(self.dirpath):
+            return []
+        with os.scandir(self.dirpath) as it:
+            return [e for e in it if e.name.endswith(".json")]
+
+    def _evict(self) -> None:
+        evict_least_recently_used(self.dirpath, self.max_bytes, ".json")
+
+    def clear(self) -> int:
+        """
+        Remove all stored results.
+
+        Returns:
+            The number of removed entries.
+        """
+        entries = self._entries()
+        for entry in entries:
+            os.remove(entry.path)
+        return len(entries)
@@ -0,0 +1,147 @@
+"""
+Scanning of notebooks for the CUDA programs their cells compile, so that
+they can be compiled ahead of time.
+"""
+
+import argparse
+import copy
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .parsers import (
+    get_parser_cuda,
+    get_parser_cuda_group_delete,
+    get_parser_cuda_group_run,
+    get_parser_cuda_group_save,
+    split_magic_line,
+)
+
+# the group and file name used by the "%%cuda" magic, whose actual group name
+# is random but does not change the compiled program
+CELL_GROUP_NAME = "cell"
+CELL_SOURCE_NAME = "single_file.cu"
+
+
+@dataclass
+class PrecompileJob:
+    """A program that a notebook cell compiles when it is run."""
+
+    cell_index: int
+    group_name: str
+    args: argparse.Namespace
+    # the files and metadata of every group at the time the cell runs
+    sources: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    metadata: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+def read_code_cells(fpath: str) -> Iterator[Tuple[int, str]]:
+    """
+    Read the code cells of a notebook.
+
+    Args:
+        fpath: The file path of the .ipynb notebook.
+
+    Yields:
+        The index and the source code of every code cell, in order.
+    """
+    with open(fpath, "r", encoding="utf-8") as f:
+        notebook = json.load(f)
+    for index, cell in enumerate(notebook.get("cells", [])):
+        if cell.get("cell_type") != "code":
+            continue
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        yield index, source
+
+
+def _parse(
+    parser: argparse.ArgumentParser, line: str
+) -> Optional[argparse.Namespace]:
+    try:
+        return parser.parse_args(split_magic_line(line))
+    except SystemExit:
+        return None
+
+
+def scan_notebook(  # pylint: disable=too-many-branches,too-many-locals
+    fpath: str,
+) -> Tuple[List[PrecompileJob], List[Tuple[int, str]]]:
+    """
+    Find the programs compiled by the "%%cuda" cells and "%cuda_group_run"
+    lines of a notebook. The "%%cuda_group_save" and "%cuda_group_delete"
+    magics are replayed in order to know the contents of every group at the
+    time it is compiled.
+
+    Args:
+        fpath: The file path of the .ipynb notebook.
+
+    Returns:
+        The programs to compile, and the index of every cell that compiles a
+        program that can not be compiled ahead of time with the reason why.
+    """
+    parser_cuda = get_parser_cuda()
+    parser_group_save = get_parser_cuda_group_save()
+    parser_group_run = get_parser_cuda_group_run()
+    parser_group_delete = get_parser_cuda_group_delete()
+
+    sources: Dict[str, Dict[str, str]] = {}
+    metadata: Dict[str, Dict[str, Any]] = {}
+    jobs: List[PrecompileJob] = []
+    skipped: List[Tuple[int, str]] = []
+
+    def add_job(index: int, group_name: str, args) -> None:
+        if args is None:
+            skipped.append((index, "invalid arguments"))
+        elif args.inputs or args.outputs:
+            skipped.append((index, "arrays are bound at run time"))
+        elif metadata.get(group_name, {}).get("depends"):
+            skipped.append((index, "depends on other groups"))
+        else:
+            jobs.append(
+                PrecompileJob(
+                    cell_index=index,
+                    group_name=group_name,
+                    args=args,
+                    sources=copy.deepcopy(sources),
+                    metadata=copy.deepcopy(metadata),
+                )
+            )
+
+    for index, source in read_code_cells(fpath):
+        first_line, _, body = source.partition("\n")
+        magic, _, line = first_line.strip().partition(" ")
+        if magic == "%%cuda":
+            sources[CELL_GROUP_NAME] = {CELL_SOURCE_NAME: body}
+            add_job(index, CELL_GROUP_NAME, _parse(parser_cuda, line))
+            del sources[CELL_GROUP_NAME]
+            continue
+        if magic == "%%cuda_group_save":
+            args = _parse(parser_group_save, line)
+            if args is not None:
+                sources.setdefault(args.group, {})[args.name] = body
+                group_metadata = metadata.setdefault(
+                    args.group, {"depends": [], "library": "static"}
+                )
+                for dependency in args.depends:
+                    if dependency not in group_metadata["depends"]:
+                        group_metadata["depends"].append(dependency)
+                if args.library is not None:
+                    group_metadata["library"] = args.library
+            continue
+        if magic.startswith("%%"):
+            continue
+
+        # line magics can appear anywhere in a cell
+        for code_line in source.splitlines():
+            magic, _, line = code_line.strip().partition(" ")
+            if magic == "%cuda_group_run":
+                args = _parse(parser_group_run, line)
+                add_job(index, args.group if args else "", args)
+            elif magic == "%cuda_group_delete":
+                args = _parse(parser_group_delete, line)
+                if args is not None:
+                    sources.pop(args.group, None)
+                    metadata.pop(args.group, None)
+    return jobs, skipped
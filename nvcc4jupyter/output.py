@@ -0,0 +1,127 @@
+"""
+Bounded handling of the output of CUDA programs, which can be much larger
+than what a notebook can display.
+"""
+
+import codecs
+import collections
+import os
+from typing import IO, Deque, Optional
+
+# characters of output shown from the start and from the end of the output
+DEFAULT_MAX_OUTPUT = 256 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def format_bytes(nbytes: int) -> str:
+    """Format a number of bytes in human readable units."""
+    size = float(nbytes)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+        size /= 1024
+    return f"{nbytes} B" if unit == "B" else f"{size:.1f} {unit}"
+
+
+class OutputSink:  # pylint: disable=too-many-instance-attributes
+    """
+    Receives the output of a program in chunks. The full output is written
+    to a log file, while only a bounded head and tail of the decoded text are
+    kept in memory for display. The log file is only kept if the output was
+    truncated.
+    """
+
+    def __init__(
+        self,
+        log_fpath: Optional[str] = None,
+        max_output: int = DEFAULT_MAX_OUTPUT,
+    ) -> None:
+        """
+        Args:
+            log_fpath: The file the full output is written to, or None to
+                not keep the full output. The file is removed when the sink
+                is closed unless the output was truncated. Defaults to None.
+            max_output: How many characters are kept in memory, half from
+                the start and half from the end of the output. Defaults to
+                DEFAULT_MAX_OUTPUT.
+        """
+        self.log_fpath = log_fpath
+        self.head_chars = max_output // 2
+        self.tail_chars = max_output - self.head_chars
+        self.total_bytes = 0
+        self.total_chars = 0
+
+        self._decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+        self._head: str = ""
+        self._tail: Deque[str] = collections.deque()
+        self._tail_len = 0
+        self._log: Optional[IO[bytes]] = None
+        if log_fpath is not None:
+            self._log = open(  # pylint: disable=consider-using-with
+                log_fpath, "wb"
+            )
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, data: bytes) -> None:
+        """Add a chunk of raw program output."""
+        self.total_bytes += len(data)
+        if self._log is not None:
+            self._log.write(data)
+        self._add_text(self._decoder.decode(data))
+
+    def _add_text(self, text: str) -> None:
+        self.total_chars += len(text)
+        if len(self._head) < self.head_chars:
+            missing = self.head_chars - len(self._head)
+            self._head += text[:missing]
+            text = text[missing:]
+        if not text or self.tail_chars == 0:
+            return
+        self._tail.append(text[-self.tail_chars :])
+        self._tail_len += len(self._tail[-1])
+        # drop whole chunks that are no longer part of the tail
+        while self._tail_len - len(self._tail[0]) >= self.tail_chars:
+            self._tail_len -= len(self._tail.popleft())
+
+    def close(self) -> None:
+        """
+        Flush the decoder and close the log file, which is removed if all of
+        the output is kept in memory.
+        """
+        self._add_text(self._decoder.decode(b"", final=True))
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+            if not self.truncated:
+                os.remove(self.log_fpath)  # type: ignore[arg-type]
+                self.log_fpath = None
+
+    @property
+    def truncated(self) -> bool:
+        """Whether some of the output is not kept in memory."""
+        return self.total_chars > self.head_chars + self.tail_chars
+
+    def text(self) -> str:
+        """
+        Get the output, with the middle replaced by a note if the output is
+        longer than the limit.
+        """
+        tail = "".join(self._tail)
+        if not self.truncated:
+            return self._head + tail
+        tail = tail[len(tail) - self.tail_chars :]
+        omitted = self.total_chars - len(self._head) - len(tail)
+        location = (
+            f' (the full output is in "{self.log_fpath}")'
+            if self.log_fpath is not None
+            else ""
+        )
+        return (
+            f"{self._head}\n[... {omitted} characters omitted{location}"
+            f" ...]\n{tail}"
+        )
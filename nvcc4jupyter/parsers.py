@@ -4,7 +4,14 @@ Parsers for the CUDA magic commands.
 
 import argparse
 from enum import Enum
-from typing import Callable, Optional, Type, TypeVar
+from typing import Callable, List, Optional, Type, TypeVar
+
+from .backends import Backend
+from .build import LIBRARY_TYPES
+from .devices import DevicePolicy
+from .output import DEFAULT_MAX_OUTPUT
+from .processes import parse_size
+from .stats import EXPORT_FORMATS
 
 
 class Profiler(Enum):
@@ -17,14 +24,20 @@ class Profiler(Enum):
 _default_profiler: Profiler = Profiler.NCU
 _default_profiler_args: str = ""
 _default_compiler_args: str = ""
+_default_device_policy: DevicePolicy = DevicePolicy.NONE
+_default_backend: Backend = Backend.NVCC
+_default_toolkit: Optional[str] = None
 
 T = TypeVar("T")
 
 
-def set_defaults(
+def set_defaults(  # pylint: disable=too-many-arguments
     profiler: Optional[Profiler] = None,
     compiler_args: Optional[str] = None,
     profiler_args: Optional[str] = None,
+    device_policy: Optional[DevicePolicy] = None,
+    backend: Optional[Backend] = None,
+    toolkit: Optional[str] = None,
 ) -> None:
     """
     Set the default values for various arguments of the magic commands. These
@@ -38,6 +51,12 @@ def set_defaults(
             config. Defaults to None.
         profiler_args: If not None, this value becomes the new default profiler
             config. Defaults to None.
+        device_policy: If not None, this value becomes the new default policy
+            used to assign GPUs to runs. Defaults to None.
+        backend: If not None, this value becomes the new default compiler
+            backend. Defaults to None.
+        toolkit: If not None, this value becomes the version of the default
+            CUDA toolkit, e.g. "12.2". Defaults to None.
     """
 
     # pylint: disable=global-statement
@@ -50,6 +69,39 @@ def set_defaults(
     global _default_profiler_args
     if profiler_args is not None:
         _default_profiler_args = profiler_args
+    global _default_device_policy
+    if device_policy is not None:
+        _default_device_policy = device_policy
+    global _default_backend
+    if backend is not None:
+        _default_backend = backend
+    global _default_toolkit
+    if toolkit is not None:
+        _default_toolkit = toolkit
+
+
+def split_magic_line(line: str) -> List[str]:
+    """
+    Split the arguments on the line of a magic call. Makes sure to keep
+    arguments between double quotes together for use with profiler arguments
+    or compiler arguments.
+
+    Args:
+        line: The arguments on the line of the magic call in the jupyter cell.
+
+    Returns:
+        The arguments, ready to be parsed.
+    """
+    tokens = line.strip().split('"')
+    args_tokenized: List[str] = []
+    for index, tok in enumerate(tokens):
+        if index % 2 == 0:
+            # tokens found outside double quotes are split at whitespace
+            args_tokenized.extend(tok.split(" "))
+        else:
+            # anything found between double quotes will not be split
+            args_tokenized.append(tok)
+    return [arg for arg in args_tokenized if len(arg) > 0]
 
 
 def str_to_lambda(arg: str) -> Callable[[], str]:
@@ -96,6 +148,46 @@ def get_parser_cuda() -> argparse.ArgumentParser:
         type=str_to_lambda,
         default=lambda: _default_compiler_args,
     )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=lambda arg: class_to_lambda(arg, cls=Backend),
+        default=lambda: _default_backend,
+    )
+    parser.add_argument(
+        "--toolkit", type=str_to_lambda, default=lambda: _default_toolkit
+    )
+    parser.add_argument("--dlto", action="store_true")
+    parser.add_argument("--no-compile-cache", action="store_true")
+    parser.add_argument("--kernel-timing", action="store_true")
+    parser.add_argument(
+        "-D", "--define", dest="defines", action="append", type=str, default=[]
+    )
+    parser.add_argument(
+        "--device-policy",
+        type=lambda arg: class_to_lambda(arg, cls=DevicePolicy),
+        default=lambda: _default_device_policy,
+    )
+    parser.add_argument(
+        "-i", "--in", dest="inputs", action="append", type=str, default=[]
+    )
+    parser.add_argument(
+        "-o", "--out", dest="outputs", action="append", type=str, default=[]
+    )
+    parser.add_argument("--stdin", type=str, default=None)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--max-memory", type=parse_size, default=None)
+    parser.add_argument("--max-cpu", type=int, default=None)
+    parser.add_argument("--out-var", type=str, default=None)
+    parser.add_argument("--max-output", type=int, default=DEFAULT_MAX_OUTPUT)
+    parser.add_argument("-m", "--memoize", action="store_true")
+    parser.add_argument(
+        "--memoize-dep",
+        dest="memoize_deps",
+        action="append",
+        type=str,
+        default=[],
+    )
 
     return parser
 
@@ -129,6 +221,10 @@ def get_parser_cuda_group_save() -> argparse.ArgumentParser:
     )
     parser.add_argument("-n", "--name", type=str, required=True)
     parser.add_argument("-g", "--group", type=str, required=True)
+    parser.add_argument(
+        "-d", "--depends", action="append", dest="depends", default=[]
+    )
+    parser.add_argument("--library", type=str, choices=LIBRARY_TYPES)
     return parser
 
 
@@ -145,3 +241,166 @@ def get_parser_cuda_group_delete() -> argparse.ArgumentParser:
     )
     parser.add_argument("-g", "--group", type=str, required=True)
     return parser
+
+
+def get_parser_cuda_memo_clear() -> argparse.ArgumentParser:
+    """
+    %%cuda_memo_clear magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_memo_clear magic that removes all results stored by runs"
+            " with the --memoize option. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-memo-clear"  # noqa: E501
+            " for usage details."
+        )
+    )
+    return parser
+
+
+def get_parser_cuda_stats() -> argparse.ArgumentParser:
+    """
+    %%cuda_stats magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_stats magic that shows the time spent in each phase of the"
+            " magic commands. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-stats"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("--histograms", action="store_true")
+    parser.add_argument("-r", "--reset", action="store_true")
+    parser.add_argument("-e", "--export", type=str, default=None)
+    parser.add_argument("-s", "--stream", type=str, default=None)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument(
+        "-f", "--format", type=str, choices=EXPORT_FORMATS, default="jsonl"
+    )
+    return parser
+
+
+def get_parser_cuda_group_snapshot() -> argparse.ArgumentParser:
+    """
+    %%cuda_group_snapshot magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_group_snapshot magic that saves an immutable snapshot of"
+            " the source files of a group. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-group-snapshot"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("-g", "--group", type=str, required=True)
+    parser.add_argument("-s", "--snapshot", type=str, required=True)
+    return parser
+
+
+def get_parser_cuda_group_restore() -> argparse.ArgumentParser:
+    """
+    %%cuda_group_restore magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_group_restore magic that replaces the source files of a"
+            " group with those of a snapshot. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-group-restore"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("-s", "--snapshot", type=str, required=True)
+    parser.add_argument("-g", "--group", type=str, default=None)
+    return parser
+
+
+def get_parser_cuda_snapshots() -> argparse.ArgumentParser:
+    """
+    %%cuda_snapshots magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_snapshots magic that lists or deletes group snapshots. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-snapshots"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("-d", "--delete", type=str, default=None)
+    return parser
+
+
+def get_parser_cuda_precompile() -> argparse.ArgumentParser:
+    """
+    %%cuda_precompile magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_precompile magic that compiles the CUDA programs of all"
+            " cells of a notebook ahead of time. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-precompile"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("notebook", type=str)
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    return parser
+
+
+def get_parser_cuda_toolkits() -> argparse.ArgumentParser:
+    """
+    %%cuda_toolkits magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_toolkits magic that lists the installed CUDA toolkits. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-toolkits"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument("-r", "--refresh", action="store_true")
+    return parser
+
+
+def get_parser_cuda_profile_batch() -> argparse.ArgumentParser:
+    """
+    %%cuda_profile_batch magic command parser.
+    """
+    parser = argparse.ArgumentParser(
+        description=(
+            "%%cuda_profile_batch magic that profiles the programs of several"
+            " groups, with several sets of arguments, concurrently. See"
+            " https://nvcc4jupyter.readthedocs.io/en/latest/magics.html#cuda-profile-batch"  # noqa: E501
+            " for usage details."
+        )
+    )
+    parser.add_argument(
+        "-g", "--group", dest="groups", action="append", required=True
+    )
+    parser.add_argument(
+        "--args", dest="program_args", action="append", default=[]
+    )
+    parser.add_argument(
+        "-l", "--profiler", dest="profilers", action="append", type=Profiler
+    )
+    # used when no profiler is given
+    parser.set_defaults(default_profiler=lambda: _default_profiler)
+    parser.add_argument(
+        "-a",
+        "--profiler-args",
+        type=str_to_lambda,
+        default=lambda: _default_profiler_args,
+    )
+    parser.add_argument(
+        "-c",
+        "--compiler-args",
+        type=str_to_lambda,
+        default=lambda: _default_compiler_args,
+    )
+    parser.add_argument(
+        "--toolkit", type=str_to_lambda, default=lambda: _default_toolkit
+    )
+    parser.add_argument("--max-jobs-per-device", type=int, default=None)
+    parser.add_argument("--columns", type=str, default=None)
+    parser.add_argument("--out-var", type=str, default=None)
+    return parser
@@ -4,7 +4,7 @@ Helper functions relating to file paths.
 
 import os
 from glob import glob
-from typing import List, Optional
+from typing import Collection, List, Optional
 
 CUDA_SEARCH_PATHS: List[str] = [
     "/opt/nvidia/nsight-compute",
@@ -13,6 +13,8 @@ CUDA_SEARCH_PATHS: List[str] = [
     "/usr",
 ]
 
+CACHE_DIR_ENV = "NVCC4JUPYTER_CACHE_DIR"
+
 
 def is_executable(fpath: str) -> bool:
     """Check if file exists and is executable"""
@@ -59,3 +61,58 @@ def find_executable(
             return exec_path
 
     return None
+
+
+def get_cache_dir(*subdirs: str) -> str:
+    """
+    Get the directory where nvcc4jupyter keeps data that should persist
+    between notebook sessions. Can be changed through the
+    NVCC4JUPYTER_CACHE_DIR environment variable and otherwise follows the
+    XDG base directory specification. The directory is not created.
+
+    Args:
+        subdirs: Names of nested directories inside the cache directory.
+
+    Returns:
+        The path of the (nested) cache directory.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cache_dir = os.path.join(xdg_cache_home, "nvcc4jupyter")
+    return os.path.join(cache_dir, *subdirs)
+
+
+def evict_least_recently_used(
+    dirpath: str,
+    max_bytes: int,
+    suffix: str = "",
+    keep: Collection[str] = (),
+) -> None:
+    """
+    Remove the least recently modified files of a cache directory until
+    their total size is within a limit.
+
+    Args:
+        dirpath: The cache directory.
+        max_bytes: The maximum total size of the files.
+        suffix: Only files whose name ends with it are considered. Defaults
+            to an empty string.
+        keep: The paths of files that are in use and never removed, even if
+            the limit is exceeded. Defaults to an empty tuple.
+    """
+    if not os.path.isdir(dirpath):
+        return
+    with os.scandir(dirpath) as it:
+        entries = [e for e in it if e.is_file() and e.name.endswith(suffix)]
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    total_bytes = sum(e.stat().st_size for e in entries)
+    for entry in entries:
+        if total_bytes <= max_bytes:
+            break
+        if entry.path in keep:
+            continue
+        total_bytes -= entry.stat().st_size
+        os.remove(entry.path)
@@ -2,31 +2,105 @@
 nvcc4jupyter: CUDA C++ plugin for Jupyter Notebook
 """
 
+# pylint: disable=too-many-lines
+
 import argparse
-import glob
+import json
 import os
 import shutil
+import signal
 import subprocess
 import tempfile
+import threading
+import time
 import uuid
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import IO, Any, Dict, List, Optional, Tuple
 
 # pylint: disable=import-error
 from IPython.core.interactiveshell import InteractiveShell
 from IPython.core.magic import Magics, cell_magic, line_magic, magics_class
 
+from .arrays import SharedArrays, bind_arrays
+from .backends import Backend, CompileArtifact
+from .build import (
+    LibraryBuilder,
+    read_group_metadata,
+    write_group_metadata,
+)
+from .devices import DevicePolicy, DeviceScheduler
+from .groups import (
+    DEFAULT_EXEC_FNAME,
+    SHARED_GROUP_NAME,
+    compile_group,
+    save_source,
+)
+from .kernel_timing import (
+    KERNEL_TIMING_COMPILER_ARGS,
+    KERNEL_TIMING_FILE_ENV,
+    build_timing_shim,
+    format_kernel_timings,
+    kernel_timing_env,
+    kernel_timing_fpath,
+    read_kernel_timings,
+)
+from .memo import MemoStore, memo_key
+from .notebook import (
+    CELL_GROUP_NAME,
+    CELL_SOURCE_NAME,
+    PrecompileJob,
+    scan_notebook,
+)
+from .output import (
+    DEFAULT_MAX_OUTPUT,
+    READ_CHUNK_BYTES,
+    OutputSink,
+    format_bytes,
+)
 from .parsers import (
     Profiler,
     get_parser_cuda,
     get_parser_cuda_group_delete,
+    get_parser_cuda_group_restore,
     get_parser_cuda_group_run,
     get_parser_cuda_group_save,
+    get_parser_cuda_group_snapshot,
+    get_parser_cuda_memo_clear,
+    get_parser_cuda_precompile,
+    get_parser_cuda_profile_batch,
+    get_parser_cuda_snapshots,
+    get_parser_cuda_stats,
+    get_parser_cuda_toolkits,
+    split_magic_line,
 )
-from .path_utils import CUDA_SEARCH_PATHS, find_executable
-from .setup_env import setup_environment
-
-DEFAULT_EXEC_FNAME = "cuda_exec.out"
-SHARED_GROUP_NAME = "shared"
+from .path_utils import CUDA_SEARCH_PATHS, find_executable, get_cache_dir
+from .processes import (
+    RunInterrupted,
+    RunLimits,
+    RunTimedOut,
+    Watchdog,
+    kill_process_group,
+    popen_kwargs,
+)
+from .profiling import (
+    DEFAULT_MAX_JOBS_PER_DEVICE,
+    ProfileBatch,
+    ProfileJob,
+    batch_profiler_args,
+    profile_batch,
+)
+from .results import RunResult
+from .setup_env import setup_environment, wait_for_setup
+from .snapshots import SnapshotStore
+from .specialize import (
+    define_compiler_args,
+    resolve_defines,
+    specialize_source,
+)
+from .stats import PhaseStats, timed
+from .stdin import StdinWriter
+from .toolkits import Toolkit, ToolkitIndex, nvcc_command
 
 
 def print_out(out: str):
@@ -36,7 +110,7 @@ def print_out(out: str):
 
 
 @magics_class
-class NVCCPlugin(Magics):
+class NVCCPlugin(Magics):  # pylint: disable=too-many-public-methods
     """
     CUDA C++ plugin for Jupyter Notebook
     """
@@ -45,19 +119,93 @@ class NVCCPlugin(Magics):
         super().__init__(shell)
         self.shell: InteractiveShell  # type hint not provided by parent class
 
-        self.parser_cuda = get_parser_cuda()
-        self.parser_cuda_group_save = get_parser_cuda_group_save()
-        self.parser_cuda_group_delete = get_parser_cuda_group_delete()
-        self.parser_cuda_group_run = get_parser_cuda_group_run()
-
-        self.workdir = tempfile.mkdtemp()
-        print(f'Source files will be saved in "{self.workdir}".')
-
         self.profiler_paths: Dict[Profiler, Optional[str]] = {
             Profiler.NCU: None,
             Profiler.NSYS: None,
         }
 
+        self.memo_store = MemoStore(get_cache_dir("memo"))
+        self.snapshot_store = SnapshotStore(get_cache_dir("snapshots"))
+        self.stats = PhaseStats()
+        self.device_scheduler = DeviceScheduler()
+        self.toolkit_index = ToolkitIndex(get_cache_dir("toolkits.json"))
+
+    # the parsers and the working directory are created on first use to keep
+    # loading the extension fast
+
+    @cached_property
+    def parser_cuda(self) -> argparse.ArgumentParser:
+        """%%cuda magic command parser."""
+        return get_parser_cuda()
+
+    @cached_property
+    def parser_cuda_group_save(self) -> argparse.ArgumentParser:
+        """%%cuda_group_save magic command parser."""
+        return get_parser_cuda_group_save()
+
+    @cached_property
+    def parser_cuda_group_delete(self) -> argparse.ArgumentParser:
+        """%%cuda_group_delete magic command parser."""
+        return get_parser_cuda_group_delete()
+
+    @cached_property
+    def parser_cuda_group_run(self) -> argparse.ArgumentParser:
+        """%%cuda_group_run magic command parser."""
+        return get_parser_cuda_group_run()
+
+    @cached_property
+    def parser_cuda_memo_clear(self) -> argparse.ArgumentParser:
+        """%%cuda_memo_clear magic command parser."""
+        return get_parser_cuda_memo_clear()
+
+    @cached_property
+    def parser_cuda_stats(self) -> argparse.ArgumentParser:
+        """%%cuda_stats magic command parser."""
+        return get_parser_cuda_stats()
+
+    @cached_property
+    def parser_cuda_group_snapshot(self) -> argparse.ArgumentParser:
+        """%%cuda_group_snapshot magic command parser."""
+        return get_parser_cuda_group_snapshot()
+
+    @cached_property
+    def parser_cuda_group_restore(self) -> argparse.ArgumentParser:
+        """%%cuda_group_restore magic command parser."""
+        return get_parser_cuda_group_restore()
+
+    @cached_property
+    def parser_cuda_snapshots(self) -> argparse.ArgumentParser:
+        """%%cuda_snapshots magic command parser."""
+        return get_parser_cuda_snapshots()
+
+    @cached_property
+    def parser_cuda_precompile(self) -> argparse.ArgumentParser:
+        """%%cuda_precompile magic command parser."""
+        return get_parser_cuda_precompile()
+
+    @cached_property
+    def parser_cuda_toolkits(self) -> argparse.ArgumentParser:
+        """%%cuda_toolkits magic command parser."""
+        return get_parser_cuda_toolkits()
+
+    @cached_property
+    def parser_cuda_profile_batch(self) -> argparse.ArgumentParser:
+        """%%cuda_profile_batch magic command parser."""
+        return get_parser_cuda_profile_batch()
+
+    @cached_property
+    def workdir(self) -> str:
+        """Directory where the source files of all groups are saved."""
+        workdir = tempfile.mkdtemp()
+        print(f'Source files will be saved in "{workdir}".')
+        return workdir
+
+    @cached_property
+    def library_builder(self) -> LibraryBuilder:
+        """Builds the groups that other groups depend on into libraries."""
+        return LibraryBuilder(self.workdir)
+
+    @timed("save_source")
     def _save_source(
         self, source_name: str, source_code: str, group_name: str
     ) -> None:
@@ -77,16 +225,41 @@ class NVCCPlugin(Magics):
         Raises:
             ValueError: If the source name does not have a proper extension.
         """
-        _, ext = os.path.splitext(source_name)
-        if ext not in (".cu", ".h"):
+        save_source(self.workdir, group_name, source_name, source_code)
+
+    def _update_group_metadata(
+        self,
+        group_name: str,
+        depends: List[str],
+        library: Optional[str] = None,
+    ) -> None:
+        """
+        Add dependencies to a group and set the type of library it is built
+        as when other groups depend on it.
+
+        Args:
+            group_name: The name of the group.
+            depends: The names of the groups that the group depends on.
+            library: Either "static" or "shared", or None to keep the current
+                library type. Defaults to None.
+
+        Raises:
+            ValueError: If a dependency is the "shared" group, which is
+                already compiled into every executable.
+        """
+        if SHARED_GROUP_NAME in depends:
             raise ValueError(
-                f'Given source name "{source_name}" must end in ".h" or ".cu".'
+                f'Groups cannot depend on the "{SHARED_GROUP_NAME}" group'
+                " since its source files are compiled with every group."
             )
         group_dirpath = os.path.join(self.workdir, group_name)
-        os.makedirs(group_dirpath, exist_ok=True)
-        source_fpath = os.path.join(group_dirpath, source_name)
-        with open(source_fpath, "w", encoding="utf-8") as f:
-            f.write(source_code)
+        metadata = read_group_metadata(group_dirpath)
+        for dependency in depends:
+            if dependency not in metadata["depends"]:
+                metadata["depends"].append(dependency)
+        if library is not None:
+            metadata["library"] = library
+        write_group_metadata(group_dirpath, metadata)
 
     def _delete_group(self, group_name: str) -> None:
         """
@@ -99,63 +272,113 @@ class NVCCPlugin(Magics):
         if os.path.exists(group_dirpath):
             shutil.rmtree(group_dirpath)
 
-    def _compile(
+    def _compile(  # pylint: disable=too-many-arguments
         self,
         group_name: str,
         executable_fname: str = DEFAULT_EXEC_FNAME,
         compiler_args: str = "",
+        dlto: bool = False,
+        backend: Backend = Backend.NVCC,
+        use_cache: bool = True,
+        toolkit: Optional[str] = None,
     ) -> str:
         """
         Compiles all source files in a given group together with all source
-        files from the group named "shared".
+        files from the group named "shared". See "_compile_artifact" for the
+        arguments.
+
+        Returns:
+            The file path of the resulted executable file.
+        """
+        return self._compile_artifact(
+            group_name,
+            executable_fname,
+            compiler_args,
+            dlto,
+            backend,
+            use_cache,
+            toolkit,
+        ).path
+
+    @timed("compile")
+    def _compile_artifact(  # pylint: disable=too-many-arguments
+        self,
+        group_name: str,
+        executable_fname: str = DEFAULT_EXEC_FNAME,
+        compiler_args: str = "",
+        dlto: bool = False,
+        backend: Backend = Backend.NVCC,
+        use_cache: bool = True,
+        toolkit: Optional[str] = None,
+    ) -> CompileArtifact:
+        """
+        Compiles all source files in a given group together with all source
+        files from the group named "shared". The groups it depends on are
+        first built into libraries which are linked into the executable.
 
         Args:
             group_name: The name of the source file group to be compiled.
             executable_fname: The output executable file name. Defaults to
                 "cuda_exec.out".
-            compiler_args: The optional "nvcc" compiler arguments.
+            compiler_args: The optional compiler arguments.
+            dlto: If True, every source file is compiled separately to a
+                cached object and the device code of all of them is
+                optimized together when linking. Defaults to False.
+            backend: The compiler backend. Defaults to Backend.NVCC.
+            use_cache: If True, an artifact compiled earlier by the same
+                backend and toolkit from identical files and arguments is
+                reused. Defaults to True.
+            toolkit: The version of the CUDA toolkit to compile with, see
+                "ToolkitIndex.select". Defaults to None, which uses the
+                toolkit of the "nvcc" found through the PATH environment
+                variable.
 
         Raises:
-            RuntimeError: If the group does not exist or if does not have any
-                source files associated with it.
+            RuntimeError: If the group does not exist, if it does not have any
+                source files associated with it, if its dependencies are
+                missing or form a cycle or if the backend does not support
+                the requested build.
+            ValueError: If the requested toolkit is not installed.
+            subprocess.CalledProcessError: If the compilation failed.
 
         Returns:
-            The file path of the resulted executable file.
+            The compiled artifact.
         """
-        shared_dirpath = os.path.join(self.workdir, SHARED_GROUP_NAME)
-        group_dirpath = os.path.join(self.workdir, group_name)
-        if not os.path.exists(group_dirpath):
-            raise RuntimeError(f'Group "{group_name}" does not exist.')
-
-        source_files = list(glob.glob(os.path.join(group_dirpath, "*.cu")))
-        if len(source_files) == 0:
-            raise RuntimeError(
-                f'Group "{group_name}" does not have any source files.'
-            )
-        source_files.extend(
-            list(glob.glob(os.path.join(shared_dirpath, "*.cu")))
+        return compile_group(
+            self.workdir,
+            group_name,
+            executable_fname,
+            compiler_args,
+            dlto,
+            backend,
+            use_cache,
+            self._select_toolkit(toolkit),
+            self.library_builder,
+            self.stats,
         )
 
-        executable_fpath = os.path.join(group_dirpath, executable_fname)
-
-        args = ["nvcc"]
-        args.extend(compiler_args.split())
-        args.append("-I" + shared_dirpath + "," + group_dirpath)
-        args.extend(source_files)
-        args.extend(["-o", executable_fpath, "-Wno-deprecated-gpu-targets"])
-
-        subprocess.check_output(args, stderr=subprocess.STDOUT)
-
-        return executable_fpath
+    def _select_toolkit(self, version: Optional[str]) -> Optional[Toolkit]:
+        """
+        Choose the CUDA toolkit to compile with, see "ToolkitIndex.select",
+        after the platform setup had the chance to install one.
+        """
+        wait_for_setup()
+        return self.toolkit_index.select(version)
 
-    def _get_profiler_path(self, profiler: Profiler) -> str:
+    @timed("get_profiler_path")
+    def _get_profiler_path(
+        self, profiler: Profiler, toolkit: Optional[Toolkit] = None
+    ) -> str:
         """
-        Get the path of the executable of a given profiling tool. Searches
-        the directories of the PATH environment variable and some extra
+        Get the path of the executable of a given profiling tool. Uses the
+        one installed with the toolkit, if any, and otherwise searches the
+        directories of the PATH environment variable and some extra
         directories where CUDA is usually installed.
 
         Args:
             profiler: The profiler whose executable should be found.
+            toolkit: The CUDA toolkit the profiled program was compiled with.
+                Defaults to None.
 
         Raises:
             RuntimeError: If the profiler executable could not be found.
@@ -163,10 +386,14 @@ class NVCCPlugin(Magics):
         Returns:
             The file path of the executable.
         """
+        if toolkit is not None and getattr(toolkit, profiler.value):
+            return getattr(toolkit, profiler.value)
+
         profiler_path = self.profiler_paths[profiler]
         if profiler_path is not None:
             return profiler_path
 
+        wait_for_setup()
         profiler_path = find_executable(profiler.value, CUDA_SEARCH_PATHS)
         if profiler_path is None:
             raise RuntimeError(
@@ -178,6 +405,99 @@ class NVCCPlugin(Magics):
         self.profiler_paths[profiler] = profiler_path
         return profiler_path
 
+    def _precompile_job(self, job: PrecompileJob) -> CompileArtifact:
+        """
+        Compile the program of a notebook cell into the compile cache. The
+        groups are recreated as they are when the cell runs, in a separate
+        working directory that is removed afterwards.
+
+        Args:
+            job: The program found in the notebook.
+
+        Returns:
+            The compiled artifact.
+        """
+        workdir = tempfile.mkdtemp()
+        try:
+            for group_name, files in job.sources.items():
+                for source_name, source_code in files.items():
+                    save_source(workdir, group_name, source_name, source_code)
+                if group_name in job.metadata:
+                    write_group_metadata(
+                        os.path.join(workdir, group_name),
+                        job.metadata[group_name],
+                    )
+            return compile_group(
+                workdir,
+                job.group_name,
+                compiler_args=self._compiler_args(job.args),
+                dlto=job.args.dlto,
+                backend=job.args.backend(),
+                toolkit=self._select_toolkit(job.args.toolkit()),
+                stats=self.stats,
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _precompile_jobs(
+        self,
+        jobs: List[PrecompileJob],
+        max_workers: Optional[int],
+        failed: List[Tuple[int, str]],
+    ) -> Tuple[int, int]:
+        """
+        Compile the programs of notebook cells in parallel.
+
+        Args:
+            jobs: The programs found in the notebook.
+            max_workers: How many programs are compiled at the same time.
+            failed: The cell index and error of every program that failed to
+                compile are appended to this list.
+
+        Returns:
+            The number of compiled programs and how many of them were found
+            in the compile cache.
+        """
+        compiled = cached = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._precompile_job, job): job for job in jobs
+            }
+            for future, job in futures.items():
+                try:
+                    artifact = future.result()
+                except subprocess.CalledProcessError as e:
+                    failed.append((job.cell_index, e.output.decode("utf8")))
+                    continue
+                except (RuntimeError, ValueError) as e:
+                    failed.append((job.cell_index, str(e)))
+                    continue
+                compiled += 1
+                cached += artifact.cached
+        return compiled, cached
+
+    def _get_run_args(  # pylint: disable=too-many-arguments
+        self,
+        exec_fpath: str,
+        profile: bool = False,
+        profiler: Profiler = Profiler.NCU,
+        profiler_args: str = "",
+        toolkit: Optional[Toolkit] = None,
+        program_args: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Get the command line that runs an executable, possibly under a
+        profiler. See "_run" and "_run_result" for the meaning of the
+        arguments.
+        """
+        run_args = []
+        if profile:
+            profiler_path = self._get_profiler_path(profiler, toolkit)
+            run_args.extend([profiler_path] + profiler_args.split())
+        run_args.append(exec_fpath)
+        run_args.extend(program_args or [])
+        return run_args
+
     def _run(  # pylint: disable=too-many-arguments
         self,
         exec_fpath: str,
@@ -185,6 +505,7 @@ class NVCCPlugin(Magics):
         profile: bool = False,
         profiler: Profiler = Profiler.NCU,
         profiler_args: str = "",
+        env: Optional[Dict[str, str]] = None,
     ) -> str:
         """
         Runs a CUDA executable.
@@ -200,53 +521,561 @@ class NVCCPlugin(Magics):
             profiler_args: The profiler arguments used to customize the
                 information gathered by it and its overall behaviour. Defaults
                 to an empty string.
+            env: Extra environment variables for the CUDA process. Defaults
+                to None.
+
+        Raises:
+            subprocess.CalledProcessError: If the CUDA process exits with a
+                non-zero return code.
 
         Returns:
             The standard output of the CUDA process or the "timeit" magic
             output.
         """
+        result = self._run_result(
+            exec_fpath=exec_fpath,
+            timeit=timeit,
+            profile=profile,
+            profiler=profiler,
+            profiler_args=profiler_args,
+            env=env,
+        )
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, exec_fpath, output=result.output.encode()
+            )
+        return result.output
+
+    @timed("run")
+    def _run_result(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        exec_fpath: str,
+        timeit: bool = False,
+        profile: bool = False,
+        profiler: Profiler = Profiler.NCU,
+        profiler_args: str = "",
+        env: Optional[Dict[str, str]] = None,
+        separate_stderr: bool = False,
+        device_policy: DevicePolicy = DevicePolicy.NONE,
+        max_output: int = DEFAULT_MAX_OUTPUT,
+        toolkit: Optional[Toolkit] = None,
+        program_args: Optional[List[str]] = None,
+        log_fpath: Optional[str] = None,
+        stdin: Any = None,
+        limits: Optional[RunLimits] = None,
+    ) -> RunResult:
+        """
+        Runs a CUDA executable and collects its output, return code and run
+        time. Takes the same arguments as "_run", plus:
+
+        Args:
+            separate_stderr: If True, standard error is captured separately
+                instead of being interleaved with standard output. Defaults to
+                False.
+            device_policy: How to choose the GPU the executable runs on. No
+                GPU is assigned if the CUDA_VISIBLE_DEVICES environment
+                variable is already set. Defaults to DevicePolicy.NONE.
+            max_output: How many characters of output are kept in the
+                result. Longer output is cut in the middle, and the full
+                standard output is kept in a log file next to the
+                executable. Defaults to DEFAULT_MAX_OUTPUT.
+            toolkit: The CUDA toolkit the executable was compiled with, whose
+                profilers are used. Defaults to None.
+            program_args: Command line arguments of the executable. Defaults
+                to None.
+            log_fpath: The file the full standard output is written to.
+                Defaults to None, which uses the executable path followed by
+                ".log".
+            stdin: What is streamed to the standard input of the executable,
+                see "iter_chunks". Defaults to None, which does not connect
+                the standard input.
+            limits: The timeout and resource limits of the run, which apply
+                to the profiler as well. Defaults to None.
+
+        Raises:
+            RunInterrupted: If the run was interrupted. The executable and
+                every process it started are stopped first.
+
+        Returns:
+            The result of the run. A non-zero return code does not raise.
+        """
+        if "CUDA_VISIBLE_DEVICES" in os.environ or (
+            env is not None and "CUDA_VISIBLE_DEVICES" in env
+        ):
+            device_policy = DevicePolicy.NONE
+
+        with self.device_scheduler.assign(device_policy) as device:
+            if device is not None:
+                env = dict(env or {})
+                env["CUDA_VISIBLE_DEVICES"] = device
+            return self._run_process(
+                exec_fpath,
+                timeit,
+                self._get_run_args(
+                    exec_fpath,
+                    profile,
+                    profiler,
+                    profiler_args,
+                    toolkit,
+                    program_args,
+                ),
+                env,
+                separate_stderr,
+                max_output,
+                log_fpath or exec_fpath + ".log",
+                stdin,
+                limits,
+            )
+
+    def _run_process(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        exec_fpath: str,
+        timeit: bool,
+        run_args: List[str],
+        env: Optional[Dict[str, str]],
+        separate_stderr: bool,
+        max_output: int,
+        log_fpath: str,
+        stdin: Any = None,
+        limits: Optional[RunLimits] = None,
+    ) -> RunResult:
+        run_env = None
+        if env:
+            run_env = dict(os.environ)
+            run_env.update(env)
+
         if timeit:
-            stmt = (
-                f"subprocess.check_output(['{exec_fpath}'],"
-                " stderr=subprocess.STDOUT)"
+            return self._timeit_result(exec_fpath, run_env, limits)
+
+        limits = limits or RunLimits()
+        stdout_sink = OutputSink(log_fpath, max_output)
+        stderr_sink = OutputSink(None, max_output)
+        start = time.perf_counter()
+        with stdout_sink, stderr_sink:
+            with (
+                subprocess.Popen(
+                    run_args,
+                    stdin=subprocess.PIPE if stdin is not None else None,
+                    stdout=subprocess.PIPE,
+                    stderr=(
+                        subprocess.PIPE
+                        if separate_stderr
+                        else subprocess.STDOUT
+                    ),
+                    env=run_env,
+                    **popen_kwargs(limits),
+                ) as process,
+                Watchdog(process, limits.timeout) as watchdog,
+            ):
+                interrupted, stdin_writer = _communicate(
+                    process, stdin, stdout_sink, stderr_sink
+                )
+        run_time = time.perf_counter() - start
+
+        stopped = None
+        if interrupted:
+            stopped = "interrupt"
+        elif watchdog.expired:
+            stopped = "timeout"
+        elif process.returncode == -signal.SIGXCPU:
+            stopped = "cpu-limit"
+        result = RunResult(
+            stdout=stdout_sink.text(),
+            stderr=stderr_sink.text(),
+            returncode=process.returncode,
+            run_time=run_time,
+            executable_path=exec_fpath,
+            log_path=stdout_sink.log_fpath,
+            output_bytes=stdout_sink.total_bytes,
+            truncated=stdout_sink.truncated,
+            stopped=stopped,
+        )
+        if interrupted:
+            raise RunInterrupted(result)
+        if stdin_writer is not None:
+            stdin_writer.check()
+        return result
+
+    def _timeit_result(
+        self,
+        exec_fpath: str,
+        run_env: Optional[Dict[str, str]],
+        limits: Optional[RunLimits],
+    ) -> RunResult:
+        """Time the runs of an executable with the "timeit" magic."""
+        stmt = (
+            f"check_output(['{exec_fpath}'], env={run_env!r},"
+            f" limits={limits!r})"
+        )
+        timeit_result = self.shell.run_cell_magic(
+            magic_name="timeit",
+            line=(
+                "-q -o from nvcc4jupyter.processes import RunLimits,"
+                " check_output"
+            ),
+            cell=stmt,
+        )
+        # convert TimeitResult object to human readable string
+        return RunResult(
+            stdout=str(timeit_result),
+            run_time=timeit_result.average,
+            executable_path=exec_fpath,
+        )
+
+    def _profile_batch(
+        self,
+        jobs: List[ProfileJob],
+        max_jobs_per_device: int = DEFAULT_MAX_JOBS_PER_DEVICE,
+        toolkit: Optional[Toolkit] = None,
+    ) -> ProfileBatch:
+        """
+        Profile many runs concurrently, spread over the GPUs of the host.
+        Nsight Compute runs get a GPU to themselves, see "profile_batch".
+        The GPUs are held through the state file of the device scheduler, so
+        runs of other notebooks are taken into account. If the
+        CUDA_VISIBLE_DEVICES environment variable is set, or no GPUs are
+        found, all runs use the default GPU and only the runs of this batch
+        are taken into account.
+
+        Args:
+            jobs: The runs to profile.
+            max_jobs_per_device: How many runs share a GPU at most. Defaults
+                to DEFAULT_MAX_JOBS_PER_DEVICE.
+            toolkit: The CUDA toolkit the executables were compiled with,
+                whose profilers are used. Defaults to None.
+
+        Returns:
+            The outcomes of the runs, in the order of the jobs.
+        """
+        assign_devices = "CUDA_VISIBLE_DEVICES" not in os.environ and bool(
+            self.device_scheduler.devices
+        )
+
+        def run(index: int, job: ProfileJob, device: str):
+            # every run gets its own output files
+            base_fpath = f"{job.exec_fpath}.batch-{index}"
+            env = dict(job.env or {})
+            if assign_devices:
+                env["CUDA_VISIBLE_DEVICES"] = device
+            return self._run_result(
+                exec_fpath=job.exec_fpath,
+                profile=True,
+                profiler=job.profiler,
+                profiler_args=batch_profiler_args(job, base_fpath),
+                env=env or None,
+                toolkit=toolkit,
+                program_args=job.program_args,
+                log_fpath=base_fpath + ".log",
             )
-            output = self.shell.run_cell_magic(
-                magic_name="timeit", line="-q -o import subprocess", cell=stmt
+
+        if assign_devices:
+            scheduler = DeviceScheduler(
+                self.device_scheduler.state_fpath,
+                enumerate_devices=lambda: self.device_scheduler.devices,
+                max_jobs_per_device=max_jobs_per_device,
             )
-            # convert TimeitResult object to human readable string
-            output = str(output)
-        else:
-            run_args = []
-            if profile:
-                profiler_path = self._get_profiler_path(profiler)
-                run_args.extend([profiler_path] + profiler_args.split())
-            run_args.append(exec_fpath)
-            output = subprocess.check_output(
-                run_args, stderr=subprocess.STDOUT
+            return profile_batch(jobs, run, scheduler)
+        # a single pseudo GPU whose leases only this batch sees
+        with tempfile.TemporaryDirectory() as dirpath:
+            scheduler = DeviceScheduler(
+                os.path.join(dirpath, "devices.json"),
+                enumerate_devices=lambda: ["default"],
+                max_jobs_per_device=max_jobs_per_device,
             )
-            output = output.decode("utf8")
+            return profile_batch(jobs, run, scheduler)
+
+    def _bind_arrays(
+        self, group_name: str, args: argparse.Namespace
+    ) -> Optional[SharedArrays]:
+        """
+        Create the shared memory arrays requested with the --in and --out
+        options and write the header that maps them into the program to the
+        group directory.
+
+        Args:
+            group_name: The name of the group that will be compiled.
+            args: The parsed magic arguments.
+
+        Returns:
+            The shared arrays, or None if no arrays were requested.
+        """
+        if not args.inputs and not args.outputs:
+            return None
+        arrays = bind_arrays(self.shell.user_ns, args.inputs, args.outputs)
+        group_dirpath = os.path.join(self.workdir, group_name)
+        os.makedirs(group_dirpath, exist_ok=True)
+        arrays.write_header(group_dirpath)
+        return arrays
 
-        return output
+    def _stdin_source(self, args: argparse.Namespace) -> Any:
+        """
+        Get the notebook variable given with the --stdin option.
+
+        Raises:
+            ValueError: If the variable is not defined in the notebook.
+            RuntimeError: If the --timeit option is set, because every timed
+                run would need the input anew.
+
+        Returns:
+            The source of the standard input, or None if the option was not
+            given.
+        """
+        if args.stdin is None:
+            return None
+        if args.timeit:
+            raise RuntimeError(
+                "Standard input is not supported together with --timeit."
+            )
+        if args.stdin not in self.shell.user_ns:
+            raise ValueError(
+                f'Variable "{args.stdin}" is not defined in the notebook.'
+            )
+        return self.shell.user_ns[args.stdin]
+
+    def _defines(self, args: argparse.Namespace) -> Dict[str, str]:
+        """
+        Get the values of the notebook variables given with the --define
+        option, formatted as C++ source code.
+
+        Raises:
+            ValueError: If a variable is not defined or its value cannot be
+                used at compile time.
+        """
+        return resolve_defines(self.shell.user_ns, args.defines)
+
+    def _compiler_args(self, args: argparse.Namespace) -> str:
+        """
+        Get the compiler arguments of a run, including the macros given with
+        the --define option and those needed to time its kernel launches if
+        the --kernel-timing option is set.
+
+        Raises:
+            RuntimeError: If kernel timing is not supported by the backend.
+            ValueError: If the requested toolkit is not installed or a define
+                cannot be resolved.
+        """
+        compiler_args = args.compiler_args()
+        define_args = define_compiler_args(self._defines(args))
+        compiler_args = f"{compiler_args} {define_args}".strip()
+        if not args.kernel_timing:
+            return compiler_args
+        if args.backend() != Backend.NVCC:
+            raise RuntimeError(
+                "Kernel timing is not supported by the"
+                f' "{args.backend().value}" backend.'
+            )
+        compiler_args = f"{compiler_args} {KERNEL_TIMING_COMPILER_ARGS}"
+        toolkit = self._select_toolkit(args.toolkit())
+        if toolkit is not None:
+            # the shared CUDA runtime of the toolkit the program was built with
+            lib_dirpath = os.path.join(toolkit.root, "lib64")
+            compiler_args += f" -Xlinker -rpath={lib_dirpath}"
+        return compiler_args.strip()
+
+    def _kernel_timing_env(
+        self, exec_fpath: str, toolkit: Optional[Toolkit]
+    ) -> Dict[str, str]:
+        """
+        Get the environment variables that make an executable write the
+        launch counts and GPU times of its kernels to the file given by
+        "kernel_timing_fpath". The library that times the launches is built
+        on first use.
+
+        Args:
+            exec_fpath: The file path of the executable.
+            toolkit: The CUDA toolkit the executable was compiled with.
+
+        Raises:
+            subprocess.CalledProcessError: If the library failed to compile.
+        """
+        shim_fpath = build_timing_shim(
+            get_cache_dir("kernel_timing"),
+            [nvcc_command(toolkit), "-shared", "-Xcompiler", "-fPIC"],
+        )
+        return kernel_timing_env(shim_fpath, kernel_timing_fpath(exec_fpath))
+
+    def _run_memoized(  # pylint: disable=too-many-arguments
+        self,
+        exec_fpath: str,
+        args: argparse.Namespace,
+        env: Optional[Dict[str, str]] = None,
+        toolkit: Optional[Toolkit] = None,
+        stdin: Any = None,
+    ) -> RunResult:
+        """
+        Run an executable with the options given to the magic, within the
+        limits given by the --timeout, --max-memory and --max-cpu options.
+        If the --memoize option is set, a stored result of an identical
+        earlier run is replayed instead, and successful results are stored
+        for later.
+
+        Args:
+            exec_fpath: The file path of the executable.
+            args: The parsed magic arguments.
+            env: Extra environment variables for the CUDA process. Defaults
+                to None.
+            toolkit: The CUDA toolkit the executable was compiled with.
+                Defaults to None.
+            stdin: What is streamed to the standard input of the executable.
+                Runs with standard input are not memoized. Defaults to None.
+
+        Returns:
+            The result of the run.
+        """
+        timing_fpath = kernel_timing_fpath(exec_fpath)
+        if args.kernel_timing:
+            env = {
+                **(env or {}),
+                **self._kernel_timing_env(exec_fpath, toolkit),
+            }
+
+        key = None
+        # timed runs must really run, output arrays must be written anew and
+        # the standard input cannot be read twice
+        memoize = args.memoize and not args.timeit and not args.outputs
+        if memoize and stdin is None:
+            argv = self._get_run_args(
+                exec_fpath,
+                args.profile,
+                args.profiler(),
+                args.profiler_args(),
+                toolkit,
+            )
+            fingerprint = ""
+            if toolkit is not None:
+                tools = ["nvcc"]
+                if args.profile:
+                    tools.append(args.profiler().value)
+                fingerprint = toolkit.fingerprint(tools)
+            # the timing file is not an input of the run
+            key_env = env
+            if env is not None and KERNEL_TIMING_FILE_ENV in env:
+                key_env = dict(env, **{KERNEL_TIMING_FILE_ENV: ""})
+            key = memo_key(
+                exec_fpath, argv, key_env, args.memoize_deps, fingerprint
+            )
+            result = self.memo_store.get(key)
+            if result is not None:
+                result.executable_path = exec_fpath
+                return result
+
+        if args.kernel_timing and os.path.exists(timing_fpath):
+            os.remove(timing_fpath)
+        result = self._run_result(
+            exec_fpath=exec_fpath,
+            timeit=args.timeit,
+            profile=args.profile,
+            profiler=args.profiler(),
+            profiler_args=args.profiler_args(),
+            env=env,
+            separate_stderr=args.out_var is not None,
+            device_policy=args.device_policy(),
+            max_output=args.max_output,
+            toolkit=toolkit,
+            stdin=stdin,
+            limits=RunLimits(args.timeout, args.max_memory, args.max_cpu),
+        )
+        if args.kernel_timing:
+            result.kernel_timings = read_kernel_timings(timing_fpath)
+        # truncated results refer to a log file that may not last
+        stored = result.returncode == 0 and result.stopped is None
+        if key is not None and stored and not result.truncated:
+            self.memo_store.put(key, result)
+        return result
 
     def _compile_and_run(
         self, group_name: str, args: argparse.Namespace
     ) -> str:
+        return self._compile_and_run_result(group_name, args).output
+
+    def _compile_and_run_result(
+        self, group_name: str, args: argparse.Namespace
+    ) -> RunResult:
+        """
+        Compile a group and run the resulting executable.
+
+        Args:
+            group_name: The name of the source file group.
+            args: The parsed magic arguments.
+
+        Returns:
+            The result of the run, or the compiler output and return code if
+            the compilation failed.
+        """
+        stdin = self._stdin_source(args)
+        arrays = self._bind_arrays(group_name, args)
+        start = time.perf_counter()
         try:
-            exec_fpath = self._compile(
+            artifact = self._compile_artifact(
                 group_name=group_name,
-                compiler_args=args.compiler_args(),
+                compiler_args=self._compiler_args(args),
+                dlto=args.dlto,
+                backend=args.backend(),
+                use_cache=not args.no_compile_cache,
+                toolkit=args.toolkit(),
             )
-            output = self._run(
-                exec_fpath=exec_fpath,
-                timeit=args.timeit,
-                profile=args.profile,
-                profiler=args.profiler(),
-                profiler_args=args.profiler_args(),
+            compile_time = time.perf_counter() - start
+            if not artifact.runnable:
+                return RunResult(
+                    stdout=artifact.diagnostics
+                    + f'Compiled the device code to "{artifact.path}".\n',
+                    compile_time=compile_time,
+                    executable_path=artifact.path,
+                    compile_output=artifact.diagnostics,
+                    toolkit=artifact.toolkit,
+                )
+            result = self._run_memoized(
+                artifact.path,
+                args,
+                arrays.env() if arrays is not None else None,
+                self._select_toolkit(args.toolkit()),
+                stdin,
             )
+            result.compile_time = compile_time
+            result.compile_output = artifact.diagnostics
+            result.toolkit = artifact.toolkit
+            if arrays is not None and result.returncode == 0:
+                self.shell.user_ns.update(arrays.collect())
         except subprocess.CalledProcessError as e:
-            output = e.output.decode("utf8")
-        return output
+            # raised by the compiler, or by the program when run by "timeit"
+            result = RunResult(
+                stdout=e.output.decode("utf8", errors="replace"),
+                returncode=e.returncode,
+                compile_time=time.perf_counter() - start,
+                stopped="timeout" if isinstance(e, RunTimedOut) else None,
+            )
+        finally:
+            if arrays is not None:
+                arrays.cleanup()
+        return result
 
+    def _show_result(self, result: RunResult, args: argparse.Namespace):
+        """Print the output of a run and store it if --out-var was given."""
+        print_out(result.output)
+        if result.truncated:
+            # the note in the middle of the output names the log file
+            print(
+                f"The program printed {format_bytes(result.output_bytes)}"
+                " of output."
+            )
+        if result.stopped == "timeout":
+            print(
+                "The program was stopped after exceeding the timeout of"
+                f" {args.timeout:g} seconds."
+            )
+        elif result.stopped == "cpu-limit":
+            print(
+                "The program was stopped after exceeding the CPU time limit"
+                f" of {args.max_cpu} seconds."
+            )
+        elif result.stopped == "interrupt":
+            print("The program was interrupted.")
+        if result.kernel_timings is not None:
+            print(format_kernel_timings(result.kernel_timings))
+        if args.out_var is not None:
+            self.shell.user_ns[args.out_var] = result
+
+    @timed("read_args")
     def _read_args(
         self, line: str, parser: argparse.ArgumentParser
     ) -> Optional[argparse.Namespace]:
@@ -264,24 +1093,14 @@ class NVCCPlugin(Magics):
         Returns:
             The parsed arguments.
         """
-        tokens = line.strip().split('"')
-        args_tokenized: List[str] = []
-        for index, tok in enumerate(tokens):
-            if index % 2 == 0:
-                # tokens found outside double quotes are split at whitespace
-                args_tokenized.extend(tok.split(" "))
-            else:
-                # anything found between double quotes will not be split
-                args_tokenized.append(tok)
-        args_tokenized = [arg for arg in args_tokenized if len(arg) > 0]
-
         try:
-            return parser.parse_args(args_tokenized)
+            return parser.parse_args(split_magic_line(line))
         except SystemExit:
             parser.print_help()
             return None
 
     @cell_magic
+    @timed("cuda")
     def cuda(self, line: str, cell: str) -> None:
         """Compile and run the CUDA code in the cell.
 
@@ -298,15 +1117,27 @@ class NVCCPlugin(Magics):
 
         group_name = str(uuid.uuid4())
         self._save_source(
-            source_name="single_file.cu",
-            source_code=cell,
+            source_name=CELL_SOURCE_NAME,
+            source_code=specialize_source(cell, self._defines(args)),
             group_name=group_name,
         )
 
-        output = self._compile_and_run(group_name, args)
-        print_out(output)
+        result: Optional[RunResult] = None
+        try:
+            result = self._compile_and_run_result(group_name, args)
+        except RunInterrupted as e:
+            result = e.result
+            self._show_result(e.result, args)
+            raise
+        finally:
+            # the group of a cell is only kept while its executable or its
+            # log file are referred to by the result
+            if result is None or not (result.truncated or args.out_var):
+                self._delete_group(group_name)
+        self._show_result(result, args)
 
     @cell_magic
+    @timed("cuda_group_save")
     def cuda_group_save(self, line: str, cell: str) -> None:
         """
         Save the CUDA code in the cell in a group of source files to be later
@@ -328,8 +1159,11 @@ class NVCCPlugin(Magics):
             source_code=cell,
             group_name=args.group,
         )
+        if args.depends or args.library is not None:
+            self._update_group_metadata(args.group, args.depends, args.library)
 
     @line_magic
+    @timed("cuda_group_run")
     def cuda_group_run(self, line: str) -> None:
         """
         Compile and run all source files inside a specific source file group.
@@ -342,10 +1176,15 @@ class NVCCPlugin(Magics):
         if args is None:
             return
 
-        output = self._compile_and_run(args.group, args)
-        print_out(output)
+        try:
+            result = self._compile_and_run_result(args.group, args)
+        except RunInterrupted as e:
+            self._show_result(e.result, args)
+            raise
+        self._show_result(result, args)
 
     @line_magic
+    @timed("cuda_group_delete")
     def cuda_group_delete(self, line: str) -> None:
         """
         Remove all source files inside a specific source file group.
@@ -360,6 +1199,399 @@ class NVCCPlugin(Magics):
 
         self._delete_group(args.group)
 
+    @line_magic
+    @timed("cuda_group_snapshot")
+    def cuda_group_snapshot(self, line: str) -> None:
+        """
+        Save an immutable snapshot of the source files of a group.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+
+        Raises:
+            RuntimeError: If the group does not exist.
+        """
+        args = self._read_args(line, self.parser_cuda_group_snapshot)
+        if args is None:
+            return
+
+        group_dirpath = os.path.join(self.workdir, args.group)
+        if not os.path.exists(group_dirpath):
+            raise RuntimeError(f'Group "{args.group}" does not exist.')
+        manifest = self.snapshot_store.create(args.snapshot, group_dirpath)
+        print(
+            f'Saved snapshot "{args.snapshot}" of group "{args.group}" with'
+            f' {len(manifest["files"])} files.'
+        )
+
+    @line_magic
+    @timed("cuda_group_restore")
+    def cuda_group_restore(self, line: str) -> None:
+        """
+        Replace the source files of a group with those of a snapshot.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_group_restore)
+        if args is None:
+            return
+
+        group_name = args.group
+        if group_name is None:
+            group_name = self.snapshot_store.manifest(args.snapshot)["group"]
+        self.snapshot_store.restore(
+            args.snapshot, os.path.join(self.workdir, group_name)
+        )
+        print(f'Restored snapshot "{args.snapshot}" to group "{group_name}".')
+
+    @line_magic
+    def cuda_snapshots(self, line: str) -> None:
+        """
+        List the saved group snapshots, or delete one of them.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_snapshots)
+        if args is None:
+            return
+
+        if args.delete is not None:
+            self.snapshot_store.delete(args.delete)
+            print(f'Deleted snapshot "{args.delete}".')
+            return
+        names = self.snapshot_store.names()
+        if not names:
+            print("No snapshots saved yet.")
+            return
+        print(f"{'snapshot':<20} {'group':<20} {'files':>5}  created")
+        for name in names:
+            manifest = self.snapshot_store.manifest(name)
+            created = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(manifest["created"])
+            )
+            print(
+                f'{name:<20} {manifest["group"]:<20}'
+                f' {len(manifest["files"]):>5}  {created}'
+            )
+
+    @line_magic
+    @timed("cuda_precompile")
+    def cuda_precompile(self, line: str) -> None:
+        """
+        Compile the programs of all "%%cuda" cells and "%cuda_group_run"
+        lines of a notebook in parallel, so that running the notebook
+        afterwards finds them in the compile cache.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_precompile)
+        if args is None:
+            return
+
+        jobs, skipped = scan_notebook(args.notebook)
+        # cells that compile identical programs are compiled once
+        unique_jobs: Dict[str, PrecompileJob] = {}
+        failed: List[Tuple[int, str]] = []
+        for job in jobs:
+            try:
+                self._specialize_job(job)
+            except ValueError as e:
+                skipped.append((job.cell_index, str(e).rstrip(".")))
+                continue
+            try:
+                signature = self._precompile_signature(job)
+            except (RuntimeError, ValueError) as e:
+                failed.append((job.cell_index, str(e)))
+                continue
+            unique_jobs.setdefault(signature, job)
+
+        start = time.perf_counter()
+        compiled, cached = self._precompile_jobs(
+            list(unique_jobs.values()), args.jobs, failed
+        )
+        print(
+            f"Compiled {compiled} programs ({cached} were already cached) in"
+            f" {time.perf_counter() - start:.1f}s."
+        )
+        for cell_index, reason in sorted(skipped):
+            print(f"Skipped cell {cell_index}: {reason}.")
+        for cell_index, reason in failed:
+            print(f"Failed to compile cell {cell_index}:")
+            print_out(reason.strip())
+
+    def _specialize_job(self, job: PrecompileJob) -> None:
+        """
+        Specialize the source of a "%%cuda" cell with the current notebook
+        variables, see "--define".
+
+        Raises:
+            ValueError: If a value given to "--define" cannot be used.
+        """
+        defines = self._defines(job.args)
+        if job.group_name == CELL_GROUP_NAME:
+            cell_sources = job.sources[CELL_GROUP_NAME]
+            cell_sources[CELL_SOURCE_NAME] = specialize_source(
+                cell_sources[CELL_SOURCE_NAME], defines
+            )
+
+    def _precompile_signature(self, job: PrecompileJob) -> str:
+        """
+        Get what identifies the program of a precompile job, so that cells
+        that compile identical programs are compiled once.
+
+        Raises:
+            RuntimeError: If kernel timing is not supported by the backend.
+            ValueError: If the requested toolkit is not installed.
+        """
+        return json.dumps(
+            [
+                job.sources.get(job.group_name),
+                job.sources.get(SHARED_GROUP_NAME),
+                job.metadata.get(job.group_name),
+                self._compiler_args(job.args),
+                job.args.dlto,
+                job.args.backend().value,
+                job.args.toolkit(),
+            ],
+            sort_keys=True,
+        )
+
+    def _compile_groups(
+        self,
+        group_names: List[str],
+        compiler_args: str,
+        toolkit: Optional[str],
+    ) -> Optional[Dict[str, str]]:
+        """
+        Compile several groups concurrently, printing the errors of the ones
+        that fail to compile.
+
+        Args:
+            group_names: The names of the groups, possibly repeated.
+            compiler_args: The compiler arguments of every group.
+            toolkit: The version of the CUDA toolkit to compile with, or None
+                for the default one.
+
+        Returns:
+            The paths of the executables by group name, or None if a group
+            failed to compile.
+        """
+        with ThreadPoolExecutor() as executor:
+            futures = {
+                group_name: executor.submit(
+                    self._compile,
+                    group_name,
+                    compiler_args=compiler_args,
+                    toolkit=toolkit,
+                )
+                for group_name in dict.fromkeys(group_names)
+            }
+            exec_fpaths = {}
+            for group_name, future in futures.items():
+                try:
+                    exec_fpaths[group_name] = future.result()
+                except subprocess.CalledProcessError as e:
+                    print(f'Failed to compile group "{group_name}":')
+                    print_out(e.output.decode("utf8").strip())
+                except (RuntimeError, ValueError) as e:
+                    print(f'Failed to compile group "{group_name}":')
+                    print_out(str(e))
+        if len(exec_fpaths) < len(futures):
+            return None
+        return exec_fpaths
+
+    @line_magic
+    @timed("cuda_profile_batch")
+    def cuda_profile_batch(self, line: str) -> None:
+        """
+        Compile the programs of several groups and profile every program with
+        every set of arguments and profiler, concurrently. The results are
+        shown as one table.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_profile_batch)
+        if args is None:
+            return
+
+        exec_fpaths = self._compile_groups(
+            args.groups, args.compiler_args(), args.toolkit()
+        )
+        if exec_fpaths is None:
+            return
+
+        profilers = args.profilers or [args.default_profiler()]
+        program_args = args.program_args or [""]
+        jobs = []
+        for group_name, exec_fpath in exec_fpaths.items():
+            for run_args in program_args:
+                for profiler in profilers:
+                    name = " ".join([group_name, run_args]).strip()
+                    if len(profilers) > 1:
+                        name += f" [{profiler.value}]"
+                    jobs.append(
+                        ProfileJob(
+                            name=name,
+                            exec_fpath=exec_fpath,
+                            program_args=run_args.split(),
+                            profiler=profiler,
+                            profiler_args=args.profiler_args(),
+                        )
+                    )
+
+        batch = self._profile_batch(
+            jobs,
+            args.max_jobs_per_device or DEFAULT_MAX_JOBS_PER_DEVICE,
+            self._select_toolkit(args.toolkit()),
+        )
+        columns = None
+        if args.columns is not None:
+            columns = [c.strip() for c in args.columns.split(",") if c]
+        print(batch.table(columns))
+        for outcome in batch.outcomes:
+            if outcome.result.returncode != 0:
+                print(
+                    f'Job "{outcome.job.name}" failed with return code'
+                    f" {outcome.result.returncode}:"
+                )
+                print_out(outcome.result.output.strip())
+        if args.out_var is not None:
+            self.shell.user_ns[args.out_var] = batch
+
+    @line_magic
+    def cuda_toolkits(self, line: str) -> None:
+        """
+        List the installed CUDA toolkits and the profilers installed with
+        them. The toolkit used by default is marked with "*".
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_toolkits)
+        if args is None:
+            return
+
+        wait_for_setup()
+        toolkits = self.toolkit_index.toolkits(refresh=args.refresh)
+        if not toolkits:
+            print("No CUDA toolkits found.")
+            return
+        default = self.toolkit_index.select()
+        print(f"  {'version':<12} {'ncu':<12} {'nsys':<16} nvcc")
+        for toolkit in toolkits:
+            marker = "*" if toolkit == default else " "
+            ncu_version = toolkit.ncu_version or "-"
+            nsys_version = toolkit.nsys_version or "-"
+            print(
+                f"{marker} {toolkit.version:<12} {ncu_version:<12}"
+                f" {nsys_version:<16} {toolkit.nvcc}"
+            )
+
+    @line_magic
+    def cuda_memo_clear(self, line: str) -> None:
+        """
+        Remove all results stored by runs with the --memoize option.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_memo_clear)
+        if args is None:
+            return
+
+        removed = self.memo_store.clear()
+        print(f"Removed {removed} memoized results.")
+
+    @line_magic
+    def cuda_stats(self, line: str) -> None:
+        """
+        Show how much time the magic commands spent in each of their phases,
+        and optionally export those timings.
+
+        Args:
+            line: The arguments on the line of the magic call in the jupyter
+                cell.
+        """
+        args = self._read_args(line, self.parser_cuda_stats)
+        if args is None:
+            return
+
+        print(self.stats.table(histograms=args.histograms))
+        if args.export is not None:
+            self.stats.export(args.export, args.format)
+            print(f'Exported the timings to "{args.export}".')
+        if args.stream is not None:
+            self.stats.set_export(args.stream, args.format)
+            print(f'Exporting every span to "{args.stream}".')
+        if args.no_stream:
+            self.stats.set_export(None)
+        if args.reset:
+            self.stats.reset()
+
+
+def _pump(stream: IO[bytes], sink: OutputSink) -> None:
+    """Move everything read from a stream into an output sink."""
+    for chunk in iter(lambda: stream.read1(READ_CHUNK_BYTES), b""):
+        sink.write(chunk)
+
+
+def _communicate(
+    process: subprocess.Popen,
+    stdin: Any,
+    stdout_sink: OutputSink,
+    stderr_sink: OutputSink,
+) -> Tuple[bool, Optional[StdinWriter]]:
+    """
+    Stream the standard input of a running process and collect its output
+    until it exits. Standard input and error are handled by threads of their
+    own, standard output by the calling thread.
+
+    Args:
+        process: The process, whose standard error is piped or not.
+        stdin: What is streamed to the standard input of the process if it
+            is piped, see "iter_chunks".
+        stdout_sink: Where standard output is collected.
+        stderr_sink: Where standard error is collected if it is piped.
+
+    Returns:
+        Whether the run was interrupted, in which case the process group was
+        stopped, and the writer of the standard input, if any.
+    """
+    interrupted = False
+    stdin_writer = None
+    if process.stdin is not None:
+        stdin_writer = StdinWriter(process.stdin, stdin)
+        stdin_writer.start()
+    stderr_thread = None
+    if process.stderr is not None:
+        stderr_thread = threading.Thread(
+            target=_pump, args=(process.stderr, stderr_sink)
+        )
+        stderr_thread.start()
+    try:
+        _pump(process.stdout, stdout_sink)
+    except KeyboardInterrupt:
+        # stop the whole process tree, keeping what it printed
+        interrupted = True
+        kill_process_group(process)
+        _pump(process.stdout, stdout_sink)
+    if stderr_thread is not None:
+        stderr_thread.join()
+    if stdin_writer is not None:
+        stdin_writer.join()
+    return interrupted, stdin_writer
+
 
 def load_ipython_extension(shell: InteractiveShell):
     """
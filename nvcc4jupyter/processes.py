@@ -0,0 +1,255 @@
+"""
+Running CUDA programs in process groups of their own, so that a program and
+every process it starts, such as the profiler wrapping it, are limited and
+stopped together when the run times out, the cell is interrupted or the
+notebook kernel exits.
+"""
+
+import atexit
+import functools
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .results import RunResult
+
+# how long a stopped process group may take to exit before it is killed
+KILL_GRACE_SECONDS = 5.0
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# the "prctl" option that signals a process when its parent dies
+_PR_SET_PDEATHSIG = 1
+
+# the leaders of the process groups that are running, stopped on exit
+_running_groups: Set[int] = set()
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size in bytes, optionally followed by a binary unit such as "K",
+    "M" or "G" (e.g. "512M" or "4G").
+
+    Raises:
+        ValueError: If the size is not valid.
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)(?:I?B)?\s*", size.upper())
+    if match is None:
+        raise ValueError(f'Invalid size "{size}".')
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2)]
+
+
+def _set_soft_limit(limit: int, value: int) -> None:
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+@dataclass
+class RunLimits:
+    """The limits of a program run. None stands for no limit."""
+
+    # seconds of wall time after which the process group is stopped
+    timeout: Optional[float] = None
+    # bytes of host memory every process of the group may allocate, which
+    # does not include GPU memory
+    max_memory: Optional[int] = None
+    # seconds of CPU time every process of the group may use
+    max_cpu: Optional[int] = None
+
+    def apply(self) -> None:
+        """
+        Set the resource limits of the current process. Called in the child
+        process before the program is executed, so that they are inherited
+        by every process it starts.
+        """
+        if self.max_memory is not None:
+            _set_soft_limit(resource.RLIMIT_DATA, self.max_memory)
+        if self.max_cpu is not None:
+            _set_soft_limit(resource.RLIMIT_CPU, self.max_cpu)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_prctl() -> Optional[Callable[..., int]]:
+    # resolved in the parent, since loading libraries between fork and exec
+    # is not safe, and only when a program is run so that loading the
+    # extension stays fast
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes  # pylint: disable=import-outside-toplevel
+
+    try:
+        return ctypes.CDLL(None).prctl
+    except (OSError, AttributeError):
+        return None
+
+
+def popen_kwargs(limits: Optional[RunLimits]) -> Dict[str, Any]:
+    """
+    Get the arguments of "subprocess.Popen" that start a program in a
+    process group of its own, with the given resource limits. On Linux the
+    program is also killed when the notebook kernel dies, even if it is
+    killed without a chance to clean up.
+    """
+    kwargs: Dict[str, Any] = {"start_new_session": True}
+    prctl = _get_prctl()
+    apply_limits = limits is not None and (
+        limits.max_memory is not None or limits.max_cpu is not None
+    )
+    if prctl is None and not apply_limits:
+        return kwargs
+
+    def preexec() -> None:
+        if prctl is not None:
+            prctl(_PR_SET_PDEATHSIG, signal.SIGKILL)
+        if apply_limits:
+            limits.apply()  # type: ignore[union-attr]
+
+    kwargs["preexec_fn"] = preexec
+    return kwargs
+
+
+def kill_process_group(
+    process: subprocess.Popen, grace: float = KILL_GRACE_SECONDS
+) -> None:
+    """
+    Stop a process started by "popen_kwargs" and every process it started.
+    The group is asked to terminate first, which lets profilers clean up,
+    and is killed if the process did not exit within the grace period.
+
+    Args:
+        process: The process that leads the group.
+        grace: How many seconds the process has to exit. Defaults to
+            KILL_GRACE_SECONDS.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        # processes that ignored the request or outlived the leader
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+@atexit.register
+def _kill_running_groups() -> None:
+    # the profilers and other processes started by programs are not killed
+    # with their parent, so whole groups are stopped when the kernel exits
+    for pid in list(_running_groups):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class Watchdog:
+    """
+    Stops a process group once a run takes longer than its timeout, or when
+    the interpreter exits during the run.
+    """
+
+    def __init__(
+        self, process: subprocess.Popen, timeout: Optional[float]
+    ) -> None:
+        """
+        Args:
+            process: The process that leads the group.
+            timeout: How many seconds the run may take, or None to wait
+                forever.
+        """
+        self.process = process
+        self.expired = False
+        self._timer: Optional[threading.Timer] = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+
+    def _expire(self) -> None:
+        self.expired = True
+        kill_process_group(self.process)
+
+    def __enter__(self) -> "Watchdog":
+        _running_groups.add(self.process.pid)
+        if self._timer is not None:
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        _running_groups.discard(self.process.pid)
+
+
+class RunTimedOut(subprocess.CalledProcessError):
+    """Raised by "check_output" if the program exceeded its timeout."""
+
+
+class RunInterrupted(KeyboardInterrupt):
+    """
+    Raised when a run is interrupted, after its process group was stopped.
+    Holds the result with the output printed before the interruption.
+    """
+
+    def __init__(self, result: RunResult) -> None:
+        super().__init__()
+        self.result = result
+
+
+def check_output(
+    args: List[str],
+    env: Optional[Dict[str, str]] = None,
+    limits: Optional[RunLimits] = None,
+) -> bytes:
+    """
+    Run a program and return its output, with standard error interleaved,
+    like "subprocess.check_output". The program runs in a process group of
+    its own, which is stopped when the timeout expires or the caller is
+    interrupted.
+
+    Args:
+        args: The command line of the program.
+        env: The environment of the program. Defaults to None, which
+            inherits the environment.
+        limits: The limits of the run. Defaults to None.
+
+    Raises:
+        RunTimedOut: If the program exceeded its timeout.
+        subprocess.CalledProcessError: If the program failed.
+        KeyboardInterrupt: If the caller was interrupted.
+
+    Returns:
+        The output of the program.
+    """
+    limits = limits or RunLimits()
+    with subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+        **popen_kwargs(limits),
+    ) as process:
+        with Watchdog(process, limits.timeout) as watchdog:
+            try:
+                output = process.stdout.read()  # type: ignore[union-attr]
+            except KeyboardInterrupt:
+                kill_process_group(process)
+                raise
+        process.wait()
+    if watchdog.expired:
+        raise RunTimedOut(process.returncode, args, output)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output)
+    return output
@@ -0,0 +1,277 @@
+"""
+Profiling of many programs at once. The profilers run concurrently on the
+available GPUs, but Nsight Compute gets exclusive use of its GPU because it
+serializes and replays kernels, and the structured results of all runs are
+aggregated into a single table.
+"""
+
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+from .devices import DevicePolicy, DeviceScheduler
+from .parsers import Profiler
+from .results import Columns, Record, RunResult, convert_value
+
+DEFAULT_MAX_JOBS_PER_DEVICE = 2
+# the longest value shown in a column of the table
+MAX_CELL_CHARS = 40
+
+# columns of the Nsight Compute CSV output that identify a kernel launch
+# rather than hold a metric
+NCU_IDENTITY_COLUMNS = (
+    "ID",
+    "Process ID",
+    "Process Name",
+    "Host Name",
+    "Kernel Name",
+    "Context",
+    "Stream",
+    "Block Size",
+    "Grid Size",
+    "Device",
+    "CC",
+    "Section Name",
+    "Metric Name",
+    "Metric Unit",
+    "Metric Value",
+)
+
+
+@dataclass
+class ProfileJob:
+    """A program run to be profiled as part of a batch."""
+
+    name: str
+    exec_fpath: str
+    program_args: List[str] = field(default_factory=list)
+    profiler: Profiler = Profiler.NCU
+    profiler_args: str = ""
+    env: Optional[Dict[str, str]] = None
+
+
+def batch_profiler_args(job: ProfileJob, report_fpath: str) -> str:
+    """
+    Get the profiler arguments of a job in a batch. Nsight Compute reports
+    are printed as CSV so they can be parsed. Nsight Systems runs its
+    "profile" command, which is added if missing, and writes its report to a
+    file of its own so concurrent runs do not collide.
+
+    Args:
+        job: The job.
+        report_fpath: Where Nsight Systems writes the report, without
+            extension, unless the arguments already choose a file.
+    """
+    args = job.profiler_args.split()
+    if job.profiler == Profiler.NCU and "--csv" not in args:
+        args.append("--csv")
+    if job.profiler == Profiler.NSYS:
+        if "profile" not in args:
+            args.insert(0, "profile")
+        has_output = any(
+            arg in ("-o", "--output") or arg.startswith("--output=")
+            for arg in args
+        )
+        if not has_output:
+            args.extend(["-o", report_fpath, "--force-overwrite", "true"])
+    return " ".join(args)
+
+
+def _ncu_value(value: str) -> Any:
+    # numbers are printed with thousands separators
+    converted = convert_value(value.replace(",", ""))
+    return value if isinstance(converted, str) else converted
+
+
+def parse_ncu_csv(lines: Iterable[str]) -> Iterator[Record]:
+    """
+    Parse the CSV output of Nsight Compute, either in the default format with
+    one metric per row or in the "raw" page format with one kernel launch
+    per row. Program output and profiler messages around the CSV are
+    skipped.
+
+    Args:
+        lines: The lines of the profiled run's output.
+
+    Yields:
+        One record per kernel launch with its "id", "kernel" and metrics.
+        Metrics with a unit are named "<metric> (<unit>)".
+    """
+    rows = [line for line in lines if line.startswith('"')]
+    start = next(
+        (i for i, line in enumerate(rows) if line.startswith('"ID","')), None
+    )
+    if start is None:
+        return
+    reader = csv.reader(rows[start:])
+    header = next(reader, None)
+    if header is None:
+        return
+    records: Dict[str, Record] = {}
+    if "Metric Name" in header:
+        for row in reader:
+            values = dict(zip(header, row))
+            record = records.setdefault(
+                values["ID"],
+                {
+                    "id": _ncu_value(values["ID"]),
+                    "kernel": values.get("Kernel Name"),
+                },
+            )
+            name = values["Metric Name"]
+            if values.get("Metric Unit"):
+                name = f'{name} ({values["Metric Unit"]})'
+            record[name] = _ncu_value(values.get("Metric Value", ""))
+    else:
+        units: Dict[str, str] = {}
+        for row in reader:
+            values = dict(zip(header, row))
+            if not values.get("ID"):
+                # the raw page has a row with the units of the metrics
+                units = values
+                continue
+            record = {
+                "id": _ncu_value(values["ID"]),
+                "kernel": values.get("Kernel Name"),
+            }
+            for name, value in values.items():
+                if name in NCU_IDENTITY_COLUMNS:
+                    continue
+                if units.get(name):
+                    name = f"{name} ({units[name]})"
+                record[name] = _ncu_value(value)
+            records[values["ID"]] = record
+    yield from records.values()
+
+
+@dataclass
+class ProfileOutcome:
+    """The result of a profiled run of a batch."""
+
+    job: ProfileJob
+    device: str
+    result: RunResult
+
+    def records(self) -> List[Record]:
+        """
+        The rows of this run in the batch table: one per kernel launch
+        profiled by Nsight Compute, or a single row otherwise.
+        """
+        row: Record = {
+            "job": self.job.name,
+            "profiler": self.job.profiler.value,
+            "device": self.device,
+            "returncode": self.result.returncode,
+            "run_time": self.result.run_time,
+        }
+        kernels: List[Record] = []
+        if self.job.profiler == Profiler.NCU:
+            kernels = list(parse_ncu_csv(self.result.lines()))
+        return [{**row, **kernel} for kernel in kernels] or [row]
+
+
+class ProfileBatch:
+    """The outcomes of all runs of a batch, in the order of the jobs."""
+
+    def __init__(self, outcomes: List[ProfileOutcome]) -> None:
+        self.outcomes = outcomes
+
+    def records(self) -> List[Record]:
+        """All rows of the batch table."""
+        return [
+            record for outcome in self.outcomes for record in outcome.records()
+        ]
+
+    def columns(self) -> Columns:
+        """The batch table as a mapping from column names to lists."""
+        return Columns(lambda: iter(self.records()))
+
+    def table(self, columns: Optional[Sequence[str]] = None) -> str:
+        """
+        Format the batch table as human readable text.
+
+        Args:
+            columns: The columns to show after the job, profiler and device
+                columns. Defaults to None, which shows all columns.
+        """
+        records = self.records()
+        names = list(self.columns())
+        if columns is not None:
+            names = ["job", "profiler", "device"] + [
+                name for name in columns if name in names
+            ]
+
+        def cell(value: object) -> str:
+            if value is None:
+                text = "-"
+            elif isinstance(value, float):
+                text = f"{value:.4g}"
+            else:
+                text = str(value)
+            if len(text) > MAX_CELL_CHARS:
+                text = text[: MAX_CELL_CHARS - 3] + "..."
+            return text
+
+        rows = [
+            [cell(record.get(name)) for name in names] for record in records
+        ]
+        widths = [
+            max([len(cell(name))] + [len(row[i]) for row in rows])
+            for i, name in enumerate(names)
+        ]
+        lines = [
+            " ".join(
+                cell(name).ljust(width) for name, width in zip(names, widths)
+            ).rstrip()
+        ]
+        for row in rows:
+            lines.append(
+                " ".join(
+                    text.ljust(width) for text, width in zip(row, widths)
+                ).rstrip()
+            )
+        return "\n".join(lines)
+
+
+def profile_batch(
+    jobs: Sequence[ProfileJob],
+    run: Callable[[int, ProfileJob, str], RunResult],
+    scheduler: DeviceScheduler,
+) -> ProfileBatch:
+    """
+    Profile a batch of program runs concurrently. Runs under Nsight Compute
+    get a GPU to themselves, while runs under Nsight Systems share a GPU
+    with up to "max_jobs_per_device" runs of the scheduler.
+
+    Args:
+        jobs: The runs to profile.
+        run: Runs a profiled job given its index in the batch and the GPU
+            assigned to it.
+        scheduler: Holds the GPUs of the runs, so that runs of other
+            notebooks are taken into account.
+
+    Returns:
+        The outcomes of the runs.
+    """
+
+    def run_job(index: int) -> ProfileOutcome:
+        job = jobs[index]
+        exclusive = job.profiler == Profiler.NCU
+        with scheduler.lease(
+            DevicePolicy.LEAST_LOADED, exclusive=exclusive
+        ) as device:
+            return ProfileOutcome(job, device, run(index, job, device))
+
+    max_workers = len(scheduler.devices) * scheduler.max_jobs_per_device
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return ProfileBatch(list(executor.map(run_job, range(len(jobs)))))
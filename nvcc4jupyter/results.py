@@ -0,0 +1,222 @@
+"""
+Results of compiling and running CUDA programs, with helpers that parse
+line oriented program output into columns.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+)
+
+Record = Dict[str, Any]
+
+
+def convert_value(value: str) -> Any:
+    """Convert a string to an int or a float if possible."""
+    for cls in (int, float):
+        try:
+            return cls(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_key_values(lines: Iterable[str]) -> Iterator[Record]:
+    """
+    Parse lines of whitespace separated "key=value" pairs, for example
+    "size=1024 time_ms=0.25". Lines without any pair are skipped.
+
+    Args:
+        lines: The lines of program output.
+
+    Yields:
+        One record per line that contains at least one pair.
+    """
+    for line in lines:
+        record: Record = {}
+        for token in line.split():
+            key, sep, value = token.partition("=")
+            if sep and key:
+                record[key] = convert_value(value)
+        if record:
+            yield record
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Record]:
+    """
+    Parse comma separated values whose first non-empty line is the header.
+
+    Args:
+        lines: The lines of program output.
+
+    Yields:
+        One record per data row.
+    """
+    reader = csv.reader(line for line in lines if line.strip())
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [column.strip() for column in header]
+    for row in reader:
+        yield {
+            key: convert_value(value.strip())
+            for key, value in zip(header, row)
+        }
+
+
+def parse_json_lines(lines: Iterable[str]) -> Iterator[Record]:
+    """
+    Parse lines that hold one JSON object each. Other lines are skipped, so
+    JSON records can be mixed with regular program output.
+
+    Args:
+        lines: The lines of program output.
+
+    Yields:
+        One record per JSON object line.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+LINE_PARSERS: Dict[str, Callable[[Iterable[str]], Iterator[Record]]] = {
+    "kv": parse_key_values,
+    "csv": parse_csv,
+    "jsonl": parse_json_lines,
+}
+
+
+class Columns(Mapping[str, List[Any]]):
+    """
+    Column view over parsed output records. Nothing is parsed until a column
+    is accessed and only the accessed columns are kept in memory. Records
+    missing a column have None in its place.
+    """
+
+    def __init__(self, records: Callable[[], Iterator[Record]]) -> None:
+        self._records = records
+        self._names: Optional[List[str]] = None
+        self._columns: Dict[str, List[Any]] = {}
+
+    def _column_names(self) -> List[str]:
+        if self._names is None:
+            names: Dict[str, None] = {}
+            for record in self._records():
+                names.update(dict.fromkeys(record))
+            self._names = list(names)
+        return self._names
+
+    def __getitem__(self, name: str) -> List[Any]:
+        if name not in self._columns:
+            column: List[Any] = []
+            found = False
+            for record in self._records():
+                found = found or name in record
+                column.append(record.get(name))
+            if not found:
+                raise KeyError(name)
+            self._columns[name] = column
+        return self._columns[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._column_names())
+
+    def __len__(self) -> int:
+        return len(self._column_names())
+
+
+@dataclass
+class RunResult:  # pylint: disable=too-many-instance-attributes
+    """The outcome of compiling and running a CUDA program."""
+
+    stdout: str = ""
+    stderr: str = ""
+    returncode: int = 0
+    compile_time: float = 0.0
+    run_time: float = 0.0
+    executable_path: Optional[str] = None
+    compile_output: str = ""
+    # the version of the CUDA toolkit the program was compiled with
+    toolkit: Optional[str] = None
+    # the file holding the full standard output, of which "stdout" only
+    # holds the start and the end if "truncated" is set
+    log_path: Optional[str] = None
+    output_bytes: int = 0
+    truncated: bool = False
+    # why the run was stopped before the program exited: "timeout",
+    # "interrupt" or "cpu-limit"
+    stopped: Optional[str] = None
+    # the launch counts and GPU times of every kernel, with --kernel-timing
+    kernel_timings: Optional[List[Record]] = None
+
+    @property
+    def output(self) -> str:
+        """Everything the program (or the compiler, on failure) printed."""
+        return self.stdout + self.stderr
+
+    def lines(self) -> Iterator[str]:
+        """
+        Iterate over the lines of standard output without copying it. If the
+        output was truncated, the lines are read from the log file.
+        """
+        if self.truncated and self.log_path is not None:
+            with open(
+                self.log_path, "r", encoding="utf8", errors="replace"
+            ) as f:
+                for line in f:
+                    yield line.rstrip("\n")
+            return
+        for line in io.StringIO(self.stdout):
+            yield line.rstrip("\n")
+
+    def records(self, fmt: str = "kv") -> Iterator[Record]:
+        """
+        Parse the standard output line by line.
+
+        Args:
+            fmt: The output format, one of "kv" (key=value pairs), "csv" or
+                "jsonl" (JSON lines). Defaults to "kv".
+
+        Raises:
+            ValueError: If the format is unknown.
+
+        Returns:
+            An iterator over the parsed records.
+        """
+        if fmt not in LINE_PARSERS:
+            raise ValueError(
+                f'Unknown output format "{fmt}". Choose one of:'
+                f' {", ".join(LINE_PARSERS)}.'
+            )
+        return LINE_PARSERS[fmt](self.lines())
+
+    def columns(self, fmt: str = "kv") -> Columns:
+        """
+        Lazily parse the standard output into columns.
+
+        Args:
+            fmt: The output format, see records(). Defaults to "kv".
+
+        Returns:
+            A mapping from column names to lists of values.
+        """
+        self.records(fmt)  # validate the format eagerly
+        return Columns(lambda: self.records(fmt))
@@ -6,19 +6,24 @@ to work on them immediately after loading it.
 # pylint: disable=missing-function-docstring
 
 import os
+import threading
 import traceback
 from subprocess import DEVNULL, STDOUT, check_call
-from typing import Optional
+from typing import Callable, Optional
+
+from .path_utils import which
 
 PATH_PRIORITY_DIR = "/usr/bin/priority"
 KAGGLE_GCC_8_PATH = "/usr/bin/gcc-8"
 
+_setup_thread: Optional[threading.Thread] = None
+
 
 def print_platform(platform: str) -> None:
     print(f'Detected platform "{platform}". Running its setup...')
 
 
-def kaggle_setup() -> None:
+def kaggle_install() -> None:
     print("Updating the package lists...")
     check_call(["/usr/bin/apt-get", "update"], stdout=DEVNULL, stderr=STDOUT)
 
@@ -28,6 +33,13 @@ def kaggle_setup() -> None:
         stdout=DEVNULL,
         stderr=STDOUT,
     )
+
+
+def kaggle_setup() -> None:
+    # skip the installation if an earlier setup, or the image, installed it
+    if which("nvcc") is None:
+        kaggle_install()
+
     os.makedirs(PATH_PRIORITY_DIR, exist_ok=True)
 
     gcc_symlink_path = os.path.join(PATH_PRIORITY_DIR, "gcc")
@@ -42,31 +54,62 @@ def colab_setup() -> None:
     pass
 
 
-def setup_environment() -> None:
+def run_setup(platform: str, setup: Callable[[], None]) -> None:
+    try:
+        setup()
+    except Exception:  # pylint: disable=broad-exception-caught
+        print(
+            f'Setup failed for detected platform "{platform}". Set the'
+            ' "NVCC4JUPYTER_NO_SETUP" environment variable to disable running'
+            " the setup on load. Please report the following error to"
+            " https://github.com/andreinechaev/nvcc4jupyter/issues:"
+            f" following error message:\n{traceback.format_exc()}"
+        )
+
+
+def setup_environment(background: Optional[bool] = None) -> None:
     """
     Detect the platform the extension was loaded on and run the necessary
     steps (install dependencies, add executables to PATH, etc.) for the
-    extension to work.
+    extension to work. Installation steps are skipped if the CUDA toolkit is
+    already available.
+
+    Args:
+        background: If True, the setup runs in a background thread and
+            wait_for_setup() must be called before using the CUDA toolkit.
+            If None, the setup runs in the background only if the
+            "NVCC4JUPYTER_SETUP_BACKGROUND" environment variable is set.
+            Defaults to None.
     """
+    # pylint: disable=global-statement
+    global _setup_thread
 
     if "NVCC4JUPYTER_NO_SETUP" in os.environ:
         return
 
     platform: Optional[str] = None
-    try:
-        if "KAGGLE_URL_BASE" in os.environ:
-            platform = "Kaggle"
-            print_platform(platform)
-            kaggle_setup()
-        elif "COLAB_RELEASE_TAG" in os.environ:
-            platform = "Colab"
-            print_platform(platform)
-            colab_setup()
-    except Exception:  # pylint: disable=broad-exception-caught
-        print(
-            f'Setup failed for detected platform "{platform}". Set the'
-            ' "NVCC4JUPYTER_NO_SETUP" environment variable to disable running'
-            " the setup on load. Please report the following error to"
-            " https://github.com/andreinechaev/nvcc4jupyter/issues:"
-            f" following error message:\n{traceback.format_exc()}"
+    setup: Optional[Callable[[], None]] = None
+    if "KAGGLE_URL_BASE" in os.environ:
+        platform, setup = "Kaggle", kaggle_setup
+    elif "COLAB_RELEASE_TAG" in os.environ:
+        platform, setup = "Colab", colab_setup
+    if platform is None or setup is None:
+        return
+
+    print_platform(platform)
+    if background is None:
+        background = "NVCC4JUPYTER_SETUP_BACKGROUND" in os.environ
+    if background:
+        _setup_thread = threading.Thread(
+            target=run_setup, args=(platform, setup), daemon=True
         )
+        _setup_thread.start()
+    else:
+        run_setup(platform, setup)
+
+
+def wait_for_setup() -> None:
+    """Wait for a setup running in the background to finish, if any."""
+    if _setup_thread is not None and _setup_thread.is_alive():
+        print("Waiting for the platform setup to finish...")
+        _setup_thread.join()
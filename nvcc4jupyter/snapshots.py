@@ -0,0 +1,244 @@
+"""
+Immutable snapshots of source file groups, whose files are kept in a
+content-addressed blob store so that identical files are stored only once.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from .arrays import ARRAYS_HEADER_FNAME
+from .build import GROUP_METADATA_FNAME
+
+SNAPSHOT_NAME_PATTERN = r"[\w.-]+"
+
+
+def snapshot_fnames(group_dirpath: str) -> List[str]:
+    """
+    List the files of a group that are part of its snapshots: the source
+    files and the group metadata, but not build outputs or generated files.
+
+    Args:
+        group_dirpath: The directory of the group.
+    """
+    fpaths = glob.glob(os.path.join(group_dirpath, "*.cu"))
+    fpaths.extend(glob.glob(os.path.join(group_dirpath, "*.h")))
+    fpaths.append(os.path.join(group_dirpath, GROUP_METADATA_FNAME))
+    return sorted(
+        os.path.basename(fpath)
+        for fpath in fpaths
+        if os.path.isfile(fpath)
+        and os.path.basename(fpath) != ARRAYS_HEADER_FNAME
+    )
+
+
+class BlobStore:
+    """
+    Stores files by the SHA-256 digest of their contents. Blobs are read-only
+    and are hard linked (or copied, across file systems) out of the store.
+    """
+
+    def __init__(self, dirpath: str) -> None:
+        self.dirpath = dirpath
+
+    def blob_fpath(self, digest: str) -> str:
+        """Get the file path of a blob."""
+        return os.path.join(self.dirpath, digest[:2], digest[2:])
+
+    def put(self, fpath: str) -> str:
+        """
+        Add a file to the store, unless a file with the same contents is
+        already stored.
+
+        Args:
+            fpath: The file path.
+
+        Returns:
+            The digest of the contents of the file.
+        """
+        hasher = hashlib.sha256()
+        with open(fpath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        blob_fpath = self.blob_fpath(digest)
+        if not os.path.exists(blob_fpath):
+            os.makedirs(os.path.dirname(blob_fpath), exist_ok=True)
+            fd, tmp_fpath = tempfile.mkstemp(
+                dir=os.path.dirname(blob_fpath), suffix=".tmp"
+            )
+            os.close(fd)
+            shutil.copyfile(fpath, tmp_fpath)
+            os.chmod(tmp_fpath, 0o444)
+            os.replace(tmp_fpath, blob_fpath)
+        return digest
+
+    def get(self, digest: str, fpath: str) -> None:
+        """
+        Place a blob at a file path, replacing any file that is there. The
+        file is read-only and must be replaced rather than written to.
+
+        Args:
+            digest: The digest of the blob.
+            fpath: The file path.
+        """
+        # a hard link needs a new name, so it is made in a directory of its
+        # own next to the file
+        tmp_dirpath = tempfile.mkdtemp(
+            dir=os.path.dirname(fpath), suffix=".tmp"
+        )
+        tmp_fpath = os.path.join(tmp_dirpath, os.path.basename(fpath))
+        try:
+            try:
+                os.link(self.blob_fpath(digest), tmp_fpath)
+            except OSError:
+                shutil.copyfile(self.blob_fpath(digest), tmp_fpath)
+            os.replace(tmp_fpath, fpath)
+        finally:
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+
+    def digests(self) -> List[str]:
+        """List the digests of all stored blobs."""
+        return [
+            os.path.basename(os.path.dirname(fpath)) + os.path.basename(fpath)
+            for fpath in glob.glob(os.path.join(self.dirpath, "*", "*"))
+            if not fpath.endswith(".tmp")
+        ]
+
+    def remove(self, digest: str) -> None:
+        """Remove a blob from the store."""
+        os.remove(self.blob_fpath(digest))
+
+
+class SnapshotStore:
+    """
+    Named, immutable snapshots of groups. A snapshot is only a manifest that
+    maps file names to blobs, so snapshots of mostly unchanged groups are
+    cheap.
+    """
+
+    def __init__(self, dirpath: str) -> None:
+        self.dirpath = dirpath
+        self.blobs = BlobStore(os.path.join(dirpath, "blobs"))
+
+    def _manifest_fpath(self, name: str) -> str:
+        if not re.fullmatch(SNAPSHOT_NAME_PATTERN, name):
+            raise ValueError(
+                f'Invalid snapshot name "{name}". Snapshot names can only'
+                ' contain letters, digits, "_", "-" and ".".'
+            )
+        return os.path.join(self.dirpath, "manifests", f"{name}.json")
+
+    def create(self, name: str, group_dirpath: str) -> Dict[str, Any]:
+        """
+        Snapshot the files of a group.
+
+        Args:
+            name: The name of the new snapshot.
+            group_dirpath: The directory of the group.
+
+        Raises:
+            ValueError: If the name is invalid or a snapshot with this name
+                already exists.
+
+        Returns:
+            The manifest of the snapshot.
+        """
+        manifest_fpath = self._manifest_fpath(name)
+        if os.path.exists(manifest_fpath):
+            raise ValueError(f'Snapshot "{name}" already exists.')
+        manifest = {
+            "group": os.path.basename(group_dirpath),
+            "created": time.time(),
+            "files": {
+                fname: self.blobs.put(os.path.join(group_dirpath, fname))
+                for fname in snapshot_fnames(group_dirpath)
+            },
+        }
+        os.makedirs(os.path.dirname(manifest_fpath), exist_ok=True)
+        fd, tmp_fpath = tempfile.mkstemp(
+            dir=os.path.dirname(manifest_fpath), suffix=".tmp"
+        )
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_fpath, manifest_fpath)
+        return manifest
+
+    def manifest(self, name: str) -> Dict[str, Any]:
+        """
+        Get the manifest of a snapshot.
+
+        Args:
+            name: The name of the snapshot.
+
+        Raises:
+            ValueError: If the snapshot does not exist.
+        """
+        try:
+            with open(self._manifest_fpath(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError as e:
+            raise ValueError(f'Snapshot "{name}" does not exist.') from e
+
+    def restore(self, name: str, group_dirpath: str) -> Dict[str, Any]:
+        """
+        Replace the files of a group with those of a snapshot. Build outputs
+        of the group are kept.
+
+        Args:
+            name: The name of the snapshot.
+            group_dirpath: The directory of the group to restore into, which
+                need not be the group the snapshot was taken of.
+
+        Raises:
+            ValueError: If the snapshot does not exist.
+
+        Returns:
+            The manifest of the snapshot.
+        """
+        manifest = self.manifest(name)
+        os.makedirs(group_dirpath, exist_ok=True)
+        for fname in snapshot_fnames(group_dirpath):
+            if fname not in manifest["files"]:
+                os.remove(os.path.join(group_dirpath, fname))
+        for fname, digest in manifest["files"].items():
+            self.blobs.get(digest, os.path.join(group_dirpath, fname))
+        return manifest
+
+    def names(self) -> List[str]:
+        """List the names of all snapshots, oldest first."""
+        fpaths = glob.glob(os.path.join(self.dirpath, "manifests", "*.json"))
+        fpaths.sort(key=os.path.getmtime)
+        return [os.path.basename(fpath)[: -len(".json")] for fpath in fpaths]
+
+    def delete(self, name: str) -> int:
+        """
+        Delete a snapshot and the blobs no other snapshot refers to.
+
+        Args:
+            name: The name of the snapshot.
+
+        Raises:
+            ValueError: If the snapshot does not exist.
+
+        Returns:
+            The number of removed blobs.
+        """
+        self.manifest(name)
+        os.remove(self._manifest_fpath(name))
+        referenced = set()
+        for other in self.names():
+            referenced.update(self.manifest(other)["files"].values())
+        removed = 0
+        for digest in self.blobs.digests():
+            if digest not in referenced:
+                self.blobs.remove(digest)
+                removed += 1
+        return removed
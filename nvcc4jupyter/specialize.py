@@ -0,0 +1,142 @@
+"""
+Specialization of CUDA programs with the values of notebook variables, used
+as compile-time constants. Every specialization is a distinct program for the
+compile cache, so switching back to values used before does not compile
+again.
+"""
+
+import math
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from .arrays import DTYPE_TO_CTYPE
+
+_IDENTIFIER_REGEX = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def parse_define(binding: str) -> Tuple[str, str]:
+    """
+    Parse a define of the form "NAME=VARIABLE" or "NAME".
+
+    Args:
+        binding: The value given to the --define option.
+
+    Raises:
+        ValueError: If the name is not a valid C++ identifier.
+
+    Returns:
+        The name used in the CUDA program and the name of the notebook
+        variable that holds its value. If the define has no "=" sign, both
+        names are the same.
+    """
+    name, _, variable = binding.partition("=")
+    name, variable = name.strip(), variable.strip()
+    if _IDENTIFIER_REGEX.match(name) is None:
+        raise ValueError(
+            f'Define name "{name}" must be a valid C++ identifier.'
+        )
+    return name, variable or name
+
+
+def _numpy_value(value: Any) -> Optional[Any]:
+    # numpy is only inspected if the notebook already imported it
+    numpy = sys.modules.get("numpy")
+    if numpy is None:
+        return None
+    if isinstance(value, numpy.dtype) or (
+        isinstance(value, type) and issubclass(value, numpy.generic)
+    ):
+        return numpy.dtype(value)
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return None
+
+
+def format_value(name: str, value: Any) -> str:
+    """
+    Format the value of a notebook variable as C++ source code: booleans as
+    "true" or "false", numbers as literals, NumPy dtypes and scalar types as
+    the matching C++ type (e.g. numpy.float32 as "float") and strings as
+    they are, so they can hold types or expressions.
+
+    Args:
+        name: The name of the define, for error messages.
+        value: The value.
+
+    Raises:
+        ValueError: If the value has another type or is not a finite number.
+    """
+    converted = _numpy_value(value)
+    if converted is not None:
+        value = converted
+    if hasattr(value, "name") and value.name in DTYPE_TO_CTYPE:
+        return DTYPE_TO_CTYPE[value.name]
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f'The value of "{name}" is not finite.')
+        return repr(value)
+    if isinstance(value, str):
+        return value
+    raise ValueError(
+        f'The value of "{name}" has type "{type(value).__name__}", which'
+        " cannot be used at compile time."
+    )
+
+
+def resolve_defines(
+    user_ns: Dict[str, Any], bindings: List[str]
+) -> Dict[str, str]:
+    """
+    Look up the values of defines in the notebook.
+
+    Args:
+        user_ns: The notebook namespace where variables are looked up.
+        bindings: The values given to the --define option.
+
+    Raises:
+        ValueError: If a name is invalid, a variable is not defined or its
+            value cannot be used at compile time.
+
+    Returns:
+        The C++ source code of every define, by name.
+    """
+    defines: Dict[str, str] = {}
+    for binding in bindings:
+        name, variable = parse_define(binding)
+        if variable not in user_ns:
+            raise ValueError(
+                f'Variable "{variable}" is not defined in the notebook.'
+            )
+        defines[name] = format_value(name, user_ns[variable])
+    return defines
+
+
+def define_compiler_args(defines: Dict[str, str]) -> str:
+    """
+    Get the compiler arguments that define every name as a macro. Values
+    that are empty or contain whitespace cannot be compiler arguments and
+    can only be used through "{{NAME}}" placeholders.
+    """
+    return " ".join(
+        f"-D{name}={value}"
+        for name, value in defines.items()
+        if value and re.search(r"\s", value) is None
+    )
+
+
+def specialize_source(source: str, defines: Dict[str, str]) -> str:
+    """
+    Replace the "{{NAME}}" placeholders of the defines in source code.
+    Other text between double braces, such as nested initializer lists, is
+    left as it is.
+    """
+    for name, value in defines.items():
+        source = re.sub(
+            r"\{\{\s*" + name + r"\s*\}\}", lambda _, v=value: v, source
+        )
+    return source
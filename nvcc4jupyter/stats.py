@@ -0,0 +1,310 @@
+"""
+Timing instrumentation of the phases (argument parsing, compilation, running,
+etc.) that make up every magic invocation.
+"""
+
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+# upper bounds (in seconds) of the histogram buckets, the last bucket holds
+# everything slower than the last bound
+HISTOGRAM_BOUNDS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    60.0,
+)
+EXPORT_FORMATS = ("jsonl", "prom")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class PhaseSummary:
+    """Aggregated durations of all spans of a phase."""
+
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+    buckets: List[int] = field(
+        default_factory=lambda: [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    )
+
+    @property
+    def mean(self) -> float:
+        """Mean duration of a span in seconds."""
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, duration: float) -> None:
+        """Add the duration of a span in seconds."""
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        for index, bound in enumerate(HISTOGRAM_BOUNDS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+class PhaseStats:
+    """
+    Collects the durations of named phases. Every span can also be appended
+    to a JSON lines file, or the aggregated histograms can be kept up to date
+    in a Prometheus textfile, so that they can be collected externally.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._phases: Dict[str, PhaseSummary] = {}
+        self.export_fpath: Optional[str] = None
+        self.export_format: str = "jsonl"
+
+    def record(self, phase: str, duration: float) -> None:
+        """
+        Record a span. If it cannot be exported, e.g. because the disk is
+        full, the error is reported and exporting stops, so that the magic
+        commands that are timed keep working.
+
+        Args:
+            phase: The name of the phase.
+            duration: The duration of the span in seconds.
+        """
+        with self._lock:
+            self._phases.setdefault(phase, PhaseSummary()).add(duration)
+            if self.export_fpath is None:
+                return
+            try:
+                if self.export_format == "jsonl":
+                    span = {"ts": time.time(), "phase": phase, "s": duration}
+                    with open(self.export_fpath, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span) + "\n")
+                else:
+                    _write_atomic(
+                        self.export_fpath, _prometheus(self._snapshot())
+                    )
+            except OSError as e:
+                print(
+                    f'Stopped exporting spans to "{self.export_fpath}": {e}',
+                    file=sys.stderr,
+                )
+                self.export_fpath = None
+
+    def span(self, phase: str) -> "_Span":
+        """
+        Context manager that records the time spent inside it.
+
+        Args:
+            phase: The name of the phase.
+        """
+        return _Span(self, phase)
+
+    def set_export(self, fpath: Optional[str], fmt: str = "jsonl") -> None:
+        """
+        Export spans as they are recorded.
+
+        Args:
+            fpath: The file path to export to, or None to stop exporting.
+            fmt: Either "jsonl" to append every span to a JSON lines file, or
+                "prom" to rewrite a Prometheus textfile with the histograms.
+                Defaults to "jsonl".
+
+        Raises:
+            ValueError: If the format is unknown or the file cannot be
+                written.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(
+                f'Unknown export format "{fmt}". Choose one of:'
+                f' {", ".join(EXPORT_FORMATS)}.'
+            )
+        with self._lock:
+            if fpath is not None:
+                # fail now instead of in every magic command that is timed
+                try:
+                    if fmt == "jsonl":
+                        with open(fpath, "a", encoding="utf-8"):
+                            pass
+                    else:
+                        _write_atomic(fpath, _prometheus(self._snapshot()))
+                except OSError as e:
+                    raise ValueError(
+                        f'Cannot export spans to "{fpath}": {e.strerror}.'
+                    ) from e
+            self.export_fpath = fpath
+            self.export_format = fmt
+
+    def reset(self) -> None:
+        """Forget all recorded spans."""
+        with self._lock:
+            self._phases.clear()
+
+    def _snapshot(self) -> Dict[str, PhaseSummary]:
+        return {
+            phase: PhaseSummary(
+                s.count, s.total, s.min, s.max, list(s.buckets)
+            )
+            for phase, s in self._phases.items()
+        }
+
+    def summary(self) -> Dict[str, PhaseSummary]:
+        """Get a copy of the aggregated durations of every phase."""
+        with self._lock:
+            return self._snapshot()
+
+    def histogram(self, phase: str) -> List[Tuple[float, int]]:
+        """
+        Get the histogram of the durations of a phase.
+
+        Args:
+            phase: The name of the phase.
+
+        Returns:
+            Pairs of bucket upper bound (in seconds, the last one being
+            infinity) and the number of spans that fell in that bucket.
+        """
+        summary = self.summary().get(phase, PhaseSummary())
+        bounds = HISTOGRAM_BOUNDS + (float("inf"),)
+        return list(zip(bounds, summary.buckets))
+
+    def table(self, histograms: bool = False) -> str:
+        """
+        Format the aggregated durations as a human readable table.
+
+        Args:
+            histograms: If True, also include the histogram of every phase.
+                Defaults to False.
+        """
+        summary = self.summary()
+        if not summary:
+            return "No spans recorded yet."
+        lines = [
+            f"{'phase':<20} {'count':>7} {'total':>10} {'mean':>10}"
+            f" {'min':>10} {'max':>10}"
+        ]
+        for phase, s in summary.items():
+            lines.append(
+                f"{phase:<20} {s.count:>7} {_ms(s.total):>10}"
+                f" {_ms(s.mean):>10} {_ms(s.min):>10} {_ms(s.max):>10}"
+            )
+        if histograms:
+            for phase in summary:
+                lines.append("")
+                lines.append(f"{phase}:")
+                for bound, count in self.histogram(phase):
+                    label = "+inf" if bound == float("inf") else _ms(bound)
+                    lines.append(f"  <= {label:>9} {count:>7} {'#' * count}")
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """Format the histograms in the Prometheus text exposition format."""
+        return _prometheus(self.summary())
+
+    def export(self, fpath: str, fmt: str = "jsonl") -> None:
+        """
+        Write the aggregated durations to a file once.
+
+        Args:
+            fpath: The file path.
+            fmt: Either "jsonl" to write one JSON object per phase or "prom"
+                to write a Prometheus textfile. Defaults to "jsonl".
+        """
+        if fmt == "prom":
+            _write_atomic(fpath, self.to_prometheus())
+            return
+        with open(fpath, "w", encoding="utf-8") as f:
+            for phase, s in self.summary().items():
+                record = {
+                    "phase": phase,
+                    "count": s.count,
+                    "total": s.total,
+                    "min": s.min,
+                    "max": s.max,
+                    "histogram": [
+                        ["+Inf" if bound == float("inf") else bound, count]
+                        for bound, count in self.histogram(phase)
+                    ],
+                }
+                f.write(json.dumps(record) + "\n")
+
+
+class _Span:
+    def __init__(self, stats: PhaseStats, phase: str) -> None:
+        self.stats = stats
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stats.record(self.phase, time.perf_counter() - self.start)
+
+
+def timed(phase: str) -> Callable[[F], F]:
+    """
+    Decorator that records the duration of every call of a method in the
+    "stats" attribute of its object.
+
+    Args:
+        phase: The name of the phase.
+    """
+
+    def decorator(method: F) -> F:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.span(phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}ms"
+
+
+def _prometheus(summary: Dict[str, PhaseSummary]) -> str:
+    name = "nvcc4jupyter_phase_duration_seconds"
+    lines = [
+        f"# HELP {name} Duration of nvcc4jupyter magic phases.",
+        f"# TYPE {name} histogram",
+    ]
+    bounds = [str(b) for b in HISTOGRAM_BOUNDS] + ["+Inf"]
+    for phase, s in sorted(summary.items()):
+        cumulative = 0
+        for bound, count in zip(bounds, s.buckets):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{phase="{phase}",le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{name}_sum{{phase="{phase}"}} {s.total}')
+        lines.append(f'{name}_count{{phase="{phase}"}} {s.count}')
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(fpath: str, text: str) -> None:
+    # replace the file atomically so collectors never read a partial file
+    dirpath = os.path.dirname(os.path.abspath(fpath))
+    fd, tmp_fpath = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_fpath, fpath)
@@ -0,0 +1,159 @@
+"""
+Streaming of notebook data to the standard input of CUDA programs. The data
+is written in chunks by a thread of its own that blocks while the pipe to the
+program is full, so input of any size flows through without being held in
+memory first.
+"""
+
+import threading
+from typing import IO, Any, Callable, Iterator, Optional
+
+WRITE_CHUNK_BYTES = 64 * 1024
+
+
+def _as_bytes(data: Any) -> Optional[memoryview]:
+    if isinstance(data, str):
+        data = data.encode("utf8")
+    try:
+        return memoryview(data).cast("B")
+    except TypeError:
+        return None
+
+
+def iter_chunks(
+    source: Any, chunk_bytes: int = WRITE_CHUNK_BYTES
+) -> Iterator[bytes]:
+    """
+    Split a source of input into chunks of bytes. Sources are only read as
+    far as the chunks are consumed.
+
+    Args:
+        source: A string, which is encoded as UTF-8, a bytes-like object
+            such as bytes or a contiguous NumPy array, a file object opened
+            in text or binary mode, or an iterable such as a generator of
+            strings and bytes-like objects. Small items of an iterable are
+            joined into chunks of up to "chunk_bytes" bytes.
+        chunk_bytes: The size of the chunks. Defaults to WRITE_CHUNK_BYTES.
+
+    Raises:
+        TypeError: If the source, or an item of an iterable source, is not
+            supported.
+
+    Yields:
+        The chunks, none of them empty.
+    """
+    data = _as_bytes(source)
+    if data is not None:
+        for start in range(0, len(data), chunk_bytes):
+            yield bytes(data[start : start + chunk_bytes])
+        return
+
+    read = getattr(source, "read", None)
+    if callable(read):
+        yield from _iter_read_chunks(read, chunk_bytes)
+        return
+
+    try:
+        items = iter(source)
+    except TypeError:
+        raise TypeError(
+            f'Cannot write a "{type(source).__name__}" to standard input.'
+        ) from None
+    yield from _iter_item_chunks(items, chunk_bytes)
+
+
+def _iter_read_chunks(
+    read: Callable[[int], Any], chunk_bytes: int
+) -> Iterator[bytes]:
+    # reads a file object until it is exhausted
+    while True:
+        chunk = _as_bytes(read(chunk_bytes))
+        if chunk is None or len(chunk) == 0:
+            return
+        yield bytes(chunk)
+
+
+def _iter_item_chunks(
+    items: Iterator[Any], chunk_bytes: int
+) -> Iterator[bytes]:
+    # joins small items into chunks and splits large ones
+    pending = bytearray()
+    try:
+        for item in items:
+            data = _as_bytes(item)
+            if data is None:
+                raise TypeError(
+                    f'Cannot write a "{type(item).__name__}" item to'
+                    " standard input, only strings and bytes-like objects."
+                )
+            if len(pending) + len(data) < chunk_bytes:
+                pending += data
+                continue
+            if pending:
+                yield bytes(pending)
+                pending.clear()
+            if len(data) < chunk_bytes:
+                pending += data
+            else:
+                yield from iter_chunks(data, chunk_bytes)
+    except Exception:
+        # the items taken so far are written even if the source failed
+        if pending:
+            yield bytes(pending)
+        raise
+    if pending:
+        yield bytes(pending)
+
+
+class StdinWriter:
+    """
+    Writes a source of input to the standard input of a program on a thread
+    of its own. The next chunk is only taken from the source once the
+    previous one was written, so a program that reads slowly holds back the
+    source instead of letting input pile up in memory.
+    """
+
+    def __init__(self, stream: IO[bytes], source: Any) -> None:
+        """
+        Args:
+            stream: The standard input of the program, which is closed once
+                the source is exhausted.
+            source: The input, see "iter_chunks".
+        """
+        self.stream = stream
+        self.source = source
+        self.bytes_written = 0
+        self.error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._write, daemon=True)
+
+    def start(self) -> None:
+        """Start writing the source."""
+        self._thread.start()
+
+    def join(self) -> None:
+        """Wait until the source is exhausted or the program exited."""
+        self._thread.join()
+
+    def _write(self) -> None:
+        try:
+            for chunk in iter_chunks(self.source):
+                self.stream.write(chunk)
+                self.bytes_written += len(chunk)
+        except BrokenPipeError:
+            # the program exited without reading all of its input
+            pass
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.error = e
+        finally:
+            try:
+                self.stream.close()
+            except BrokenPipeError:
+                pass
+
+    def check(self) -> None:
+        """
+        Raise the error the source failed with while it was written, e.g.
+        an exception raised by a generator.
+        """
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,304 @@
+"""
+Discovery of the CUDA toolkits installed side by side, so that every cell can
+choose the toolkit it is compiled and profiled with.
+"""
+
+import glob
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .path_utils import is_executable, which
+
+# directories that usually hold a CUDA toolkit each
+TOOLKIT_PATTERNS: List[str] = [
+    "/usr/local/cuda*",
+    "/opt/cuda*",
+    "/opt/nvidia/cuda*",
+]
+
+# extra toolkit directories, separated like the PATH environment variable
+TOOLKITS_ENV = "NVCC4JUPYTER_TOOLKITS"
+
+UNKNOWN_VERSION = "unknown"
+
+_VERSION_PATTERNS: Dict[str, str] = {
+    "nvcc": r"release [\d.]+, V([\d.]+)|release ([\d.]+)",
+    "ncu": r"Version ([\d.]+)",
+    "nsys": r"(?i)version ([\d.]+)",
+}
+
+
+@dataclass(frozen=True)
+class Toolkit:
+    """A CUDA toolkit and the profilers installed with it."""
+
+    # the "nvcc" executable identifies the toolkit
+    nvcc: str
+    version: str = UNKNOWN_VERSION
+    # the size and modification time of the "nvcc" executable
+    signature: str = ""
+    ncu: Optional[str] = None
+    ncu_version: Optional[str] = None
+    nsys: Optional[str] = None
+    nsys_version: Optional[str] = None
+
+    @property
+    def root(self) -> str:
+        """The installation directory of the toolkit."""
+        return os.path.dirname(os.path.dirname(self.nvcc))
+
+    def version_tuple(self) -> Tuple[int, ...]:
+        """The version as a tuple that sorts older versions first."""
+        if self.version == UNKNOWN_VERSION:
+            return ()
+        return tuple(int(part) for part in self.version.split("."))
+
+    def fingerprint(self, tools: Sequence[str] = ("nvcc",)) -> str:
+        """
+        Identify the toolkit in cache keys, so that cached artifacts are not
+        reused after switching or reinstalling the toolkit.
+
+        Args:
+            tools: The tools whose versions are part of the fingerprint, out
+                of "nvcc", "ncu" and "nsys". Defaults to only "nvcc".
+        """
+        parts = [f"cuda-{self.version}", self.signature]
+        for tool in tools:
+            if tool != "nvcc":
+                parts.append(f"{tool}-{getattr(self, tool + '_version')}")
+        return ":".join(parts)
+
+
+def nvcc_command(toolkit: Optional[Toolkit]) -> str:
+    """
+    Get the "nvcc" command of a toolkit, or the one found through the PATH
+    environment variable if no toolkit is given.
+    """
+    return toolkit.nvcc if toolkit is not None else "nvcc"
+
+
+def toolkit_fingerprint(toolkit: Optional[Toolkit]) -> str:
+    """Get the fingerprint of a toolkit, or "" if no toolkit is given."""
+    return toolkit.fingerprint() if toolkit is not None else ""
+
+
+def _signature(fpath: str) -> str:
+    stat = os.stat(fpath)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _tool_version(fpath: Optional[str], tool: str) -> Optional[str]:
+    if fpath is None:
+        return None
+    try:
+        output = subprocess.run(
+            [fpath, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=60,
+            check=False,
+        ).stdout.decode("utf8", errors="replace")
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(_VERSION_PATTERNS[tool], output)
+    if match is None:
+        return None
+    return next(group for group in match.groups() if group is not None)
+
+
+def _find_tool(nvcc: str, tool: str) -> Optional[str]:
+    bin_dirpath = os.path.dirname(nvcc)
+    root = os.path.dirname(bin_dirpath)
+    fpaths = [os.path.join(bin_dirpath, tool)]
+    # the profilers are also installed in their own directories
+    if tool == "ncu":
+        fpaths.extend(
+            sorted(glob.glob(os.path.join(root, "nsight-compute*", "ncu")))
+        )
+    else:
+        fpaths.extend(
+            sorted(
+                glob.glob(os.path.join(root, "nsight-systems*", "bin", "nsys"))
+            )
+        )
+    for fpath in fpaths:
+        if is_executable(fpath):
+            return fpath
+    return None
+
+
+def find_nvcc_executables() -> List[str]:
+    """
+    Find the "nvcc" executables of all installed toolkits: the one found
+    through the PATH environment variable, those of the directories in the
+    NVCC4JUPYTER_TOOLKITS environment variable and those of the usual
+    installation directories.
+
+    Returns:
+        The real paths of the executables, without duplicates.
+    """
+    fpaths = []
+    path_nvcc = which("nvcc")
+    if path_nvcc is not None:
+        fpaths.append(path_nvcc)
+    roots = [
+        r for r in os.environ.get(TOOLKITS_ENV, "").split(os.pathsep) if r
+    ]
+    for pattern in TOOLKIT_PATTERNS:
+        roots.extend(sorted(glob.glob(pattern)))
+    fpaths.extend(os.path.join(root, "bin", "nvcc") for root in roots)
+
+    nvcc_fpaths: List[str] = []
+    for fpath in fpaths:
+        if not is_executable(fpath):
+            continue
+        fpath = os.path.realpath(fpath)
+        if fpath not in nvcc_fpaths:
+            nvcc_fpaths.append(fpath)
+    return nvcc_fpaths
+
+
+def probe_toolkit(nvcc: str) -> Toolkit:
+    """
+    Find the profilers of a toolkit and ask all its tools for their version.
+
+    Args:
+        nvcc: The file path of the "nvcc" executable of the toolkit.
+    """
+    ncu = _find_tool(nvcc, "ncu")
+    nsys = _find_tool(nvcc, "nsys")
+    with ThreadPoolExecutor() as executor:
+        versions = list(
+            executor.map(
+                lambda args: _tool_version(*args),
+                [(nvcc, "nvcc"), (ncu, "ncu"), (nsys, "nsys")],
+            )
+        )
+    return Toolkit(
+        nvcc=nvcc,
+        version=versions[0] or UNKNOWN_VERSION,
+        signature=_signature(nvcc),
+        ncu=ncu,
+        ncu_version=versions[1],
+        nsys=nsys,
+        nsys_version=versions[2],
+    )
+
+
+class ToolkitIndex:
+    """
+    The installed toolkits, persisted in a file because asking the tools for
+    their versions is slow. The index is rebuilt when an "nvcc" executable
+    appears, disappears or changes.
+    """
+
+    def __init__(self, fpath: str) -> None:
+        """
+        Args:
+            fpath: The JSON file the index is persisted in.
+        """
+        self.fpath = fpath
+        self._signatures: Optional[Dict[str, str]] = None
+        self._toolkits: List[Toolkit] = []
+        self._lock = threading.Lock()
+
+    def _load(self, signatures: Dict[str, str]) -> Optional[List[Toolkit]]:
+        try:
+            with open(self.fpath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["signatures"] != signatures:
+                return None
+            return [Toolkit(**toolkit) for toolkit in data["toolkits"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save(self, signatures: Dict[str, str]) -> None:
+        dirpath = os.path.dirname(self.fpath)
+        os.makedirs(dirpath, exist_ok=True)
+        fd, tmp_fpath = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "signatures": signatures,
+                    "toolkits": [asdict(t) for t in self._toolkits],
+                },
+                f,
+            )
+        os.replace(tmp_fpath, self.fpath)
+
+    def toolkits(self, refresh: bool = False) -> List[Toolkit]:
+        """
+        Get the installed toolkits.
+
+        Args:
+            refresh: If True, the tools are asked for their versions even if
+                no "nvcc" executable changed, e.g. after installing a new
+                profiler. Defaults to False.
+
+        Returns:
+            The toolkits, in the order their "nvcc" executables were found,
+            see "find_nvcc_executables".
+        """
+        with self._lock:
+            signatures = {
+                fpath: _signature(fpath) for fpath in find_nvcc_executables()
+            }
+            if not refresh and signatures == self._signatures:
+                return list(self._toolkits)
+
+            toolkits = None if refresh else self._load(signatures)
+            if toolkits is None:
+                with ThreadPoolExecutor() as executor:
+                    toolkits = list(executor.map(probe_toolkit, signatures))
+            self._toolkits = toolkits
+            self._signatures = signatures
+            self._save(signatures)
+            return list(self._toolkits)
+
+    def select(self, version: Optional[str] = None) -> Optional[Toolkit]:
+        """
+        Choose a toolkit.
+
+        Args:
+            version: A full version such as "12.2.140" or a prefix of it
+                such as "12" or "12.2", in which case the newest matching
+                toolkit is chosen. If None, the toolkit of the "nvcc" found
+                through the PATH environment variable is chosen, or the newest
+                toolkit if there is none. Defaults to None.
+
+        Raises:
+            ValueError: If no installed toolkit matches the version.
+
+        Returns:
+            The toolkit, or None if no version was requested and no toolkit
+            is installed.
+        """
+        toolkits = self.toolkits()
+        if version is None:
+            path_nvcc = which("nvcc")
+            for toolkit in toolkits:
+                if path_nvcc and toolkit.nvcc == os.path.realpath(path_nvcc):
+                    return toolkit
+            matches = toolkits
+        else:
+            matches = [
+                t
+                for t in toolkits
+                if t.version == version or t.version.startswith(version + ".")
+            ]
+            if not matches:
+                installed = ", ".join(t.version for t in toolkits) or "none"
+                raise ValueError(
+                    f'CUDA toolkit "{version}" is not installed. Installed'
+                    f" toolkits: {installed}."
+                )
+        if not matches:
+            return None
+        return max(matches, key=lambda t: t.version_tuple())
@@ -5,10 +5,27 @@ import os
 import pytest
 from IPython.core.interactiveshell import InteractiveShell
 
+from nvcc4jupyter.backends import Backend
+from nvcc4jupyter.devices import DevicePolicy
+from nvcc4jupyter.output import DEFAULT_MAX_OUTPUT
 from nvcc4jupyter.parsers import Profiler
+from nvcc4jupyter.path_utils import CACHE_DIR_ENV
 from nvcc4jupyter.plugin import NVCCPlugin
 
 
+@pytest.fixture(scope="session", autouse=True)
+def cache_dirpath(tmp_path_factory):
+    # keep the tests away from the cache directory of the developer
+    old_value = os.environ.get(CACHE_DIR_ENV)
+    dirpath = str(tmp_path_factory.mktemp("cache"))
+    os.environ[CACHE_DIR_ENV] = dirpath
+    yield dirpath
+    if old_value is None:
+        del os.environ[CACHE_DIR_ENV]
+    else:
+        os.environ[CACHE_DIR_ENV] = old_value
+
+
 @pytest.fixture(scope="session")
 def shell():
     return InteractiveShell()
@@ -82,4 +99,21 @@ def default_args():
         profiler=lambda: Profiler.NCU,
         profiler_args=lambda: "",
         compiler_args=lambda: "",
+        inputs=[],
+        outputs=[],
+        out_var=None,
+        stdin=None,
+        timeout=None,
+        max_memory=None,
+        max_cpu=None,
+        memoize=False,
+        memoize_deps=[],
+        dlto=False,
+        backend=lambda: Backend.NVCC,
+        toolkit=lambda: None,
+        no_compile_cache=False,
+        kernel_timing=False,
+        defines=[],
+        max_output=DEFAULT_MAX_OUTPUT,
+        device_policy=lambda: DevicePolicy.NONE,
     )
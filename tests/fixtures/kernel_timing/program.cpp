@@ -0,0 +1,26 @@
+#include <chrono>
+#include <cstddef>
+#include <cstdio>
+#include <thread>
+
+struct dim3 {
+    unsigned int x, y, z;
+};
+
+extern "C" int cudaLaunchKernel(const void *, dim3, dim3, void **, size_t,
+                                void *);
+
+void fast_kernel() {}
+
+void slow_kernel() { std::this_thread::sleep_for(std::chrono::milliseconds(5)); }
+
+int main() {
+    dim3 one = {1, 1, 1};
+    for (int i = 0; i < 3; i++) {
+        cudaLaunchKernel((const void *)fast_kernel, one, one, nullptr, 0,
+                         nullptr);
+    }
+    cudaLaunchKernel((const void *)slow_kernel, one, one, nullptr, 0, nullptr);
+    printf("done\n");
+    return 0;
+}
@@ -0,0 +1,40 @@
+// A host-only stand-in for the CUDA runtime: kernels are host functions that
+// run synchronously and events hold the host time they were recorded at.
+#include <chrono>
+#include <cstddef>
+
+struct dim3 {
+    unsigned int x, y, z;
+};
+
+extern "C" {
+
+int cudaLaunchKernel(const void *func, dim3, dim3, void **, size_t, void *) {
+    reinterpret_cast<void (*)()>(const_cast<void *>(func))();
+    return 0;
+}
+
+int cudaEventCreate(void **event) {
+    *event = new double(0);
+    return 0;
+}
+
+int cudaEventRecord(void *event, void *) {
+    auto now = std::chrono::steady_clock::now().time_since_epoch();
+    *static_cast<double *>(event) =
+        std::chrono::duration<double, std::milli>(now).count();
+    return 0;
+}
+
+int cudaEventSynchronize(void *) { return 0; }
+
+int cudaEventElapsedTime(float *ms, void *start, void *stop) {
+    *ms = *static_cast<double *>(stop) - *static_cast<double *>(start);
+    return 0;
+}
+
+int cudaEventDestroy(void *event) {
+    delete static_cast<double *>(event);
+    return 0;
+}
+}
@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from nvcc4jupyter.arrays import (
+    ARRAYS_HEADER_FNAME,
+    bind_arrays,
+    parse_input_binding,
+    parse_output_binding,
+)
+
+np = pytest.importorskip("numpy")
+
+# host-only program that doubles input "x" in place and writes the sum of its
+# elements to output "total"
+ARRAYS_PROGRAM = """
+#include "nvcc4jupyter_arrays.h"
+
+int main() {
+    float *x = arrays::x::data();
+    double total = 0.0;
+    for (size_t i = 0; i < arrays::x::size; i++) {
+        x[i] *= 2.0f;
+        total += x[i];
+    }
+    arrays::total::data()[0] = total;
+    return 0;
+}
+"""
+
+
+def test_parse_input_binding():
+    assert parse_input_binding("x=arr") == ("x", "arr")
+    assert parse_input_binding("x") == ("x", "x")
+    with pytest.raises(ValueError):
+        parse_input_binding("1x=arr")
+
+
+def test_parse_output_binding():
+    assert parse_output_binding("y") == ("y", None, None)
+    assert parse_output_binding("y=float32[1024,3]") == (
+        "y",
+        "float32",
+        (1024, 3),
+    )
+    assert parse_output_binding("y=int64[]") == ("y", "int64", ())
+    with pytest.raises(ValueError):
+        parse_output_binding("y=float32")
+    with pytest.raises(ValueError):
+        parse_output_binding("y=object[3]")
+
+
+def test_bind_arrays():
+    user_ns = {"arr": np.arange(6, dtype=np.float32).reshape(2, 3)}
+    arrays = bind_arrays(user_ns, ["x=arr"], ["x", "y=int32[4]"])
+    try:
+        assert len(arrays) == 2
+        env = arrays.env()
+        assert set(env) == {"NVCC4JUPYTER_ARRAY_x", "NVCC4JUPYTER_ARRAY_y"}
+        assert os.path.getsize(env["NVCC4JUPYTER_ARRAY_x"]) == 24
+
+        header = arrays.header()
+        assert "namespace x {" in header
+        assert "typedef float value_type;" in header
+        assert "const size_t shape[] = {2, 3};" in header
+        assert "typedef int32_t value_type;" in header
+        assert "const value_type *data()" not in header
+
+        outputs = arrays.collect()
+        np.testing.assert_array_equal(outputs["x"], user_ns["arr"])
+        np.testing.assert_array_equal(outputs["y"], np.zeros(4, np.int32))
+    finally:
+        arrays.cleanup()
+    assert not os.path.exists(arrays.dirpath)
+
+
+def test_bind_arrays_errors():
+    with pytest.raises(ValueError):
+        bind_arrays({}, ["x=undefined"], [])
+    with pytest.raises(ValueError):
+        bind_arrays({"a": np.zeros(3)}, ["x=a"], ["y"])
+    with pytest.raises(ValueError):
+        bind_arrays({"a": np.zeros(3)}, ["x=a", "x=a"], [])
+
+
+def test_bind_arrays_memmap_not_copied(tmp_path):
+    fpath = str(tmp_path / "data.bin")
+    data = np.memmap(fpath, dtype=np.int16, mode="w+", shape=(8,))
+    data[:] = 7
+    arrays = bind_arrays({"data": data}, ["x=data"], [])
+    try:
+        assert arrays.env()["NVCC4JUPYTER_ARRAY_x"] == fpath
+        # inputs that are not outputs are mapped read-only
+        header = arrays.header()
+        assert "inline const value_type *data()" in header
+        assert '"NVCC4JUPYTER_ARRAY_x", size * sizeof(value_type), false' in (
+            header
+        )
+    finally:
+        arrays.cleanup()
+    assert os.path.exists(fpath)
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="requires g++")
+def test_arrays_header_program(tmp_path):
+    user_ns = {"arr": np.arange(5, dtype=np.float32)}
+    arrays = bind_arrays(user_ns, ["x=arr"], ["x", "total=float64[1]"])
+    try:
+        arrays.write_header(str(tmp_path))
+        assert os.path.exists(tmp_path / ARRAYS_HEADER_FNAME)
+        source_fpath = tmp_path / "main.cpp"
+        source_fpath.write_text(ARRAYS_PROGRAM, encoding="utf-8")
+        exec_fpath = str(tmp_path / "main.out")
+        subprocess.check_call(
+            ["g++", "-I", str(tmp_path), str(source_fpath), "-o", exec_fpath]
+        )
+        subprocess.check_call([exec_fpath], env={**os.environ, **arrays.env()})
+        outputs = arrays.collect()
+    finally:
+        arrays.cleanup()
+
+    assert not os.path.exists(tmp_path / ARRAYS_HEADER_FNAME)
+    np.testing.assert_array_equal(outputs["x"], np.arange(5) * 2)
+    assert outputs["total"][0] == 20.0
+    # the input array itself was copied to shared memory and is unchanged
+    np.testing.assert_array_equal(user_ns["arr"], np.arange(5))
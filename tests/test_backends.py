@@ -0,0 +1,77 @@
+import os
+import subprocess
+
+import pytest
+
+from nvcc4jupyter.backends import (
+    Backend,
+    CompileCache,
+    compile_key,
+    get_backend,
+)
+
+
+def write_group(dirpath, code: str, header: str = "") -> str:
+    os.makedirs(dirpath, exist_ok=True)
+    with open(os.path.join(dirpath, "util.h"), "w") as f:
+        f.write(header)
+    source_fpath = os.path.join(dirpath, "main.cu")
+    with open(source_fpath, "w") as f:
+        f.write(code)
+    return source_fpath
+
+
+def test_compile_key(tmp_path):
+    backend = get_backend(Backend.NVCC)
+    first = write_group(str(tmp_path / "a"), "int main() {}")
+    second = write_group(str(tmp_path / "b"), "int main() {}")
+
+    def key(fpath: str, compiler_args: str = "") -> str:
+        include_dirpaths = [os.path.dirname(fpath)]
+        return compile_key(backend, [fpath], include_dirpaths, compiler_args)
+
+    # identical files in other directories share the key
+    assert key(first) == key(second)
+    assert key(first) != key(first, "-O3")
+    assert key(first) != compile_key(
+        get_backend(Backend.CLANG), [first], [os.path.dirname(first)]
+    )
+    write_group(str(tmp_path / "b"), "int main() {}", "// changed")
+    assert key(first) != key(second)
+
+
+def test_compile_cache(tmp_path):
+    cache = CompileCache(str(tmp_path / "cache"), max_bytes=10)
+    artifact_fpath = str(tmp_path / "artifact")
+    with open(artifact_fpath, "w") as f:
+        f.write("123456")
+    output_fpath = str(tmp_path / "output")
+
+    assert not cache.get("a", output_fpath)
+    cache.put("a", artifact_fpath)
+    assert cache.get("a", output_fpath)
+    with open(output_fpath) as f:
+        assert f.read() == "123456"
+
+    # the least recently used artifact is evicted
+    cache.put("b", artifact_fpath)
+    assert not cache.get("a", output_fpath)
+    assert cache.get("b", output_fpath)
+
+
+def test_nvrtc_backend(tmp_path):
+    backend = get_backend(Backend.NVRTC)
+    if backend.executable() is None:
+        pytest.skip("NVRTC is not installed")
+    source_fpath = write_group(
+        str(tmp_path), '#include "util.h"\n__global__ void kernel() {}\n'
+    )
+    output_fpath = str(tmp_path / "main.ptx")
+    backend.compile([source_fpath], [str(tmp_path)], output_fpath)
+    with open(output_fpath) as f:
+        assert "kernel" in f.read()
+
+    source_fpath = write_group(str(tmp_path), "__global__ void kernel( {}\n")
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        backend.compile([source_fpath], [str(tmp_path)], output_fpath)
+    assert b"error" in e.value.output
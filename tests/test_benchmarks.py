@@ -0,0 +1,30 @@
+import json
+
+import pytest
+from benchmarks.bench_plugin import (
+    BASELINE_FPATH,
+    BENCHMARKS,
+    find_regressions,
+    run_benchmarks,
+)
+
+
+def test_find_regressions():
+    baseline = {"cell_overhead": 0.01, "output_throughput": 100.0}
+    assert find_regressions(baseline, baseline) == []
+    regressions = find_regressions(
+        {"cell_overhead": 0.03, "output_throughput": 40.0}, baseline
+    )
+    assert len(regressions) == 2
+    assert regressions[0].startswith("cell_overhead")
+
+
+@pytest.mark.slow
+def test_benchmarks_against_baseline():
+    with open(BASELINE_FPATH, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    assert set(baseline) == {benchmark.name for benchmark in BENCHMARKS}
+
+    # machines differ a lot, so only catch large regressions
+    results = run_benchmarks(repeats=1)
+    assert find_regressions(results, baseline, tolerance=5.0) == []
@@ -0,0 +1,165 @@
+import os
+import subprocess
+import time
+from typing import List
+
+import pytest
+
+from nvcc4jupyter import build
+from nvcc4jupyter.build import (
+    LibraryBuilder,
+    compile_lto_objects,
+    dependency_graph,
+    topological_order,
+    write_group_metadata,
+)
+
+
+def make_group(workdir: str, name: str, depends: List[str]) -> None:
+    group_dirpath = os.path.join(workdir, name)
+    write_group_metadata(group_dirpath, {"depends": depends})
+    with open(os.path.join(group_dirpath, f"{name}.cu"), "w") as f:
+        f.write(f"int {name}() {{ return 0; }}\n")
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    # d depends on b and c, which both depend on a
+    workdir = str(tmp_path)
+    make_group(workdir, "a", [])
+    make_group(workdir, "b", ["a"])
+    make_group(workdir, "c", ["a"])
+    make_group(workdir, "d", ["b", "c"])
+    return workdir
+
+
+@pytest.fixture
+def nvcc_calls(monkeypatch):
+    calls = []
+
+    def check_output(args, **kwargs):
+        calls.append(args)
+        with open(args[args.index("-o") + 1], "wb") as f:
+            f.write(b"object")
+        return b""
+
+    monkeypatch.setattr(build.subprocess, "check_output", check_output)
+    return calls
+
+
+def built_groups(calls) -> List[str]:
+    return [
+        os.path.basename(args[args.index("-o") + 1])[3:-2] for args in calls
+    ]
+
+
+def test_topological_order(workdir: str):
+    graph = dependency_graph(workdir, "d")
+    assert graph == {"a": [], "b": ["a"], "c": ["a"], "d": ["b", "c"]}
+    order = topological_order(graph)
+    assert order.index("a") < order.index("b") < order.index("d")
+    assert order.index("c") < order.index("d")
+    assert topological_order(graph, "b") == ["a", "b"]
+
+
+def test_dependency_graph_errors(workdir: str):
+    make_group(workdir, "e", ["missing"])
+    with pytest.raises(RuntimeError, match="does not exist"):
+        dependency_graph(workdir, "e")
+    write_group_metadata(os.path.join(workdir, "a"), {"depends": ["d"]})
+    with pytest.raises(RuntimeError, match="a -> d -> b -> a"):
+        dependency_graph(workdir, "a")
+
+
+def test_build_only_dirty(workdir: str, nvcc_calls):
+    builder = LibraryBuilder(workdir)
+    args = builder.build("d", os.path.join(workdir, "shared"))
+    assert sorted(built_groups(nvcc_calls)) == ["a", "b", "c"]
+    assert built_groups(nvcc_calls)[0] == "a"
+    libraries = [arg for arg in args if arg.endswith(".a")]
+    assert libraries.index(builder.library_fpath("b")) < libraries.index(
+        builder.library_fpath("a")
+    )
+
+    # nothing changed
+    builder.build("d", os.path.join(workdir, "shared"))
+    assert len(nvcc_calls) == 3
+
+    # a header of "a" is visible to every group that depends on it
+    with open(os.path.join(workdir, "a", "a.h"), "w") as f:
+        f.write("int a();\n")
+    builder.build("d", os.path.join(workdir, "shared"))
+    assert sorted(built_groups(nvcc_calls[3:])) == ["a", "b", "c"]
+
+    # other compiler arguments
+    builder.build("d", os.path.join(workdir, "shared"), "-O3")
+    assert len(nvcc_calls) == 9
+
+
+def test_build_failure(workdir: str, monkeypatch):
+    def check_output(args, **kwargs):
+        raise subprocess.CalledProcessError(1, args, output=b"error")
+
+    monkeypatch.setattr(build.subprocess, "check_output", check_output)
+    with pytest.raises(subprocess.CalledProcessError):
+        LibraryBuilder(workdir).build("d", os.path.join(workdir, "shared"))
+
+
+def test_compile_lto_objects(tmp_path, nvcc_calls):
+    source_dirpath = tmp_path / "group"
+    source_dirpath.mkdir()
+    source_fpaths = []
+    for name in ("a.cu", "b.cu"):
+        (source_dirpath / name).write_text(f"// {name}\n")
+        source_fpaths.append(str(source_dirpath / name))
+    cache_dirpath = str(tmp_path / "lto")
+
+    objects = compile_lto_objects(
+        source_fpaths, [str(source_dirpath)], cache_dirpath
+    )
+    assert len(set(objects)) == 2
+    assert all(os.path.exists(fpath) for fpath in objects)
+    assert all("-dlto" in args and "-dc" in args for args in nvcc_calls)
+
+    # only the changed file is compiled again
+    (source_dirpath / "b.cu").write_text("// changed\n")
+    changed = compile_lto_objects(
+        source_fpaths, [str(source_dirpath)], cache_dirpath
+    )
+    assert len(nvcc_calls) == 3
+    assert changed[0] == objects[0] and changed[1] != objects[1]
+
+    # headers can be included by every file
+    (source_dirpath / "a.h").write_text("// header\n")
+    compile_lto_objects(source_fpaths, [str(source_dirpath)], cache_dirpath)
+    assert len(nvcc_calls) == 5
+
+
+def test_compile_lto_objects_eviction(tmp_path, nvcc_calls):
+    source_dirpath = tmp_path / "group"
+    source_dirpath.mkdir()
+    source_fpaths = []
+    for name in ("a.cu", "b.cu", "c.cu"):
+        (source_dirpath / name).write_text(f"// {name}\n")
+        source_fpaths.append(str(source_dirpath / name))
+    include_dirpaths = [str(source_dirpath)]
+    cache_dirpath = str(tmp_path / "lto")
+
+    # the objects of a compilation are kept even beyond the limit
+    objects = compile_lto_objects(
+        source_fpaths[:2], include_dirpaths, cache_dirpath, max_cache_bytes=0
+    )
+    assert all(os.path.exists(fpath) for fpath in objects)
+
+    # a cache hit marks an object as recently used
+    time.sleep(0.01)
+    compile_lto_objects(source_fpaths[:1], include_dirpaths, cache_dirpath)
+    max_cache_bytes = 2 * len(b"object")
+    (other,) = compile_lto_objects(
+        source_fpaths[2:],
+        include_dirpaths,
+        cache_dirpath,
+        max_cache_bytes=max_cache_bytes,
+    )
+    assert os.path.exists(objects[0]) and os.path.exists(other)
+    assert not os.path.exists(objects[1])
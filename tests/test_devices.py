@@ -0,0 +1,130 @@
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from nvcc4jupyter.devices import (
+    DEFAULT_STATE_FPATH,
+    DevicePolicy,
+    DeviceScheduler,
+    list_devices,
+)
+from nvcc4jupyter.parsers import get_parser_cuda
+
+
+@pytest.fixture
+def state_fpath(tmp_path):
+    return str(tmp_path / "devices.json")
+
+
+def make_scheduler(state_fpath: str, ndevices: int = 4, **kwargs):
+    devices = [str(index) for index in range(ndevices)]
+    return DeviceScheduler(
+        state_fpath, enumerate_devices=lambda: devices, **kwargs
+    )
+
+
+def test_list_devices_env(monkeypatch):
+    monkeypatch.setenv("NVCC4JUPYTER_DEVICES", "0,2,3")
+    assert list_devices() == ["0", "2", "3"]
+
+
+def test_defaults():
+    # scheduling is opt-in and all users share a state file
+    args = get_parser_cuda().parse_args([])
+    assert args.device_policy() == DevicePolicy.NONE
+    assert os.path.basename(DEFAULT_STATE_FPATH) == "nvcc4jupyter-devices.json"
+
+
+def test_state_files_are_shared(state_fpath):
+    old_umask = os.umask(0o077)
+    try:
+        make_scheduler(state_fpath).loads()
+    finally:
+        os.umask(old_umask)
+    for fpath in (state_fpath, state_fpath + ".lock"):
+        assert stat.S_IMODE(os.stat(fpath).st_mode) == 0o666
+
+
+def test_assign_none(state_fpath):
+    scheduler = make_scheduler(state_fpath)
+    with scheduler.assign(DevicePolicy.NONE) as device:
+        assert device is None
+    # a single GPU is never scheduled
+    scheduler = make_scheduler(state_fpath, ndevices=1)
+    with scheduler.assign(DevicePolicy.LEAST_LOADED) as device:
+        assert device is None
+
+
+def test_assign_least_loaded(state_fpath):
+    # two schedulers sharing a state file act like two notebook kernels
+    first = make_scheduler(state_fpath, max_jobs_per_device=2)
+    second = make_scheduler(state_fpath, max_jobs_per_device=2)
+    policy = DevicePolicy.LEAST_LOADED
+    with first.assign(policy) as d0, second.assign(policy) as d1:
+        with first.assign(policy) as d2:
+            assert len({d0, d1, d2}) == 3
+            assert second.loads() == {"0": 1, "1": 1, "2": 1, "3": 0}
+    assert first.loads() == {"0": 0, "1": 0, "2": 0, "3": 0}
+
+
+def test_assign_round_robin(state_fpath):
+    scheduler = make_scheduler(state_fpath, ndevices=3)
+    devices = []
+    for _ in range(4):
+        with scheduler.assign(DevicePolicy.ROUND_ROBIN) as device:
+            devices.append(device)
+    assert devices == ["0", "1", "2", "0"]
+
+
+def test_assign_waits_when_busy(state_fpath):
+    scheduler = make_scheduler(state_fpath, ndevices=2, poll_interval=0.01)
+    policy = DevicePolicy.LEAST_LOADED
+    assigned = []
+
+    def run():
+        with scheduler.assign(policy) as device:
+            assigned.append(device)
+
+    with scheduler.assign(policy), scheduler.assign(policy):
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.1)
+        assert assigned == []
+    thread.join(timeout=5)
+    assert len(assigned) == 1
+
+
+def test_lease_exclusive(state_fpath):
+    # a single GPU is held too
+    scheduler = make_scheduler(
+        state_fpath, ndevices=1, max_jobs_per_device=2, poll_interval=0.01
+    )
+    policy = DevicePolicy.LEAST_LOADED
+    with scheduler.lease(policy) as device, scheduler.lease(policy) as other:
+        assert device == other == "0"
+    with scheduler.lease(policy):
+        acquired = threading.Event()
+
+        def exclusive():
+            with scheduler.lease(policy, exclusive=True):
+                acquired.set()
+
+        thread = threading.Thread(target=exclusive, daemon=True)
+        thread.start()
+        # an exclusive run waits until the GPU runs nothing else
+        assert not acquired.wait(0.1)
+    assert acquired.wait(5)
+    thread.join(timeout=5)
+
+
+def test_stale_leases_are_dropped(state_fpath):
+    # a lease held by a process that no longer exists
+    with open(state_fpath, "w", encoding="utf-8") as f:
+        lease = {"device": "0", "pid": 2**22 + 1, "token": "stale"}
+        json.dump({"leases": {"0": [lease]}, "next": 0}, f)
+    scheduler = make_scheduler(state_fpath, ndevices=2)
+    assert scheduler.loads() == {"0": 0, "1": 0}
@@ -0,0 +1,79 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from nvcc4jupyter.kernel_timing import (
+    build_timing_shim,
+    format_kernel_timings,
+    kernel_timing_env,
+    kernel_timing_fpath,
+    read_kernel_timings,
+)
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("c++") is None, reason="a C++ compiler is required"
+)
+
+
+@pytest.fixture
+def stub_program(fixtures_path: str, tmp_path):
+    """
+    A program that launches kernels through a host-only stub of the CUDA
+    runtime, which is linked dynamically like the real shared runtime.
+    """
+    dirpath = os.path.join(fixtures_path, "kernel_timing")
+    subprocess.check_call([
+        "c++",
+        "-shared",
+        "-fPIC",
+        os.path.join(dirpath, "stub_runtime.cpp"),
+        "-o",
+        str(tmp_path / "libcudart.so"),
+    ])
+    exec_fpath = str(tmp_path / "program.out")
+    subprocess.check_call([
+        "c++",
+        os.path.join(dirpath, "program.cpp"),
+        "-o",
+        exec_fpath,
+        "-rdynamic",
+        f"-L{tmp_path}",
+        "-lcudart",
+        f"-Wl,-rpath,{tmp_path}",
+    ])
+    return exec_fpath
+
+
+def test_kernel_timing(stub_program: str, tmp_path):
+    cache_dirpath = str(tmp_path / "cache")
+    command = ["c++", "-shared", "-fPIC"]
+    shim_fpath = build_timing_shim(cache_dirpath, command)
+    assert build_timing_shim(cache_dirpath, command) == shim_fpath
+
+    timing_fpath = kernel_timing_fpath(stub_program)
+    output = subprocess.check_output(
+        [stub_program],
+        env=dict(os.environ, **kernel_timing_env(shim_fpath, timing_fpath)),
+    )
+    assert output == b"done\n"
+
+    timings = read_kernel_timings(timing_fpath)
+    assert [(t["kernel"], t["launches"]) for t in timings] == [
+        ("slow_kernel()", 1),
+        ("fast_kernel()", 3),
+    ]
+    slow = timings[0]
+    assert slow["total_ms"] == slow["mean_ms"] == slow["max_ms"] >= 5
+    assert timings[1]["mean_ms"] == pytest.approx(timings[1]["total_ms"] / 3)
+
+    table = format_kernel_timings(timings).splitlines()
+    assert table[0].split() == ["kernel", "launches", "total", "mean", "max"]
+    assert table[1].startswith("slow_kernel() ")
+
+    # without the library nothing is recorded
+    os.remove(timing_fpath)
+    subprocess.check_output([stub_program])
+    assert read_kernel_timings(timing_fpath) == []
+    assert format_kernel_timings([]) == "No kernel launches were recorded."
@@ -0,0 +1,59 @@
+import os
+
+from nvcc4jupyter.memo import MemoStore, memo_key
+from nvcc4jupyter.results import RunResult
+
+
+def write_file(fpath: str, content: bytes) -> str:
+    with open(fpath, "wb") as f:
+        f.write(content)
+    return fpath
+
+
+def test_memo_key(tmp_path):
+    exec_a = write_file(str(tmp_path / "a.out"), b"program")
+    exec_b = write_file(str(tmp_path / "b.out"), b"program")
+    exec_c = write_file(str(tmp_path / "c.out"), b"other program")
+
+    # the executable path does not matter, only its contents
+    key = memo_key(exec_a, [exec_a])
+    assert key == memo_key(exec_b, [exec_b])
+    assert key != memo_key(exec_c, [exec_c])
+    assert key != memo_key(exec_a, ["ncu", exec_a])
+    assert key != memo_key(exec_a, [exec_a], env={"X": "1"})
+
+    # files given through the environment contribute their contents
+    input_a = write_file(str(tmp_path / "in_a.bin"), b"data")
+    input_b = write_file(str(tmp_path / "in_b.bin"), b"data")
+    assert memo_key(exec_a, [exec_a], env={"IN": input_a}) == memo_key(
+        exec_a, [exec_a], env={"IN": input_b}
+    )
+
+    dep = write_file(str(tmp_path / "dep.txt"), b"1")
+    key_dep = memo_key(exec_a, [exec_a], input_fpaths=[dep])
+    write_file(dep, b"2")
+    assert key_dep != memo_key(exec_a, [exec_a], input_fpaths=[dep])
+
+
+def test_memo_store(tmp_path):
+    store = MemoStore(str(tmp_path / "memo"))
+    assert store.get("missing") is None
+    assert store.clear() == 0
+
+    result = RunResult(stdout="Hello World!\n", run_time=1.5)
+    store.put("key", result)
+    assert store.get("key") == result
+    assert store.clear() == 1
+    assert store.get("key") is None
+
+
+def test_memo_store_eviction(tmp_path):
+    store = MemoStore(str(tmp_path), max_bytes=1000)
+    for index in range(10):
+        store.put(f"key{index}", RunResult(stdout="x" * 200))
+        # make sure the modification times are strictly increasing
+        os.utime(tmp_path / f"key{index}.json", (index, index))
+    assert store.get("key0") is None
+    assert store.get("key9") is not None
+    total_bytes = sum(f.stat().st_size for f in tmp_path.iterdir())
+    assert total_bytes <= 1000
@@ -0,0 +1,54 @@
+import json
+import os
+
+from nvcc4jupyter.notebook import CELL_GROUP_NAME, scan_notebook
+
+
+def write_notebook(fpath: str, cells) -> str:
+    notebook = {
+        "cells": [
+            {"cell_type": cell_type, "source": source}
+            for cell_type, source in cells
+        ]
+    }
+    with open(fpath, "w", encoding="utf-8") as f:
+        json.dump(notebook, f)
+    return fpath
+
+
+def test_scan_notebook(tmp_path):
+    fpath = write_notebook(
+        str(tmp_path / "notebook.ipynb"),
+        [
+            ("markdown", "%%cuda\nnot code"),
+            ("code", '%%cuda_group_save -g shared -n "utils.h"\n// utils'),
+            ("code", '%%cuda -c "--optimize 3"\nint main() {}'),
+            ("code", "%%cuda_group_save -g app -n main.cu\nint main() {}"),
+            ("code", ["x = 1\n", "%cuda_group_run -g app\n"]),
+            ("code", "%cuda_group_delete -g app\n%cuda_group_run -g app"),
+            ("code", "%%cuda --out y=float32[4]\nint main() {}"),
+            ("code", "%%cuda_group_save -g lib -n lib.cu\nvoid f() {}"),
+            ("code", "%%cuda_group_save -g dep -n m.cu -d lib\nint main(){}"),
+            ("code", "%cuda_group_run -g dep"),
+        ],
+    )
+    jobs, skipped = scan_notebook(fpath)
+
+    assert [job.cell_index for job in jobs] == [2, 4, 5]
+    cell_job, run_job, deleted_job = jobs
+    assert cell_job.group_name == CELL_GROUP_NAME
+    assert cell_job.args.compiler_args() == "--optimize 3"
+    assert cell_job.sources["shared"] == {"utils.h": "// utils"}
+    assert run_job.sources["app"] == {"main.cu": "int main() {}"}
+    assert "app" not in deleted_job.sources
+    assert [index for index, _ in skipped] == [6, 9]
+
+
+def test_scan_course_notebook():
+    fpath = os.path.join(
+        "notebooks", "cuda_training_series", "01-intro-to-cuda-cpp.ipynb"
+    )
+    jobs, skipped = scan_notebook(fpath)
+    assert len(jobs) > 0
+    assert not skipped
+    assert all("utils.h" in job.sources["shared"] for job in jobs[1:])
@@ -0,0 +1,58 @@
+import os
+
+from nvcc4jupyter.output import OutputSink, format_bytes
+from nvcc4jupyter.results import RunResult
+
+
+def test_output_sink_small(tmp_path):
+    log_fpath = str(tmp_path / "out.log")
+    with OutputSink(log_fpath, max_output=100) as sink:
+        sink.write(b"Hello ")
+        sink.write(b"World!\n")
+    assert not sink.truncated
+    assert sink.text() == "Hello World!\n"
+    assert sink.total_bytes == 13
+    # the log is only kept for truncated output
+    assert sink.log_fpath is None
+    assert not os.path.exists(log_fpath)
+
+
+def test_output_sink_truncated(tmp_path):
+    log_fpath = str(tmp_path / "out.log")
+    data = b"".join(b"%05d\n" % i for i in range(10000))
+    with OutputSink(log_fpath, max_output=24) as sink:
+        for start in range(0, len(data), 7):
+            sink.write(data[start : start + 7])
+    assert sink.truncated
+    text = sink.text()
+    assert text.startswith("00000\n00001\n")
+    assert text.endswith("09998\n09999\n")
+    assert "59976 characters omitted" in text
+    assert log_fpath in text
+    with open(log_fpath, "rb") as f:
+        assert f.read() == data
+
+
+def test_output_sink_split_characters():
+    data = "héllo wörld\n".encode("utf8")
+    with OutputSink() as sink:
+        for index in range(len(data)):
+            sink.write(data[index : index + 1])
+    assert sink.text() == "héllo wörld\n"
+
+
+def test_format_bytes():
+    assert format_bytes(10) == "10 B"
+    assert format_bytes(2048) == "2.0 KiB"
+    assert format_bytes(3 * 1024**3) == "3.0 GiB"
+
+
+def test_run_result_lines_from_log(tmp_path):
+    log_fpath = tmp_path / "out.log"
+    log_fpath.write_text("a=1\na=2\na=3\n")
+    result = RunResult(
+        stdout="a=1\n[... omitted ...]\na=3\n",
+        log_path=str(log_fpath),
+        truncated=True,
+    )
+    assert list(result.columns()["a"]) == [1, 2, 3]
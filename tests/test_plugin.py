@@ -1,16 +1,26 @@
+import json
 import math
 import os
 import re
 import shutil
+import signal
 import subprocess
+import threading
+import time
 from argparse import ArgumentParser, Namespace
 from copy import deepcopy
 from typing import List
 
 import pytest
 
+from nvcc4jupyter.backends import Backend
+from nvcc4jupyter.memo import MemoStore
 from nvcc4jupyter.parsers import Profiler, get_parser_cuda, set_defaults
 from nvcc4jupyter.plugin import NVCCPlugin
+from nvcc4jupyter.snapshots import SnapshotStore
+from nvcc4jupyter.toolkits import ToolkitIndex
+
+from .test_toolkits import make_toolkit
 
 
 def check_profiler_output(output: str, profiler: str = "[NCU]"):
@@ -314,3 +324,455 @@ def test_magic_cuda_group_delete(plugin: NVCCPlugin, sample_cuda_fpath: str):
     assert os.path.exists(source_fpath)
     plugin.cuda_group_delete(f"--group {gname}")
     assert not os.path.exists(source_fpath)
+
+
+def test_magic_cuda_arrays(plugin: NVCCPlugin):
+    np = pytest.importorskip("numpy")
+    plugin.shell.user_ns["arr"] = np.arange(4, dtype=np.int32)
+    code = (
+        '#include "nvcc4jupyter_arrays.h"\n'
+        "int main() {\n"
+        "    for (size_t i = 0; i < arrays::x::size; i++)\n"
+        "        arrays::y::data()[i] = arrays::x::data()[i] + 1;\n"
+        "}\n"
+    )
+    plugin.cuda("--in x=arr --out y=int32[4]", code)
+    np.testing.assert_array_equal(plugin.shell.user_ns["y"], np.arange(1, 5))
+
+
+def test_magic_cuda_stdin(plugin: NVCCPlugin):
+    code = (
+        "#include <cstdio>\n"
+        "int main() {\n"
+        "    long long value, total = 0;\n"
+        '    while (scanf("%lld", &value) == 1) total += value;\n'
+        '    printf("%lld\\n", total);\n'
+        "}\n"
+    )
+    plugin.shell.user_ns["numbers"] = (f"{i}\n" for i in range(100000))
+    plugin.cuda("--stdin numbers --out-var result", code)
+    assert plugin.shell.user_ns["result"].stdout == "4999950000\n"
+
+    # the input reaches the program through the profiler too
+    plugin.shell.user_ns["numbers"] = ["1 2 3\n"]
+    plugin.cuda("--stdin numbers --profile --out-var result", code)
+    assert plugin.shell.user_ns["result"].stdout == "[NCU]\n6\n"
+
+    with pytest.raises(ValueError, match="not defined"):
+        plugin.cuda("--stdin missing", code)
+    with pytest.raises(RuntimeError, match="timeit"):
+        plugin.cuda("--stdin numbers --timeit", code)
+
+
+def hanging_code(marker_fpath: str) -> str:
+    """A program that prints a line, creates a file and then hangs."""
+    return (
+        "#include <cstdio>\n"
+        "#include <unistd.h>\n"
+        "int main() {\n"
+        '    printf("started\\n");\n'
+        "    fflush(stdout);\n"
+        f'    fclose(fopen("{marker_fpath}", "w"));\n'
+        "    sleep(60);\n"
+        "}\n"
+    )
+
+
+def test_magic_cuda_timeout(capsys, tmp_path, plugin: NVCCPlugin):
+    code = hanging_code(str(tmp_path / "marker"))
+    start = time.perf_counter()
+    plugin.cuda("--timeout 0.5 --out-var result", code)
+    plugin.cuda("--timeout 0.5 --profile --out-var profiled", code)
+    assert time.perf_counter() - start < 30
+
+    output = capsys.readouterr().out
+    assert "exceeding the timeout of 0.5 seconds" in output
+    for name in ("result", "profiled"):
+        result = plugin.shell.user_ns[name]
+        assert result.stopped == "timeout"
+        assert result.returncode != 0
+        assert result.stdout.endswith("started\n")
+
+
+def test_magic_cuda_interrupt(capsys, tmp_path, plugin: NVCCPlugin):
+    marker_fpath = tmp_path / "marker"
+    interrupted = threading.Event()
+
+    def interrupt():
+        # give up if the program never starts, instead of hanging the tests
+        deadline = time.monotonic() + 30
+        while not marker_fpath.exists():
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+        interrupted.set()
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+
+    thread = threading.Thread(target=interrupt, daemon=True)
+    thread.start()
+    with pytest.raises(KeyboardInterrupt):
+        plugin.cuda(
+            "--profile --timeout 60 --out-var result",
+            hanging_code(marker_fpath),
+        )
+    thread.join(timeout=5)
+    assert interrupted.is_set()
+
+    output = capsys.readouterr().out
+    assert output.startswith("[NCU]\nstarted\n")
+    assert "The program was interrupted." in output
+    assert plugin.shell.user_ns["result"].stopped == "interrupt"
+
+
+def test_magic_cuda_out_var(capsys, plugin: NVCCPlugin, sample_cuda_code: str):
+    plugin.cuda("--out-var result", sample_cuda_code)
+    assert capsys.readouterr().out.startswith("Hello World!")
+    result = plugin.shell.user_ns["result"]
+    assert result.stdout == "Hello World!\n"
+    assert result.returncode == 0
+    assert result.compile_time > 0
+    assert os.path.exists(result.executable_path)
+
+
+def test_magic_cuda_memoize(
+    capsys, tmp_path, plugin: NVCCPlugin, sample_cuda_fpath: str
+):
+    gname = "test_magic_cuda_memoize"
+    copy_source_to_group(sample_cuda_fpath, gname, plugin.workdir)
+    plugin.memo_store = MemoStore(str(tmp_path))
+    plugin.cuda_group_run(f"-g {gname} --memoize --out-var first")
+    plugin.cuda_group_run(f"-g {gname} --memoize --out-var second")
+    first = plugin.shell.user_ns["first"]
+    second = plugin.shell.user_ns["second"]
+    assert first.stdout == second.stdout == "Hello World!\n"
+    assert first.run_time == second.run_time
+    assert len(os.listdir(tmp_path)) == 1
+
+    plugin.cuda_memo_clear("")
+    assert "Removed 1 memoized results." in capsys.readouterr().out
+    assert len(os.listdir(tmp_path)) == 0
+
+
+def test_magic_cuda_stats(
+    capsys, tmp_path, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    plugin.stats.reset()
+    plugin.cuda_group_save(
+        "-g test_magic_cuda_stats -n a.cu", sample_cuda_code
+    )
+    export_fpath = str(tmp_path / "stats.prom")
+    plugin.cuda_stats(f"--export {export_fpath} --format prom --reset")
+    output = capsys.readouterr().out
+    assert "save_source" in output
+    assert "cuda_group_save" in output
+    assert os.path.exists(export_fpath)
+    assert plugin.stats.summary() == {}
+
+
+def test_lazy_init(shell):
+    lazy_plugin = NVCCPlugin(shell)
+    assert "workdir" not in lazy_plugin.__dict__
+    assert "parser_cuda" not in lazy_plugin.__dict__
+    assert os.path.isdir(lazy_plugin.workdir)
+    assert lazy_plugin.parser_cuda is lazy_plugin.parser_cuda
+    shutil.rmtree(lazy_plugin.workdir)
+
+
+@pytest.mark.parametrize("library", ["static", "shared"])
+def test_magic_cuda_group_depends(capsys, plugin: NVCCPlugin, library: str):
+    plugin.cuda_group_save(
+        f"-g math_{library} -n add.h --library {library}",
+        "int add(int a, int b);\n",
+    )
+    plugin.cuda_group_save(
+        f"-g math_{library} -n add.cu",
+        '#include "add.h"\nint add(int a, int b) { return a + b; }\n',
+    )
+    plugin.cuda_group_save(
+        f"-g app_{library} -n main.cu -d math_{library}",
+        '#include <cstdio>\n#include "add.h"\n'
+        'int main() { printf("%d\\n", add(2, 3)); }\n',
+    )
+    plugin.cuda_group_run(f"-g app_{library}")
+    assert capsys.readouterr().out.strip() == "5"
+
+    library_fpath = plugin.library_builder.library_fpath(f"math_{library}")
+    mtime = os.path.getmtime(library_fpath)
+    plugin.cuda_group_run(f"-g app_{library}")
+    assert os.path.getmtime(library_fpath) == mtime
+
+
+def test_magic_cuda_group_depends_errors(
+    plugin: NVCCPlugin, sample_cuda_code: str
+):
+    with pytest.raises(ValueError):
+        plugin.cuda_group_save("-g a -n a.cu -d shared", sample_cuda_code)
+    plugin.cuda_group_save("-g a -n a.cu -d b", sample_cuda_code)
+    with pytest.raises(RuntimeError, match="does not exist"):
+        plugin._compile("a")
+    plugin.cuda_group_save("-g b -n b.cu -d a", sample_cuda_code)
+    with pytest.raises(RuntimeError, match="cycle"):
+        plugin._compile("a")
+
+
+def test_magic_cuda_group_run_dlto(
+    capsys, monkeypatch, tmp_path, plugin: NVCCPlugin
+):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    plugin.cuda_group_save(
+        "-g dlto -n add.cu",
+        "__device__ int add(int a, int b) { return a + b; }\n",
+    )
+    plugin.cuda_group_save(
+        "-g dlto -n main.cu",
+        "#include <cstdio>\n__device__ int add(int a, int b);\n"
+        'int main() { printf("Hello World!\\n"); }\n',
+    )
+    plugin.cuda_group_run("-g dlto --dlto")
+    assert capsys.readouterr().out.strip() == "Hello World!"
+    assert len(os.listdir(tmp_path / "lto")) == 2
+
+
+def test_magic_cuda_compile_cache(
+    monkeypatch, tmp_path, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    plugin.stats.reset()
+    plugin.cuda("--out-var first", sample_cuda_code)
+    plugin.cuda("--out-var second", sample_cuda_code)
+    assert plugin.shell.user_ns["first"].stdout == "Hello World!\n"
+    assert plugin.shell.user_ns["second"].stdout == "Hello World!\n"
+    assert plugin.stats.summary()["compile_nvcc"].count == 1
+    assert len(os.listdir(tmp_path / "compile" / "nvcc")) == 1
+
+    plugin.cuda("--no-compile-cache", sample_cuda_code)
+    assert plugin.stats.summary()["compile_nvcc"].count == 2
+
+
+def test_magic_cuda_backend_unsupported(
+    plugin: NVCCPlugin, sample_cuda_code: str
+):
+    plugin.cuda_group_save("-g lib -n lib.cu", sample_cuda_code)
+    plugin.cuda_group_save("-g app -n app.cu -d lib", sample_cuda_code)
+    with pytest.raises(RuntimeError, match="not supported"):
+        plugin._compile("app", backend=Backend.CLANG)
+    with pytest.raises(RuntimeError, match="not supported"):
+        plugin.cuda("--kernel-timing -b clang", sample_cuda_code)
+
+
+def test_magic_cuda_group_snapshot(
+    capsys, tmp_path, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    plugin.snapshot_store = SnapshotStore(str(tmp_path))
+    gname = "test_magic_cuda_group_snapshot"
+    plugin.cuda_group_save(f"-g {gname} -n main.cu", sample_cuda_code)
+    plugin.cuda_group_snapshot(f"-g {gname} -s before")
+    plugin.cuda_group_save(f"-g {gname} -n main.cu", "int main() {}")
+    plugin.cuda_group_restore(f"-s before -g {gname}_copy")
+    plugin.cuda_group_restore("-s before")
+    output = capsys.readouterr().out
+    assert 'Saved snapshot "before"' in output
+    assert f'Restored snapshot "before" to group "{gname}".' in output
+
+    for group_name in (gname, f"{gname}_copy"):
+        spath = os.path.join(plugin.workdir, group_name, "main.cu")
+        with open(spath, "r", encoding="utf-8") as f:
+            assert f.read() == sample_cuda_code
+
+    # saving over a restored file does not change the snapshot
+    plugin.cuda_group_save(f"-g {gname} -n main.cu", "int main() {}")
+    plugin.cuda_group_restore(f"-s before -g {gname}_copy")
+    spath = os.path.join(plugin.workdir, f"{gname}_copy", "main.cu")
+    with open(spath, "r", encoding="utf-8") as f:
+        assert f.read() == sample_cuda_code
+
+    plugin.cuda_snapshots("")
+    assert "before" in capsys.readouterr().out
+    plugin.cuda_snapshots("--delete before")
+    assert plugin.snapshot_store.names() == []
+
+
+def test_magic_cuda_precompile(
+    capsys, monkeypatch, tmp_path, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    notebook_fpath = str(tmp_path / "notebook.ipynb")
+    with open(notebook_fpath, "w", encoding="utf-8") as f:
+        cells = [f"%%cuda\n{sample_cuda_code}", "%%cuda\nint main( {}"]
+        json.dump(
+            {"cells": [{"cell_type": "code", "source": c} for c in cells]}, f
+        )
+    plugin.cuda_precompile(notebook_fpath)
+    output = capsys.readouterr().out
+    assert "Compiled 1 programs (0 were already cached)" in output
+    assert "Failed to compile cell 1" in output
+
+    plugin.stats.reset()
+    plugin.cuda("", sample_cuda_code)
+    assert capsys.readouterr().out.strip() == "Hello World!"
+    assert "compile_nvcc" not in plugin.stats.summary()
+
+
+def test_magic_cuda_define(capsys, monkeypatch, tmp_path, plugin: NVCCPlugin):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    plugin.stats.reset()
+    code = (
+        "#include <cstdio>\n"
+        "int main() {\n"
+        "    {{T}} values[2][2] = {{1, 2}, {3, 4}};\n"
+        '    printf("%d %d\\n", SIZE, (int)values[1][1]);\n'
+        "}\n"
+    )
+    plugin.shell.user_ns.update(size=4, T="unsigned int")
+    plugin.cuda("-D SIZE=size -D T", code)
+    plugin.shell.user_ns["size"] = 8
+    plugin.cuda("-D SIZE=size -D T", code)
+    # every specialization is compiled once
+    plugin.shell.user_ns["size"] = 4
+    plugin.cuda("-D SIZE=size -D T", code)
+    output = capsys.readouterr().out
+    assert output.split() == ["4", "4", "8", "4", "4", "4"]
+    assert plugin.stats.summary()["compile_nvcc"].count == 2
+
+    with pytest.raises(ValueError, match="not defined"):
+        plugin.cuda("-D SIZE=missing", code)
+
+
+def test_magic_cuda_precompile_define(
+    capsys, monkeypatch, tmp_path, plugin: NVCCPlugin
+):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    code = '#include <cstdio>\nint main() { printf("%d\\n", {{N}}); }\n'
+    notebook_fpath = str(tmp_path / "notebook.ipynb")
+    with open(notebook_fpath, "w", encoding="utf-8") as f:
+        cells = [f"%%cuda -D N\n{code}", f"%%cuda -D N=other\n{code}"]
+        json.dump(
+            {"cells": [{"cell_type": "code", "source": c} for c in cells]}, f
+        )
+    plugin.shell.user_ns["N"] = 3
+    plugin.shell.user_ns.pop("other", None)
+    plugin.cuda_precompile(notebook_fpath)
+    output = capsys.readouterr().out
+    assert "Compiled 1 programs (0 were already cached)" in output
+    assert 'Skipped cell 1: Variable "other" is not defined' in output
+
+    plugin.stats.reset()
+    plugin.cuda("-D N", code)
+    assert capsys.readouterr().out.strip() == "3"
+    assert "compile_nvcc" not in plugin.stats.summary()
+
+
+def test_magic_cuda_removes_group(capsys, plugin: NVCCPlugin):
+    code = '#include <cstdio>\nint main() { printf("i=1\\n"); }\n'
+    plugin.cuda("", code)
+    assert capsys.readouterr().out.strip() == "i=1"
+    assert os.listdir(plugin.workdir) == []
+
+    # the executable of a stored result is kept, but not the small log
+    plugin.cuda("--out-var result", code)
+    result = plugin.shell.user_ns["result"]
+    assert os.path.exists(result.executable_path)
+    assert not os.path.exists(result.executable_path + ".log")
+    assert result.log_path is None
+
+
+def test_magic_cuda_max_output(capsys, plugin: NVCCPlugin):
+    code = (
+        "#include <cstdio>\n"
+        "int main() {\n"
+        '    for (int i = 0; i < 1000; i++) printf("i=%d\\n", i);\n'
+        "}\n"
+    )
+    plugin.cuda("--max-output 100 --out-var result", code)
+    output = capsys.readouterr().out
+    assert output.startswith("i=0\n")
+    assert "characters omitted" in output
+    result = plugin.shell.user_ns["result"]
+    # the log file is named once
+    assert output.count(f'the full output is in "{result.log_path}"') == 1
+    assert result.truncated
+    assert result.output_bytes == len("".join(f"i={i}\n" for i in range(1000)))
+    assert len(result.columns()["i"]) == 1000
+
+
+def test_magic_cuda_toolkit(
+    monkeypatch, tmp_path, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    compiler = shutil.which("nvcc")
+    if compiler is None:
+        pytest.skip("nvcc is not installed")
+    roots = [
+        make_toolkit(str(tmp_path / "cuda-11.8"), "11.8.89", compiler),
+        make_toolkit(str(tmp_path / "cuda-12.2"), "12.2.140", compiler),
+    ]
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("NVCC4JUPYTER_TOOLKITS", os.pathsep.join(roots))
+    monkeypatch.setattr(
+        plugin, "toolkit_index", ToolkitIndex(str(tmp_path / "index.json"))
+    )
+
+    def calls(root: str) -> int:
+        calls_fpath = os.path.join(root, "bin", "calls")
+        if not os.path.exists(calls_fpath):
+            return 0
+        with open(calls_fpath) as f:
+            return len(f.readlines())
+
+    plugin.cuda("--toolkit 11.8 --out-var result", sample_cuda_code)
+    assert plugin.shell.user_ns["result"].stdout == "Hello World!\n"
+    assert plugin.shell.user_ns["result"].toolkit == "11.8.89"
+    assert calls(roots[0]) == 1
+
+    # the toolkit is part of the compile cache key
+    plugin.cuda("--toolkit 12 --out-var result", sample_cuda_code)
+    assert plugin.shell.user_ns["result"].toolkit == "12.2.140"
+    assert calls(roots[1]) == 1
+    plugin.cuda("--toolkit 11.8.89", sample_cuda_code)
+    assert calls(roots[0]) == 1
+
+    with pytest.raises(ValueError, match="not installed"):
+        plugin.cuda("--toolkit 10", sample_cuda_code)
+
+
+def test_compiler_args_kernel_timing_waits_for_setup(
+    monkeypatch, tmp_path, plugin: NVCCPlugin
+):
+    root = str(tmp_path / "cuda-12.2")
+
+    def wait_for_setup():
+        # the toolkit only appears once the platform setup finished
+        make_toolkit(root, "12.2.140")
+        monkeypatch.setenv("NVCC4JUPYTER_TOOLKITS", root)
+
+    monkeypatch.delenv("NVCC4JUPYTER_TOOLKITS", raising=False)
+    monkeypatch.setattr("nvcc4jupyter.plugin.wait_for_setup", wait_for_setup)
+    monkeypatch.setattr(
+        plugin, "toolkit_index", ToolkitIndex(str(tmp_path / "index.json"))
+    )
+    args = plugin.parser_cuda.parse_args(
+        ["--kernel-timing", "--toolkit", "12.2"]
+    )
+    compiler_args = plugin._compiler_args(args)
+    assert f"-Xlinker -rpath={root}/lib64" in compiler_args
+
+
+def test_magic_cuda_profile_batch(
+    capsys, plugin: NVCCPlugin, sample_cuda_code: str
+):
+    plugin.cuda_group_save("-g first -n main.cu", sample_cuda_code)
+    plugin.cuda_group_save("-g second -n main.cu", sample_cuda_code)
+    plugin.cuda_profile_batch(
+        "-g first -g second -l ncu -l nsys --out-var batch"
+    )
+    output = capsys.readouterr().out
+    assert output.splitlines()[0].split()[:3] == ["job", "profiler", "device"]
+    assert "first [ncu]" in output
+    assert "second [nsys]" in output
+
+    batch = plugin.shell.user_ns["batch"]
+    assert len(batch.outcomes) == 4
+    for outcome in batch.outcomes:
+        assert outcome.result.returncode == 0
+        check_profiler_output(
+            outcome.result.stdout, f"[{outcome.job.profiler.value.upper()}]"
+        )
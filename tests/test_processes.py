@@ -0,0 +1,91 @@
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from nvcc4jupyter.processes import (
+    RunLimits,
+    RunTimedOut,
+    check_output,
+    parse_size,
+    popen_kwargs,
+)
+
+# starts a program like the plugin does, then waits to be killed
+PARENT_CODE = """
+import subprocess, sys, time
+from nvcc4jupyter.processes import popen_kwargs
+child = subprocess.Popen(["sleep", "60"], **popen_kwargs(None))
+print(child.pid, flush=True)
+time.sleep(60)
+"""
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            # killed processes may linger as zombies until they are reaped
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_parse_size():
+    assert parse_size("123") == 123
+    assert parse_size("4k") == 4096
+    assert parse_size("512M") == 512 * 1024**2
+    assert parse_size("2GiB") == 2 * 1024**3
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_check_output_timeout():
+    start = time.perf_counter()
+    # the background process keeps the output open unless it is killed too
+    with pytest.raises(RunTimedOut) as info:
+        check_output(
+            ["bash", "-c", "echo started; sleep 30 & wait"],
+            limits=RunLimits(timeout=0.5),
+        )
+    assert time.perf_counter() - start < 10
+    assert info.value.output == b"started\n"
+
+    assert (
+        check_output(["echo", "done"], limits=RunLimits(timeout=10))
+        == b"done\n"
+    )
+
+
+def test_check_output_limits():
+    with pytest.raises(subprocess.CalledProcessError) as info:
+        check_output(
+            [sys.executable, "-c", "while True: pass"],
+            limits=RunLimits(max_cpu=1),
+        )
+    assert info.value.returncode == -signal.SIGXCPU
+
+    with pytest.raises(subprocess.CalledProcessError) as info:
+        check_output(
+            [sys.executable, "-c", "bytearray(1024**3)"],
+            limits=RunLimits(max_memory=parse_size("256M")),
+        )
+    assert b"MemoryError" in info.value.output
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="requires Linux"
+)
+def test_popen_kwargs_parent_death():
+    assert popen_kwargs(None)["start_new_session"]
+    with subprocess.Popen(
+        [sys.executable, "-c", PARENT_CODE], stdout=subprocess.PIPE
+    ) as parent:
+        child_pid = int(parent.stdout.readline())
+        assert _is_running(child_pid)
+        parent.kill()
+    deadline = time.monotonic() + 10
+    while _is_running(child_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _is_running(child_pid)
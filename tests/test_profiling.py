@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+
+from nvcc4jupyter.devices import DeviceScheduler
+from nvcc4jupyter.parsers import Profiler
+from nvcc4jupyter.profiling import (
+    ProfileJob,
+    batch_profiler_args,
+    parse_ncu_csv,
+    profile_batch,
+)
+from nvcc4jupyter.results import RunResult
+
+NCU_CSV = """==PROF== Connected to process 1234
+Hello World!
+"ID","Process ID","Process Name","Host Name","Kernel Name","Context","Stream","Section Name","Metric Name","Metric Unit","Metric Value"
+"0","1234","app","host","add(int *)","1","7","Speed Of Light","Duration","usecond","1,234.5"
+"0","1234","app","host","add(int *)","1","7","Speed Of Light","Registers Per Thread","register/thread","16"
+"1","1234","app","host","mul(int *)","1","7","Speed Of Light","Duration","usecond","3.25"
+"""  # noqa: E501
+
+NCU_RAW_CSV = """"ID","Process ID","Kernel Name","gpu__time_duration.sum","launch__grid_size"
+"","","","nsecond",""
+"0","1234","add(int *)","2,048","64"
+"""  # noqa: E501
+
+
+def test_parse_ncu_csv():
+    records = list(parse_ncu_csv(NCU_CSV.splitlines()))
+    assert records == [
+        {
+            "id": 0,
+            "kernel": "add(int *)",
+            "Duration (usecond)": 1234.5,
+            "Registers Per Thread (register/thread)": 16,
+        },
+        {"id": 1, "kernel": "mul(int *)", "Duration (usecond)": 3.25},
+    ]
+
+    records = list(parse_ncu_csv(NCU_RAW_CSV.splitlines()))
+    assert records == [{
+        "id": 0,
+        "kernel": "add(int *)",
+        "gpu__time_duration.sum (nsecond)": 2048,
+        "launch__grid_size": 64,
+    }]
+    assert list(parse_ncu_csv(["Hello World!"])) == []
+
+
+def test_batch_profiler_args():
+    job = ProfileJob("a", "/a.out", profiler_args="--section SpeedOfLight")
+    assert batch_profiler_args(job, "/r") == "--section SpeedOfLight --csv"
+
+    job = ProfileJob("a", "/a.out", profiler=Profiler.NSYS)
+    assert (
+        batch_profiler_args(job, "/r")
+        == "profile -o /r --force-overwrite true"
+    )
+    job.profiler_args = "profile --output=/mine"
+    assert batch_profiler_args(job, "/r") == "profile --output=/mine"
+
+
+def test_profile_batch(tmp_path):
+    running: Dict[str, Dict[str, int]] = defaultdict(
+        lambda: {"ncu": 0, "nsys": 0}
+    )
+    peaks: Dict[str, int] = {"ncu": 0, "nsys": 0, "mixed": 0}
+    lock = threading.Lock()
+
+    def run(index: int, job: ProfileJob, device: str) -> RunResult:
+        profiler = job.profiler.value
+        with lock:
+            running[device][profiler] += 1
+            peaks[profiler] = max(peaks[profiler], running[device][profiler])
+            if all(running[device].values()):
+                peaks["mixed"] += 1
+        time.sleep(0.05)
+        with lock:
+            running[device][profiler] -= 1
+        return RunResult(stdout=f"job {index}\n", run_time=0.05)
+
+    jobs = [
+        ProfileJob(f"job{i}", "/a.out", profiler=profiler)
+        for i in range(4)
+        for profiler in (Profiler.NCU, Profiler.NSYS)
+    ]
+    scheduler = DeviceScheduler(
+        str(tmp_path / "devices.json"),
+        enumerate_devices=lambda: ["0", "1"],
+        max_jobs_per_device=2,
+        poll_interval=0.01,
+    )
+    batch = profile_batch(jobs, run, scheduler)
+
+    assert [outcome.job for outcome in batch.outcomes] == jobs
+    assert {outcome.device for outcome in batch.outcomes} == {"0", "1"}
+    # Nsight Compute never shares a GPU, Nsight Systems does
+    assert peaks["ncu"] == 1
+    assert peaks["nsys"] <= 2
+    assert peaks["mixed"] == 0
+
+    assert batch.columns()["job"] == [job.name for job in jobs]
+    table = batch.table(["run_time"])
+    assert table.splitlines()[0].split() == [
+        "job",
+        "profiler",
+        "device",
+        "run_time",
+    ]
+    assert len(table.splitlines()) == len(jobs) + 1
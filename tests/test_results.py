@@ -0,0 +1,55 @@
+import pytest
+
+from nvcc4jupyter.results import (
+    RunResult,
+    parse_csv,
+    parse_json_lines,
+    parse_key_values,
+)
+
+
+def test_parse_key_values():
+    lines = ["size=1024 time=0.5 name=naive", "no pairs here", "size=2048"]
+    assert list(parse_key_values(lines)) == [
+        {"size": 1024, "time": 0.5, "name": "naive"},
+        {"size": 2048},
+    ]
+
+
+def test_parse_csv():
+    lines = ["", "size, time", "1024, 0.5", "2048, 0.75"]
+    assert list(parse_csv(lines)) == [
+        {"size": 1024, "time": 0.5},
+        {"size": 2048, "time": 0.75},
+    ]
+    assert list(parse_csv([])) == []
+
+
+def test_parse_json_lines():
+    lines = ['{"size": 1024, "ok": true}', "Hello World!", "{broken", "[1]"]
+    assert list(parse_json_lines(lines)) == [{"size": 1024, "ok": True}]
+
+
+def test_run_result_columns():
+    result = RunResult(
+        stdout="warmup done\nsize=1 time=0.5\nsize=2 time=0.25 err=1e-6\n",
+        stderr="warning\n",
+    )
+    assert result.output.endswith("warning\n")
+    columns = result.columns()
+    assert list(columns) == ["size", "time", "err"]
+    assert columns["size"] == [1, 2]
+    assert columns["err"] == [None, 1e-6]
+    with pytest.raises(KeyError):
+        columns["missing"]
+    with pytest.raises(ValueError):
+        result.columns("xml")
+
+
+def test_run_result_columns_null_values():
+    result = RunResult(stdout='{"a": null}\n{"a": null, "b": 1}\n')
+    columns = result.columns("jsonl")
+    assert columns["a"] == [None, None]
+    assert columns["b"] == [None, 1]
+    with pytest.raises(KeyError):
+        columns["c"]
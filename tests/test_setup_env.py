@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+from nvcc4jupyter import setup_env
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("NVCC4JUPYTER_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("NVCC4JUPYTER_NO_SETUP", raising=False)
+    return tmp_path
+
+
+@pytest.mark.parametrize("nvcc", [None, "/usr/bin/nvcc"])
+def test_kaggle_setup_installs_missing_toolkit(tmp_path, monkeypatch, nvcc):
+    installs = []
+    monkeypatch.setattr(setup_env, "which", lambda name: nvcc)
+    monkeypatch.setattr(
+        setup_env, "kaggle_install", lambda: installs.append("install")
+    )
+    monkeypatch.setattr(
+        setup_env, "PATH_PRIORITY_DIR", str(tmp_path / "priority")
+    )
+    monkeypatch.setenv("PATH", os.environ["PATH"])
+    setup_env.kaggle_setup()
+    assert installs == ([] if nvcc else ["install"])
+    assert os.environ["PATH"].startswith(str(tmp_path / "priority"))
+
+
+def test_setup_background(cache_dir, monkeypatch):
+    calls = []
+
+    def slow_setup():
+        time.sleep(0.2)
+        calls.append("setup")
+
+    monkeypatch.setenv("KAGGLE_URL_BASE", "https://kaggle.com")
+    monkeypatch.setattr(setup_env, "kaggle_setup", slow_setup)
+    setup_env.setup_environment(background=True)
+    assert calls == []
+    setup_env.wait_for_setup()
+    assert calls == ["setup"]
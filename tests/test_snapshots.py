@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from nvcc4jupyter.build import read_group_metadata, write_group_metadata
+from nvcc4jupyter.snapshots import SnapshotStore
+
+
+def write_file(dirpath: str, fname: str, content: str) -> None:
+    os.makedirs(dirpath, exist_ok=True)
+    with open(os.path.join(dirpath, fname), "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def read_file(dirpath: str, fname: str) -> str:
+    with open(os.path.join(dirpath, fname), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snapshots"))
+
+
+def test_snapshot_deduplicates(tmp_path, store: SnapshotStore):
+    group_dirpath = str(tmp_path / "group")
+    write_file(group_dirpath, "main.cu", "int main() {}")
+    write_file(group_dirpath, "util.h", "// util")
+    write_file(group_dirpath, "cuda_exec.out", "binary")
+
+    manifest = store.create("before", group_dirpath)
+    assert sorted(manifest["files"]) == ["main.cu", "util.h"]
+    write_file(group_dirpath, "main.cu", "int main() { return 1; }")
+    store.create("after", group_dirpath)
+    # the unchanged header is stored once
+    assert len(store.blobs.digests()) == 3
+    assert store.names() == ["before", "after"]
+
+    with pytest.raises(ValueError, match="already exists"):
+        store.create("before", group_dirpath)
+    with pytest.raises(ValueError, match="Invalid"):
+        store.create("../escape", group_dirpath)
+
+
+def test_snapshot_restore(tmp_path, store: SnapshotStore):
+    group_dirpath = str(tmp_path / "group")
+    write_file(group_dirpath, "main.cu", "int main() {}")
+    store.create("before", group_dirpath)
+    write_file(group_dirpath, "main.cu", "int main() { return 1; }")
+    write_file(group_dirpath, "extra.cu", "void extra() {}")
+
+    store.restore("before", group_dirpath)
+    assert read_file(group_dirpath, "main.cu") == "int main() {}"
+    assert not os.path.exists(os.path.join(group_dirpath, "extra.cu"))
+
+    # restoring into another group leaves the original untouched
+    other_dirpath = str(tmp_path / "other")
+    store.restore("before", other_dirpath)
+    assert read_file(other_dirpath, "main.cu") == "int main() {}"
+
+    with pytest.raises(ValueError, match="does not exist"):
+        store.restore("missing", group_dirpath)
+
+
+def test_snapshot_unchanged_by_restored_group(
+    tmp_path, plugin, store: SnapshotStore
+):
+    group_dirpath = os.path.join(plugin.workdir, "snapshot_restored")
+    plugin._save_source("main.cu", "int main() {}", "snapshot_restored")
+    write_group_metadata(group_dirpath, {"depends": ["lib"]})
+    store.create("saved", group_dirpath)
+
+    # the restored files are hard links to the blobs of the snapshot, which
+    # saving the group again must replace instead of overwriting
+    store.restore("saved", group_dirpath)
+    plugin._save_source(
+        "main.cu", "int main() { return 1; }", "snapshot_restored"
+    )
+    write_group_metadata(group_dirpath, {"depends": ["other"]})
+    assert not [
+        fname for fname in os.listdir(group_dirpath) if fname.endswith(".tmp")
+    ]
+
+    other_dirpath = str(tmp_path / "other")
+    store.restore("saved", other_dirpath)
+    assert read_file(other_dirpath, "main.cu") == "int main() {}"
+    assert read_group_metadata(other_dirpath)["depends"] == ["lib"]
+    assert read_group_metadata(group_dirpath)["depends"] == ["other"]
+
+
+def test_snapshot_delete(tmp_path, store: SnapshotStore):
+    group_dirpath = str(tmp_path / "group")
+    write_file(group_dirpath, "main.cu", "int main() {}")
+    store.create("first", group_dirpath)
+    store.create("second", group_dirpath)
+    write_file(group_dirpath, "main.cu", "int main() { return 1; }")
+    store.create("third", group_dirpath)
+
+    # the blob of "first" is still used by "second"
+    assert store.delete("first") == 0
+    assert store.delete("second") == 1
+    assert store.names() == ["third"]
+    assert len(store.blobs.digests()) == 1
@@ -0,0 +1,53 @@
+import pytest
+
+from nvcc4jupyter.specialize import (
+    define_compiler_args,
+    format_value,
+    parse_define,
+    resolve_defines,
+    specialize_source,
+)
+
+
+def test_parse_define():
+    assert parse_define("N") == ("N", "N")
+    assert parse_define("TILE = tile") == ("TILE", "tile")
+    with pytest.raises(ValueError, match="identifier"):
+        parse_define("1N=n")
+
+
+def test_format_value():
+    assert format_value("a", True) == "true"
+    assert format_value("a", 42) == "42"
+    assert format_value("a", 0.5) == "0.5"
+    assert format_value("a", "unsigned int") == "unsigned int"
+    with pytest.raises(ValueError, match="finite"):
+        format_value("a", float("nan"))
+    with pytest.raises(ValueError, match="list"):
+        format_value("a", [1])
+
+    np = pytest.importorskip("numpy")
+    assert format_value("a", np.float32) == "float"
+    assert format_value("a", np.dtype("int64")) == "int64_t"
+    assert format_value("a", np.int32(7)) == "7"
+    assert format_value("a", np.bool_(False)) == "false"
+
+
+def test_resolve_defines():
+    user_ns = {"n": 1024, "T": "float"}
+    defines = resolve_defines(user_ns, ["N=n", "T"])
+    assert defines == {"N": "1024", "T": "float"}
+    assert define_compiler_args(defines) == "-DN=1024 -DT=float"
+    # values with whitespace can only be used through placeholders
+    assert define_compiler_args({"T": "unsigned int", "E": ""}) == ""
+    with pytest.raises(ValueError, match="not defined"):
+        resolve_defines(user_ns, ["M"])
+
+
+def test_specialize_source():
+    source = "{{ T }} a[{{N}}][2] = {{1, 2}}; // {{M}}"
+    assert (
+        specialize_source(source, {"T": "float", "N": "4"})
+        == "float a[4][2] = {{1, 2}}; // {{M}}"
+    )
+    assert specialize_source("{{N}}", {"N": "\\1"}) == "\\1"
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from nvcc4jupyter.stats import PhaseStats, timed
+
+
+class Timed:
+    def __init__(self):
+        self.stats = PhaseStats()
+
+    @timed("work")
+    def work(self, value: int) -> int:
+        return value * 2
+
+
+def test_timed():
+    obj = Timed()
+    assert obj.work(3) == 6
+    assert obj.work.__name__ == "work"
+    summary = obj.stats.summary()["work"]
+    assert summary.count == 1
+    assert summary.min == summary.max == summary.total
+
+
+def test_histogram():
+    stats = PhaseStats()
+    for duration in (0.0005, 0.002, 0.002, 100.0):
+        stats.record("compile", duration)
+    histogram = dict(stats.histogram("compile"))
+    assert histogram[0.001] == 1
+    assert histogram[0.005] == 2
+    assert histogram[float("inf")] == 1
+    assert sum(histogram.values()) == 4
+    assert stats.summary()["compile"].max == 100.0
+    assert "compile" in stats.table(histograms=True)
+
+    stats.reset()
+    assert stats.summary() == {}
+    assert stats.table() == "No spans recorded yet."
+
+
+def test_prometheus():
+    stats = PhaseStats()
+    stats.record("run", 0.02)
+    stats.record("run", 2.0)
+    text = stats.to_prometheus()
+    name = "nvcc4jupyter_phase_duration_seconds"
+    assert f'{name}_bucket{{phase="run",le="0.05"}} 1' in text
+    assert f'{name}_bucket{{phase="run",le="+Inf"}} 2' in text
+    assert f'{name}_count{{phase="run"}} 2' in text
+
+
+def test_export(tmp_path):
+    stats = PhaseStats()
+    stats.record("run", 0.5)
+
+    jsonl_fpath = str(tmp_path / "stats.jsonl")
+    stats.export(jsonl_fpath)
+    with open(jsonl_fpath, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]["phase"] == "run"
+    assert records[0]["count"] == 1
+
+    stream_fpath = str(tmp_path / "spans.jsonl")
+    stats.set_export(stream_fpath)
+    stats.record("compile", 0.25)
+    stats.record("run", 0.75)
+    with open(stream_fpath, "r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    assert [span["phase"] for span in spans] == ["compile", "run"]
+
+    prom_fpath = str(tmp_path / "stats.prom")
+    stats.set_export(prom_fpath, "prom")
+    stats.record("run", 0.1)
+    with open(prom_fpath, "r", encoding="utf-8") as f:
+        assert 'count{phase="run"} 3' in f.read()
+
+    with pytest.raises(ValueError):
+        stats.set_export(prom_fpath, "xml")
+
+
+def test_stats_export_errors(tmp_path, capsys):
+    stats = PhaseStats()
+    missing_fpath = str(tmp_path / "missing" / "spans.jsonl")
+    for fmt in ("jsonl", "prom"):
+        with pytest.raises(ValueError):
+            stats.set_export(missing_fpath, fmt)
+    assert stats.export_fpath is None
+
+    dirpath = tmp_path / "removed"
+    dirpath.mkdir()
+    stats.set_export(str(dirpath / "spans.jsonl"))
+    (dirpath / "spans.jsonl").unlink()
+    dirpath.rmdir()
+    # a failed export is reported once and does not fail the recording
+    stats.record("run", 0.5)
+    stats.record("run", 0.5)
+    assert capsys.readouterr().err.count("Stopped exporting") == 1
+    assert stats.export_fpath is None
+    assert stats.summary()["run"].count == 2
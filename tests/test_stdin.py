@@ -0,0 +1,73 @@
+import io
+import subprocess
+
+import pytest
+
+from nvcc4jupyter.stdin import StdinWriter, iter_chunks
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(b"abcdefg", chunk_bytes=3)) == [
+        b"abc",
+        b"def",
+        b"g",
+    ]
+    assert list(iter_chunks("héllo", chunk_bytes=100)) == ["héllo".encode()]
+    assert list(iter_chunks(io.StringIO("abcd"), chunk_bytes=3)) == [
+        b"abc",
+        b"d",
+    ]
+    assert list(iter_chunks(io.BytesIO(b""))) == []
+
+    # small items are joined, large ones are split
+    items = [b"a", "b", bytearray(b"c"), b"0123456789", b"d"]
+    assert list(iter_chunks(items, chunk_bytes=4)) == [
+        b"abc",
+        b"0123",
+        b"4567",
+        b"89",
+        b"d",
+    ]
+
+    with pytest.raises(TypeError, match="int"):
+        list(iter_chunks(42))
+    with pytest.raises(TypeError, match="item"):
+        list(iter_chunks([b"a", 1]))
+
+
+def test_stdin_writer_backpressure():
+    produced = []
+
+    def lines():
+        for i in range(100000):
+            produced.append(i)
+            yield f"{i}\n"
+
+    with subprocess.Popen(
+        ["head", "-n", "3"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    ) as process:
+        writer = StdinWriter(process.stdin, lines())
+        writer.start()
+        output = process.stdout.read()
+        writer.join()
+    writer.check()
+    assert output == b"0\n1\n2\n"
+    # the program stopped reading early, so the source was not exhausted
+    assert len(produced) < 100000
+
+
+def test_stdin_writer_error():
+    def lines():
+        yield "1\n"
+        raise KeyError("missing")
+
+    with subprocess.Popen(
+        ["cat"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    ) as process:
+        writer = StdinWriter(process.stdin, lines())
+        writer.start()
+        output = process.stdout.read()
+        writer.join()
+    assert output == b"1\n"
+    with pytest.raises(KeyError, match="missing"):
+        writer.check()
@@ -0,0 +1,110 @@
+import os
+import stat
+from typing import Optional
+
+import pytest
+
+from nvcc4jupyter import toolkits
+from nvcc4jupyter.toolkits import Toolkit, ToolkitIndex
+
+
+def write_script(fpath: str, body: str) -> None:
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    with open(fpath, "w") as f:
+        f.write(f"#!/bin/bash\n{body}\n")
+    os.chmod(fpath, os.stat(fpath).st_mode | stat.S_IEXEC)
+
+
+def make_toolkit(
+    root: str, version: str, compiler: Optional[str] = None
+) -> str:
+    """
+    Create a fake toolkit whose "nvcc" prints a version and otherwise logs
+    its calls and runs the given compiler.
+    """
+    release = ".".join(version.split(".")[:2])
+    write_script(
+        os.path.join(root, "bin", "nvcc"),
+        'if [ "$1" = "--version" ]; then\n'
+        f'    echo "Cuda compilation tools, release {release}, V{version}"\n'
+        "    exit 0\n"
+        "fi\n"
+        'echo "$@" >> "$(dirname "$0")/calls"\n'
+        + (f'exec {compiler} "$@"' if compiler else "exit 1"),
+    )
+    write_script(
+        os.path.join(root, "bin", "ncu"),
+        'echo "Version 2023.2.0.0 (build 1234)"',
+    )
+    write_script(
+        os.path.join(root, "nsight-systems-2023.3.1", "bin", "nsys"),
+        'echo "NVIDIA Nsight Systems version 2023.3.1.92-233133147223v0"',
+    )
+    return root
+
+
+@pytest.fixture
+def toolkit_roots(monkeypatch, tmp_path):
+    roots = [
+        make_toolkit(str(tmp_path / "cuda-11.8"), "11.8.89"),
+        make_toolkit(str(tmp_path / "cuda-12.2"), "12.2.140"),
+        make_toolkit(str(tmp_path / "cuda-12.4"), "12.4.99"),
+    ]
+    monkeypatch.setattr(toolkits, "TOOLKIT_PATTERNS", [])
+    monkeypatch.setenv("NVCC4JUPYTER_TOOLKITS", os.pathsep.join(roots))
+    # the toolkit found through PATH is not the newest one
+    monkeypatch.setenv("PATH", os.path.join(roots[1], "bin"))
+    return roots
+
+
+def test_probe_toolkit(toolkit_roots):
+    toolkit = toolkits.probe_toolkit(
+        os.path.join(toolkit_roots[0], "bin", "nvcc")
+    )
+    assert toolkit.version == "11.8.89"
+    assert toolkit.root == toolkit_roots[0]
+    assert toolkit.ncu == os.path.join(toolkit_roots[0], "bin", "ncu")
+    assert toolkit.ncu_version == "2023.2.0.0"
+    assert toolkit.nsys_version == "2023.3.1.92"
+    assert toolkit.fingerprint() != toolkit.fingerprint(["nvcc", "ncu"])
+
+
+def test_index_select(monkeypatch, tmp_path, toolkit_roots):
+    index = ToolkitIndex(str(tmp_path / "toolkits.json"))
+    versions = [toolkit.version for toolkit in index.toolkits()]
+    assert versions == ["12.2.140", "11.8.89", "12.4.99"]
+
+    assert index.select().version == "12.2.140"
+    assert index.select("11").version == "11.8.89"
+    assert index.select("12").version == "12.4.99"
+    assert index.select("12.2.140").version == "12.2.140"
+    with pytest.raises(ValueError, match="not installed"):
+        index.select("12.1")
+
+    # without nvcc on PATH the newest toolkit is the default
+    monkeypatch.setenv("PATH", "")
+    assert index.select().version == "12.4.99"
+
+
+def test_index_persisted(monkeypatch, tmp_path, toolkit_roots):
+    fpath = str(tmp_path / "toolkits.json")
+    expected = ToolkitIndex(fpath).toolkits()
+
+    probed = []
+
+    def probe_toolkit(nvcc: str) -> Toolkit:
+        probed.append(nvcc)
+        return Toolkit(nvcc=nvcc, version="0.0.0")
+
+    monkeypatch.setattr(toolkits, "probe_toolkit", probe_toolkit)
+    assert ToolkitIndex(fpath).toolkits() == expected
+    assert probed == []
+
+    # a changed nvcc executable rebuilds the index
+    nvcc_fpath = os.path.join(toolkit_roots[0], "bin", "nvcc")
+    os.utime(nvcc_fpath, (0, 0))
+    index = ToolkitIndex(fpath)
+    assert [t.version for t in index.toolkits()] == ["0.0.0"] * 3
+    assert len(probed) == 3
+    index.toolkits(refresh=True)
+    assert len(probed) == 6